@@ -0,0 +1,157 @@
+#!/usr/bin/env python3.6
+"""Wall time to encode a small set of clips locally versus through the farm.
+
+Generates synthetic test clips with FFmpeg's `testsrc`, then encodes them
+with `rprox queue --local`'s process pool. With --distributed the same clips
+are also queued to the broker and tracked to completion, which needs Redis
+and at least one running worker that can read --source-dir.
+
+The gap between the two on a single machine is the broker, result backend
+and worker overhead that local mode avoids.
+
+Usage:
+    python benchmarks/local_vs_distributed.py --clips 8 --seconds 10 --distributed
+"""
+
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+from rich import print
+from rich.table import Table
+
+from resolve_proxy_encoder.queuer import local, queue, scheduler
+from resolve_proxy_encoder.settings.manager import SettingsManager
+from resolve_proxy_encoder.worker import registry
+
+settings = SettingsManager()
+
+FPS = 25
+
+
+def make_clips(source_dir: str, count: int, seconds: int) -> list:
+    """Render synthetic ProRes test clips, returning their paths"""
+
+    paths = []
+
+    for i in range(count):
+
+        path = os.path.join(source_dir, f"testsrc_{i:03d}.mov")
+        paths.append(path)
+
+        if os.path.exists(path):
+            continue
+
+        subprocess.run(
+            [
+                "ffmpeg",
+                "-y",
+                "-v",
+                "error",
+                "-f",
+                "lavfi",
+                "-i",
+                f"testsrc=size=1920x1080:rate={FPS}:duration={seconds}",
+                "-c:v",
+                "prores_ks",
+                "-profile:v",
+                "2",
+                path,
+            ],
+            check=True,
+        )
+
+    return paths
+
+
+def get_jobs(paths: list, proxy_dir: str, seconds: int, profile: dict) -> list:
+    """Jobs as the queuer builds them, with their settings embedded"""
+
+    return [
+        {
+            "file_name": os.path.basename(x),
+            "file_path": x,
+            "frames": seconds * FPS,
+            "fps": float(FPS),
+            "duration": f"00:00:{seconds:02d}:00",
+            "resolution": ["1920", "1080"],
+            "h_flip": False,
+            "v_flip": False,
+            "proxy_dir": proxy_dir,
+            "start_tc": "00:00:00:00",
+            **profile,
+        }
+        for x in paths
+    ]
+
+
+def run_local(jobs: list, workers: int) -> tuple:
+    """Encode in the local process pool, returning wall seconds and failures"""
+
+    job_group = local.LocalJobGroup(
+        [queue.get_task_payload(x) for x in scheduler.order_longest_first(jobs)],
+        workers=workers,
+    )
+
+    start = time.perf_counter()
+    failed = [x for x in job_group.iter_completed() if x[1] != "SUCCESS"]
+    return time.perf_counter() - start, len(failed)
+
+
+def run_distributed(jobs: list) -> tuple:
+    """Queue to the farm and wait for every result, returning wall seconds and failures"""
+
+    start = time.perf_counter()
+
+    job_group = queue.queue_jobs(scheduler.schedule_jobs(jobs))
+    failed = [x for x in job_group.iter_completed() if x[1] != "SUCCESS"]
+
+    return time.perf_counter() - start, len(failed)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clips", type=int, default=8)
+    parser.add_argument("--seconds", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--source-dir", default=None, help="Defaults to a temp dir")
+    parser.add_argument(
+        "--distributed", action="store_true", help="Also run through the farm"
+    )
+    args = parser.parse_args()
+
+    source_dir = args.source_dir or tempfile.mkdtemp(prefix="rprox-benchmark-")
+    paths = make_clips(source_dir, args.clips, args.seconds)
+    profile = registry.get_profile(settings["proxy"], settings["paths"])
+
+    table = Table(title=f"{args.clips} clips x {args.seconds}s, 1080p ProRes source")
+    table.add_column("Mode")
+    table.add_column("Wall (s)", justify="right")
+    table.add_column("Clips/min", justify="right")
+    table.add_column("Failed", justify="right")
+
+    runs = [("local", lambda jobs: run_local(jobs, args.workers))]
+    if args.distributed:
+        runs.append(("distributed", run_distributed))
+
+    for name, run in runs:
+
+        # Fresh output dir per run, so nothing is skipped as already encoded
+        proxy_dir = tempfile.mkdtemp(prefix=f"rprox-{name}-", dir=source_dir)
+        seconds, failed = run(get_jobs(paths, proxy_dir, args.seconds, profile))
+
+        table.add_row(
+            name,
+            f"{seconds:.1f}",
+            f"{args.clips / seconds * 60:.1f}",
+            str(failed),
+        )
+
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
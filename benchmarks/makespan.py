@@ -0,0 +1,108 @@
+#!/usr/bin/env python3.6
+"""Simulated makespan of job ordering and short-lane routing.
+
+Compares submission in timeline (arbitrary) order against
+longest-processing-time-first, with and without a short-job lane,
+on a synthetic mix of mostly short B-roll and a few long interviews.
+
+Usage:
+    python benchmarks/makespan.py --jobs 300 --workers 8 --short-workers 2
+"""
+
+import argparse
+import random
+
+from rich import print
+from rich.table import Table
+
+from resolve_proxy_encoder.queuer import scheduler
+
+
+def synthetic_durations(jobs: int, seed: int) -> list:
+    """Encode times in seconds: lognormal B-roll plus a few long clips"""
+
+    rng = random.Random(seed)
+    durations = [rng.lognormvariate(3.0, 0.8) for _ in range(jobs)]
+
+    # A handful of 20-40 minute interviews
+    for i in rng.sample(range(jobs), max(1, jobs // 50)):
+        durations[i] = rng.uniform(1200, 2400)
+
+    return durations
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--short-workers", type=int, default=2)
+    parser.add_argument("--short-threshold", type=float, default=30)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    scenarios = {
+        "timeline order": dict(lpt=False, lane=False),
+        "longest first": dict(lpt=True, lane=False),
+        "longest first + short lane": dict(lpt=True, lane=True),
+    }
+
+    totals = {k: {"makespan": 0.0, "short_finish": 0.0} for k in scenarios}
+
+    for run in range(args.runs):
+
+        durations = synthetic_durations(args.jobs, seed=run)
+        is_short = [x < args.short_threshold for x in durations]
+
+        for name, scenario in scenarios.items():
+
+            order = list(range(len(durations)))
+            if scenario["lpt"]:
+                order.sort(key=lambda i: durations[i], reverse=True)
+
+            # Same total slots in every scenario
+            workers = args.workers
+            short_workers = 0
+            if scenario["lane"]:
+                workers -= args.short_workers
+                short_workers = args.short_workers
+
+            result = scheduler.simulate_makespan(
+                [durations[i] for i in order],
+                workers=workers,
+                short_threshold=args.short_threshold if scenario["lane"] else 0,
+                short_workers=short_workers,
+            )
+
+            short_finishes = [
+                finish for i, finish in zip(order, result["finishes"]) if is_short[i]
+            ]
+
+            totals[name]["makespan"] += result["makespan"]
+            totals[name]["short_finish"] += sum(short_finishes) / max(
+                1, len(short_finishes)
+            )
+
+    baseline = totals["timeline order"]["makespan"]
+
+    table = Table(
+        title=f"{args.jobs} jobs, {args.workers} worker slots, mean of {args.runs} runs"
+    )
+    table.add_column("Scenario")
+    table.add_column("Makespan (min)", justify="right")
+    table.add_column("vs timeline order", justify="right")
+    table.add_column("Mean short job finish (min)", justify="right")
+
+    for name, total in totals.items():
+        table.add_row(
+            name,
+            f"{total['makespan'] / args.runs / 60:.1f}",
+            f"{(total['makespan'] / baseline - 1) * 100:+.1f}%",
+            f"{total['short_finish'] / args.runs / 60:.1f}",
+        )
+
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
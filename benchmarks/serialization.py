@@ -0,0 +1,238 @@
+#!/usr/bin/env python3.6
+"""Broker and result backend footprint of task payloads and stored results.
+
+Compares the previous setup, full jobs with settings as JSON and extended
+results that keep every task's args, against slim jobs and trimmed results,
+as plain JSON and with compact serialization.
+
+Sizes are as stored in Redis. Kombu base64 encodes message bodies.
+Pass --redis to also measure Redis memory for the stored results.
+
+Usage:
+    python benchmarks/serialization.py --tasks 1000 --redis redis://localhost:6379/15
+"""
+
+import argparse
+import base64
+import time
+from datetime import datetime
+
+from celery import uuid
+from rich import print
+from rich.table import Table
+
+from resolve_proxy_encoder.settings.manager import SettingsManager
+from resolve_proxy_encoder.worker import registry, serialization
+
+settings = SettingsManager()
+
+
+def get_full_job(i: int) -> dict:
+    """A job as queued before the settings registry"""
+
+    return {
+        "file_name": f"A{i:03d}_C{i:03d}_220301_R1AB.mov",
+        "file_path": f"/Volumes/Footage/2022-03-01 Shoot/Camera A/A{i:03d}_C{i:03d}_220301_R1AB.mov",
+        "clip_name": f"A{i:03d}_C{i:03d}_220301_R1AB.mov",
+        "duration": "00:00:42:12",
+        "resolution": ["3840", "2160"],
+        "frames": 1062,
+        "fps": 25.0,
+        "h_flip": False,
+        "v_flip": False,
+        "proxy_status": "None",
+        "proxy_media_path": "",
+        "proxy_dir": "/Volumes/Proxies/2022-03-01 Shoot/Camera A",
+        "start": 0,
+        "end": 1061,
+        "start_tc": "14:02:11:03",
+        "end_tc": "14:02:53:15",
+        "media_pool_item": f"<PyRemoteObject object at 0x000002{i:06X}>",
+        "project": "Documentary",
+        "timeline": "Day 1 Selects",
+        "proxy_settings": dict(settings["proxy"]),
+        "paths_settings": dict(settings["paths"]),
+    }
+
+
+def get_slim_job(i: int) -> dict:
+    """The same job as queued now: worker fields and a settings hash"""
+
+    job = get_full_job(i)
+    profile = registry.get_profile(job.pop("proxy_settings"), job.pop("paths_settings"))
+
+    for key in [
+        "clip_name",
+        "duration",
+        "proxy_status",
+        "proxy_media_path",
+        "start",
+        "end",
+        "end_tc",
+        "media_pool_item",
+    ]:
+        job.pop(key)
+
+    job.update({"settings_hash": registry.get_settings_hash(profile)})
+    return job
+
+
+def get_body(job: dict) -> list:
+    """Celery protocol 2 message body"""
+
+    return [
+        [job],
+        {},
+        {"callbacks": None, "errbacks": None, "chain": None, "chord": None},
+    ]
+
+
+def get_extended_result(job: dict, task_id: str) -> dict:
+    """Result meta as stored with `result_extended`"""
+
+    return {
+        "status": "SUCCESS",
+        "result": f"{job['file_name']} encoded successfully",
+        "traceback": None,
+        "children": [],
+        "date_done": datetime.utcnow().isoformat(),
+        "task_id": task_id,
+        "name": "resolve_proxy_encoder.worker.tasks.encode.tasks.encode_proxy",
+        "args": [job],
+        "kwargs": {},
+        "worker": "celery@render-node-01",
+        "retries": 0,
+        "queue": "8d1c2f3",
+    }
+
+
+def get_trimmed_result(job: dict, task_id: str) -> dict:
+    """Result meta as stored now"""
+
+    return {
+        "status": "SUCCESS",
+        "result": {
+            "output_file": f"{job['proxy_dir']}/{job['file_name']}",
+            "frames": job["frames"],
+            "encode_seconds": 18.42,
+            "fps": 57.65,
+        },
+        "traceback": None,
+        "children": [],
+        "date_done": datetime.utcnow().isoformat(),
+        "task_id": task_id,
+    }
+
+
+def measure(objs: list, compact: bool, threshold: int) -> dict:
+    """Stored bytes, and microseconds to serialize and deserialize, per object"""
+
+    start = time.perf_counter()
+    encoded = [serialization.encode(x, compact, threshold) for x in objs]
+    dumps_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for x in encoded:
+        serialization.loads(x)
+    loads_time = time.perf_counter() - start
+
+    return {
+        "encoded": encoded,
+        "bytes": sum(len(x) for x in encoded) / len(objs),
+        "dumps_us": dumps_time / len(objs) * 1e6,
+        "loads_us": loads_time / len(objs) * 1e6,
+    }
+
+
+def redis_usage(client, encoded: list) -> float:
+    """Mean bytes of Redis memory per stored result"""
+
+    keys = [f"rprox:benchmark:{uuid()}" for _ in encoded]
+
+    with client.pipeline() as pipe:
+        for key, value in zip(keys, encoded):
+            pipe.set(key, value)
+        pipe.execute()
+
+    with client.pipeline() as pipe:
+        for key in keys:
+            pipe.memory_usage(key)
+        usage = pipe.execute()
+
+    client.delete(*keys)
+    return sum(usage) / len(usage)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=1000)
+    parser.add_argument("--threshold", type=int, default=1024)
+    parser.add_argument("--redis", default=None, help="Redis URL to measure memory")
+    args = parser.parse_args()
+
+    client = None
+    if args.redis:
+        import redis
+
+        client = redis.Redis.from_url(args.redis)
+
+    task_ids = [uuid() for _ in range(args.tasks)]
+    full_jobs = [get_full_job(i) for i in range(args.tasks)]
+    slim_jobs = [get_slim_job(i) for i in range(args.tasks)]
+
+    scenarios = [
+        (
+            "before: full job, JSON",
+            [get_body(x) for x in full_jobs],
+            [get_extended_result(x, t) for x, t in zip(full_jobs, task_ids)],
+            False,
+        ),
+        (
+            "slim job, trimmed result, JSON",
+            [get_body(x) for x in slim_jobs],
+            [get_trimmed_result(x, t) for x, t in zip(slim_jobs, task_ids)],
+            False,
+        ),
+        (
+            "slim job, trimmed result, compact",
+            [get_body(x) for x in slim_jobs],
+            [get_trimmed_result(x, t) for x, t in zip(slim_jobs, task_ids)],
+            True,
+        ),
+    ]
+
+    table = Table(
+        title=f"{args.tasks} tasks, "
+        f"{'msgpack' if serialization.msgpack else 'JSON'} compact format"
+    )
+    table.add_column("Scenario")
+    table.add_column("Message (B)", justify="right")
+    table.add_column("Result (B)", justify="right")
+    table.add_column("Dumps + loads (µs)", justify="right")
+    if client:
+        table.add_column("Redis per result (B)", justify="right")
+
+    for name, bodies, results, compact in scenarios:
+
+        body = measure(bodies, compact, args.threshold)
+        result = measure(results, compact, args.threshold)
+
+        message_bytes = sum(len(base64.b64encode(x)) for x in body["encoded"])
+        row = [
+            name,
+            f"{message_bytes / args.tasks:.0f}",
+            f"{result['bytes']:.0f}",
+            f"{sum(x[k] for x in [body, result] for k in ['dumps_us', 'loads_us']):.1f}",
+        ]
+
+        if client:
+            row.append(f"{redis_usage(client, result['encoded']):.0f}")
+
+        table.add_row(*row)
+
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
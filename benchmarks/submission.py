@@ -0,0 +1,161 @@
+#!/usr/bin/env python3.6
+"""Submit latency and result-tracking overhead of very large job groups.
+
+Compares sending every job in one Celery group, tracked with `GroupResult`,
+against chunked submission tracked with a `JobGroupHandle`.
+Jobs go to a throwaway queue that no worker consumes and is purged afterwards.
+Results are then stored directly to the backend so tracking is timed without workers.
+
+Needs the broker and result backend in your user settings pointed at a local Redis.
+
+Usage:
+    python benchmarks/submission.py --sizes 1000 10000 50000
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from celery import group, uuid
+from celery.result import GroupResult
+from rich import print
+from rich.table import Table
+
+from resolve_proxy_encoder.queuer import queue, tracking
+from resolve_proxy_encoder.worker import locks
+from resolve_proxy_encoder.worker.celery import app
+from resolve_proxy_encoder.worker.tasks.encode.tasks import encode_proxy
+
+BENCHMARK_QUEUE = "rprox-benchmark"
+
+
+def synthetic_jobs(count: int) -> list:
+    """Minimal slim jobs, each with a unique source so none are deduplicated"""
+
+    return [
+        {
+            "file_name": f"clip_{i:06d}.mov",
+            "file_path": f"/benchmark/{uuid()}/clip_{i:06d}.mov",
+            "frames": 250,
+            "fps": 25.0,
+            "proxy_dir": "/benchmark/proxies",
+            "start_tc": "00:00:00:00",
+            "settings_hash": "benchmark",
+            "queue": BENCHMARK_QUEUE,
+        }
+        for i in range(count)
+    ]
+
+
+def store_results(task_ids: list):
+    """Mark tasks finished, as a worker would"""
+
+    for task_id in task_ids:
+        app.backend.store_result(task_id, "benchmark", "SUCCESS")
+
+
+def clean_up(jobs: list, task_ids: list):
+    """Purge the benchmark queue, stored results and idempotency keys"""
+
+    with app.connection_for_write() as conn:
+        conn.default_channel.queue_purge(BENCHMARK_QUEUE)
+
+    client = app.backend.client
+    keys = [app.backend.get_key_for_task(x) for x in task_ids]
+    keys += [locks.get_idempotency_key(x) for x in jobs]
+
+    for i in range(0, len(keys), 10000):
+        client.delete(*keys[i : i + 10000])
+
+
+def measure(func):
+    """Seconds and peak MiB allocated while running func"""
+
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    result = func()
+
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+
+    return result, elapsed, peak
+
+
+def run_group(jobs: list) -> dict:
+    """Previous approach: one group of every task, applied in one call"""
+
+    def submit():
+        return group(
+            encode_proxy.s(queue.get_task_payload(x)).set(queue=BENCHMARK_QUEUE)
+            for x in jobs
+        ).apply_async()
+
+    result, submit_time, submit_mem = measure(submit)
+    task_ids = [x.id for x in result.results]
+    store_results(task_ids)
+
+    def track():
+        tracked = GroupResult(result.id, [app.AsyncResult(x) for x in task_ids])
+        return sum(1 for _ in tracked.iter_native(no_ack=False))
+
+    _, track_time, track_mem = measure(track)
+    clean_up(jobs, task_ids)
+
+    return dict(
+        submit=submit_time, submit_mem=submit_mem, track=track_time, track_mem=track_mem
+    )
+
+
+def run_chunked(jobs: list) -> dict:
+    """Chunked submission tracked by a lightweight handle"""
+
+    handle, submit_time, submit_mem = measure(lambda: queue.queue_jobs(jobs))
+    store_results(handle.task_ids)
+
+    def track():
+        tracked = tracking.JobGroupHandle(handle.id, handle.task_ids)
+        return sum(1 for _ in tracked.iter_completed())
+
+    _, track_time, track_mem = measure(track)
+    clean_up(jobs, handle.task_ids)
+
+    return dict(
+        submit=submit_time, submit_mem=submit_mem, track=track_time, track_mem=track_mem
+    )
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    table = Table(title="Job group submission and tracking")
+    table.add_column("Tasks", justify="right")
+    table.add_column("Approach")
+    table.add_column("Submit (s)", justify="right")
+    table.add_column("Submit peak (MiB)", justify="right")
+    table.add_column("Track (s)", justify="right")
+    table.add_column("Track peak (MiB)", justify="right")
+
+    for size in args.sizes:
+
+        for name, run in [("single group", run_group), ("chunked", run_chunked)]:
+
+            result = run(synthetic_jobs(size))
+            table.add_row(
+                str(size),
+                name,
+                f"{result['submit']:.2f}",
+                f"{result['submit_mem']:.1f}",
+                f"{result['track']:.2f}",
+                f"{result['track_mem']:.1f}",
+            )
+
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
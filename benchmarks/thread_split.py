@@ -0,0 +1,146 @@
+#!/usr/bin/env python3.6
+"""Throughput of concurrent encodes for different workers x threads splits.
+
+Encodes the same synthetic clips with N concurrent FFmpeg processes, each
+held to its share of the machine's cores as workers started by 'rprox work'
+are, and optionally pinned to its own CPUs. The last row is the old default:
+two fewer workers than cores, every FFmpeg threading across every core.
+
+Usage:
+    python benchmarks/thread_split.py --clips 16 --seconds 10 --pin
+"""
+
+import argparse
+import os
+import queue
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rich import print
+from rich.table import Table
+
+from local_vs_distributed import get_jobs, make_clips
+from resolve_proxy_encoder.settings.manager import SettingsManager
+from resolve_proxy_encoder.worker import affinity, registry
+from resolve_proxy_encoder.worker.tasks.encode.tasks import (
+    get_ffmpeg_command,
+    get_output_file,
+)
+
+settings = SettingsManager()
+
+
+def get_splits(cores: int) -> list:
+    """Workers to try, doubling up to the core count, as (workers, budgeted)"""
+
+    splits = []
+    workers = 1
+
+    while workers <= cores:
+        splits.append((workers, True))
+        workers *= 2
+
+    splits.append((max(1, cores - 2), False))
+    return splits
+
+
+def run_split(jobs: list, workers: int, budgeted: bool, pin: bool) -> tuple:
+    """Encode every job, `workers` at a time, returning wall seconds and failures"""
+
+    # Each benchmark worker runs one encode at a time
+    settings["worker"]["ffmpeg_threads"] = 0
+    settings["worker"]["concurrency"] = 1
+    settings["worker"]["pin_cpus"] = pin
+
+    # Unbudgeted encodes each think they have the machine to themselves
+    os.environ[affinity.HOST_WORKERS_ENV] = str(workers if budgeted else 1)
+
+    slots = queue.Queue()
+    for i in range(workers):
+        slots.put(i)
+
+    def encode(job):
+
+        slot = slots.get()
+
+        try:
+            command = get_ffmpeg_command(job, get_output_file(job))
+            command[1:1] = ["-loglevel", "error"]
+
+            return subprocess.run(
+                command,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                preexec_fn=affinity.get_preexec_fn(slot, workers if budgeted else None),
+            ).returncode
+
+        finally:
+            slots.put(slot)
+
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        failed = [x for x in pool.map(encode, jobs) if x != 0]
+
+    return time.perf_counter() - start, len(failed)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clips", type=int, default=16)
+    parser.add_argument("--seconds", type=int, default=10)
+    parser.add_argument("--source-dir", default=None, help="Defaults to a temp dir")
+    parser.add_argument(
+        "--pin", action="store_true", help="Also run each split pinned to CPUs"
+    )
+    args = parser.parse_args()
+
+    source_dir = args.source_dir or tempfile.mkdtemp(prefix="rprox-benchmark-")
+    paths = make_clips(source_dir, args.clips, args.seconds)
+    profile = registry.get_profile(settings["proxy"], settings["paths"])
+
+    cores = len(affinity.get_available_cpus())
+    nodes = len(affinity.get_numa_nodes())
+
+    table = Table(
+        title=f"{args.clips} clips x {args.seconds}s, "
+        f"{cores} CPUs on {nodes} NUMA node{'s' if nodes > 1 else ''}"
+    )
+    table.add_column("Workers", justify="right")
+    table.add_column("Threads", justify="right")
+    table.add_column("Pinned")
+    table.add_column("Wall (s)", justify="right")
+    table.add_column("Clips/min", justify="right")
+    table.add_column("Failed", justify="right")
+
+    for workers, budgeted in get_splits(cores):
+
+        for pin in [False, True] if args.pin and budgeted else [False]:
+
+            # Fresh output dir per run, so nothing is skipped as already encoded
+            proxy_dir = tempfile.mkdtemp(prefix=f"rprox-{workers}w-", dir=source_dir)
+            jobs = get_jobs(paths, proxy_dir, args.seconds, profile)
+
+            seconds, failed = run_split(jobs, workers, budgeted, pin)
+
+            threads = affinity.get_thread_count(
+                slot=0, workers=workers if budgeted else 1
+            )
+
+            table.add_row(
+                str(workers),
+                str(threads),
+                "yes" if pin else "no",
+                f"{seconds:.1f}",
+                f"{args.clips / seconds * 60:.1f}",
+                str(failed),
+            )
+
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
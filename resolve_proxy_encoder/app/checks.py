@@ -12,6 +12,7 @@ from .utils import pkg_info
 from ..app.utils import core
 from ..settings.manager import SettingsManager
 from ..worker.celery import app as celery_app
+from ..worker.utils import get_version_constraint_key
 
 settings = SettingsManager()
 
@@ -165,7 +166,8 @@ def check_worker_compatibility():
     compatible_workers = []
     for worker, attributes in online_workers.items():
 
-        worker_vc_key = attributes[0]["routing_key"]
+        # Lane queues share the worker's version constraint key
+        worker_vc_key = get_version_constraint_key(attributes[0]["routing_key"])
 
         worker_dict = {
             "name": worker,
@@ -92,12 +92,50 @@ def cli_init():
 
 
 @cli_app.command()
-def queue():
+def queue(
+    link_at_end: bool = typer.Option(
+        False,
+        "--link-at-end",
+        help="Wait for every encode to finish before linking any proxies",
+    ),
+    priority: Optional[str] = typer.Option(
+        None,
+        help="'urgent', 'high', 'normal' or 'low'. Workers take the most urgent jobs first",
+    ),
+    deadline: Optional[str] = typer.Option(
+        None,
+        help="When the proxies are needed by, e.g. '2h', '17:30' or '2022-03-01 09:00'. "
+        "Jobs escalate in priority as it approaches",
+    ),
+    local: bool = typer.Option(
+        False,
+        "--local",
+        help="Encode on this machine without a broker or workers",
+    ),
+    dry_run: bool = typer.Option(
+        False,
+        "--dry-run",
+        help="Predict how long each job and the whole timeline will take, without queuing",
+    ),
+):
     """
     Queue proxies from the currently open
     DaVinci Resolve timeline
     """
 
+    from ..worker.priority import PRIORITIES, parse_deadline
+
+    if priority and priority not in PRIORITIES:
+        raise typer.BadParameter(
+            f"Choose one of {', '.join(PRIORITIES)}", param_hint="--priority"
+        )
+
+    if deadline:
+        try:
+            deadline = parse_deadline(deadline)
+        except ValueError as e:
+            raise typer.BadParameter(str(e), param_hint="--deadline")
+
     # Init
     from ..app import checks
     from ..settings.manager import SettingsManager
@@ -110,7 +148,8 @@ def queue():
     logger.setLevel(settings["app"]["loglevel"])
     # End init
 
-    checks.check_worker_compatibility()
+    if not local and not dry_run:
+        checks.check_worker_compatibility()
 
     print("\n")
     console.rule(
@@ -121,7 +160,121 @@ def queue():
 
     from ..queuer import queue
 
-    queue.main()
+    queue.main(
+        progressive_link=not link_at_end,
+        priority_name=priority,
+        deadline=deadline,
+        local_mode=local,
+        dry_run=dry_run,
+    )
+
+
+def _init_queuer(check_workers: bool = True):
+    """Set up logging and check workers before talking to Resolve and Celery"""
+
+    from ..app import checks
+    from ..settings.manager import SettingsManager
+    from .utils.core import setup_rich_logging
+
+    settings = SettingsManager()
+
+    setup_rich_logging()
+    logger = logging.getLogger(__name__)
+    logger.setLevel(settings["app"]["loglevel"])
+
+    if check_workers:
+        checks.check_worker_compatibility()
+
+
+group_id_argument = typer.Argument(
+    None, help="Job group id (or its first few characters). Defaults to the newest."
+)
+
+
+@cli_app.command()
+def reattach(
+    group_id: Optional[str] = group_id_argument,
+    link_at_end: bool = typer.Option(
+        False,
+        "--link-at-end",
+        help="Wait for every encode to finish before linking any proxies",
+    ),
+):
+    """
+    Wait on and link a job group queued
+    from a previously closed queuer
+    """
+
+    _init_queuer()
+
+    print("\n")
+    console.rule(f"[green bold]Reattach to queued jobs[/] :hourglass:", align="left")
+    print("\n")
+
+    from ..queuer import queue
+
+    queue.reattach(group_id, progressive_link=not link_at_end)
+
+
+@cli_app.command()
+def relink(group_id: Optional[str] = group_id_argument):
+    """
+    Link finished proxies of a previously
+    queued job group
+    """
+
+    _init_queuer(check_workers=False)
+
+    print("\n")
+    console.rule(f"[green bold]Relink queued jobs[/] :link:", align="left")
+    print("\n")
+
+    from ..queuer import queue
+
+    queue.relink(group_id)
+
+
+@cli_app.command()
+def retry(
+    group_id: Optional[str] = group_id_argument,
+    link_at_end: bool = typer.Option(
+        False,
+        "--link-at-end",
+        help="Wait for every encode to finish before linking any proxies",
+    ),
+):
+    """
+    Resubmit only the failed tasks of a
+    previously queued job group
+    """
+
+    _init_queuer()
+
+    print("\n")
+    console.rule(f"[green bold]Retry failed jobs[/] :repeat:", align="left")
+    print("\n")
+
+    from ..queuer import queue
+
+    queue.retry(group_id, progressive_link=not link_at_end)
+
+
+@cli_app.command()
+def cancel(group_id: Optional[str] = group_id_argument):
+    """
+    Cancel the unfinished encodes of a
+    queued job group, on every worker
+    """
+
+    _init_queuer(check_workers=False)
+
+    print("\n")
+    console.rule(f"[red bold]Cancel queued jobs[/] :stop_sign:", align="left")
+    print("\n")
+
+    from ..queuer import queue
+
+    queue.cancel_group(group_id)
 
 
 @cli_app.command()
@@ -182,6 +335,86 @@ def work(
     launch_workers.main(workers_to_launch)
 
 
+@cli_app.command()
+def io(
+    reset: bool = typer.Option(
+        False, "--reset", help="Clear the stats, to measure again after changing limits"
+    ),
+    publish: bool = typer.Option(
+        False,
+        "--publish",
+        help="Make this machine's read and write slot limits the whole farm's",
+    ),
+    unpublish: bool = typer.Option(
+        False,
+        "--unpublish",
+        help="Drop the published limits, so each worker uses its own again",
+    ),
+):
+    """
+    Show how long encodes wait for storage
+    read and write slots, to tune limits
+    """
+
+    _init_queuer(check_workers=False)
+
+    print("\n")
+    console.rule(f"[green bold]Storage slot waits[/] :hourglass:", align="left")
+    print("\n")
+
+    from rich.table import Table
+
+    from ..worker import iolimits
+
+    if reset:
+        iolimits.reset_stats()
+        print("[green]Cleared storage slot stats[/]")
+        return
+
+    if publish:
+
+        if not iolimits.publish_limits():
+            print(
+                "[yellow]No read or write slot limits set here. Nothing published.[/]"
+            )
+            return
+
+        print("[green]Published storage slot limits for every worker[/]")
+        return
+
+    if unpublish:
+        iolimits.unpublish_limits()
+        print("[green]Workers will use their own storage slot limits again[/]")
+        return
+
+    stats = iolimits.get_stats()
+    if not stats:
+        print("[yellow]No limited storage has been used yet.[/]")
+        return
+
+    table = Table()
+    table.add_column("Target")
+    table.add_column("Mode")
+    table.add_column("In use", justify="right")
+    table.add_column("Encodes", justify="right")
+    table.add_column("Waited", justify="right")
+    table.add_column("Mean wait (s)", justify="right")
+    table.add_column("Max wait (s)", justify="right")
+
+    for x in stats:
+        table.add_row(
+            x["target"],
+            x["mode"],
+            f"{x['in_use']}/{x['slots'] if x['slots'] else '?'}",
+            str(x["acquired"]),
+            str(x["waited"]),
+            f"{x['mean_wait_seconds']:.1f}",
+            f"{x['max_wait_seconds']:.1f}",
+        )
+
+    print(table)
+
+
 @cli_app.command()
 def purge():
     """Purge all tasks from Celery.
@@ -208,6 +441,10 @@ def purge():
         print("[green]Purging all worker queues[/] :fire:")
         subprocess.run(["celery", "-A", "resolve_proxy_encoder.worker", "purge", "-f"])
 
+        from ..queuer import queue
+
+        queue.release_purged()
+
 
 @cli_app.command()
 def mon():
@@ -1,7 +1,6 @@
 import glob
 import logging
 import os
-import pathlib
 import shutil
 from typing import Union
 
@@ -10,8 +9,10 @@ from rich.prompt import Confirm, Prompt
 
 from ..app.utils import core
 from ..settings.manager import SettingsManager
+from ..worker import proxycache, scratch
 from ..worker.celery import app
-from . import link
+from ..worker.tasks.encode.tasks import get_output_file
+from . import link, placement
 
 settings = SettingsManager()
 core.install_rich_tracebacks()
@@ -120,18 +121,20 @@ def handle_orphaned_proxies(media_list: list) -> list:
             linked_proxy_path[1].lower()
 
             file_path = media["file_path"]
-            p = pathlib.Path(file_path)
+
+            # Proxies are where they belong on any proxy root
+            expected_paths = [
+                os.path.splitext(os.path.join(x, os.path.basename(file_path)))[0]
+                for x in placement.get_candidate_dirs(file_path)
+            ]
 
             # Append the source media relative path onto the proxy media path
-            output_dir = os.path.join(
-                settings["paths"]["proxy_path_root"],
-                os.path.dirname(p.relative_to(*p.parts[:1])),
-            )
+            output_dir = media.get("proxy_dir") or placement.place(file_path)
             new_output_path = os.path.join(output_dir, os.path.basename(file_path))
             new_output_path = os.path.splitext(new_output_path)
             new_output_path[1].lower()
 
-            if linked_proxy_path[0] != new_output_path[0]:
+            if os.path.normpath(linked_proxy_path[0]) not in expected_paths:
 
                 # Rejoin extensions
                 linked_proxy_path = "".join(linked_proxy_path)
@@ -221,21 +224,27 @@ def handle_existing_unlinked(
 
     logger.info(f"[cyan]Checking for existing, unlinked media.")
 
-    def get_newest_proxy_file(media, expected_proxy_path: str) -> Union[str, None]:
+    def get_newest_proxy_file(media, expected_proxy_paths: list) -> Union[str, None]:
         """Get the last modified proxy file if multiple variants of same filename exist.
 
         Args:
-            proxy_dir(str): The path all proxies for comparison are located.
+            expected_proxy_paths(list): Extensionless proxy paths to match, one per proxy root.
 
         Returns:
             final_proxy_path(str): The file path to the matching proxy file that was last modified.
 
         """
 
-        expected_filename = os.path.basename(expected_proxy_path)
+        expected_filename = os.path.basename(expected_proxy_paths[0])
 
-        # Fetch paths of all possible variants of source filename
-        matching_proxy_files = glob.glob(expected_proxy_path + "*.*")
+        # Fetch paths of all possible variants of source filename, on every root.
+        # Skip any a worker is still publishing.
+        matching_proxy_files = [
+            x
+            for path in expected_proxy_paths
+            for x in glob.glob(path + "*.*")
+            if not x.endswith(scratch.TEMP_SUFFIX)
+        ]
 
         if not len(matching_proxy_files):
             logger.debug(
@@ -277,18 +286,20 @@ def handle_existing_unlinked(
 
         if media["proxy_status"] in unlinked_types:
 
-            proxy_dir = media["proxy_dir"]
-            logger.debug(f"[magenta]Expected proxy directory:[/] '{proxy_dir}'")
-
-            # Get expected proxy path
-            glob_partial_match = os.path.join(proxy_dir, media["file_name"])
+            proxy_dirs = placement.get_candidate_dirs(
+                media["file_path"], media["proxy_dir"]
+            )
+            logger.debug(f"[magenta]Expected proxy directories:[/] {proxy_dirs}")
 
-            # Get expected path partial match for globbing
-            glob_partial_match = os.path.splitext(glob_partial_match)[0]
-            logger.debug(f"[magenta]Glob match criteria:[/] '{glob_partial_match}'")
+            # Get expected path partial matches for globbing, on every proxy root
+            glob_partial_matches = [
+                os.path.splitext(os.path.join(x, media["file_name"]))[0]
+                for x in proxy_dirs
+            ]
+            logger.debug(f"[magenta]Glob match criteria:[/] {glob_partial_matches}")
 
             # Check for any file variants, including multiple extensions and suffixes
-            existing_proxy_file = get_newest_proxy_file(media, glob_partial_match)
+            existing_proxy_file = get_newest_proxy_file(media, glob_partial_matches)
 
             if existing_proxy_file:
 
@@ -336,6 +347,59 @@ def handle_existing_unlinked(
     return media_list
 
 
+def handle_cached_proxies(
+    media_list: list, unlinked_types: list = ["Offline", "None"]
+) -> list:
+    """Link proxies reused from identical sources instead of encoding them again.
+
+    The same camera cards get imported into many projects and paths. If a source's
+    content matches one already encoded with the same settings, its proxy is hard linked,
+    reflinked or copied into the expected location and linked straight away.
+
+    Args:
+        media_list: list of dictionary media items to check the proxy cache for.
+
+    Returns:
+        media_list: refined list of dictionary media items that still need encoding.
+    """
+
+    if not proxycache.is_enabled(settings["paths"]):
+        return media_list
+
+    logger.info(f"[cyan]Checking for proxies of identical sources.[/]")
+
+    reused = []
+
+    for media in media_list:
+
+        if media["proxy_status"] not in unlinked_types:
+            continue
+
+        job = dict(media, proxy_settings=settings["proxy"])
+        output_file = get_output_file(job)
+
+        if proxycache.reuse(job, output_file):
+            media.update({"proxy_media_path": output_file})
+            reused.append(media)
+
+    if len(reused) > 0:
+
+        global SOME_ACTION_TAKEN
+        SOME_ACTION_TAKEN = True
+
+        logger.info(f"[green]Reused {len(reused)} proxies of identical sources[/]")
+
+        media_list = [x for x in media_list if x not in reused]
+        remaining = link.link_proxies_with_mpi(
+            reused,
+            linkable_types=["Offline", "None"],
+            prompt_rerender=True,
+        )
+        media_list.extend(remaining)
+
+    return media_list
+
+
 def handle_offline_proxies(media_list: list) -> list:
     """Prompt to rerender proxies that are 'linked' but their media does not exist.
 
@@ -387,11 +451,12 @@ def handle_offline_proxies(media_list: list) -> list:
     return media_list
 
 
-def handle_final_queuable(jobs: list):
+def handle_final_queuable(jobs: list, estimate: Union[str, None] = None):
     """Final prompt to confirm number queueable or warn if none.
 
     Args:
         media_list: list of dictionary media items to check length for.
+        estimate: optional predicted time to finish, shown in the prompt.
 
     Returns:
         None: No need to chain anything here.
@@ -417,9 +482,11 @@ def handle_final_queuable(jobs: list):
         core.app_exit(0, -1)
 
     # Final Prompt confirm
-    if not Confirm.ask(
-        f"[bold][green]Go time![/bold] {len(jobs)} to queue. Sound good?[/]"
-    ):
+    to_queue = (
+        f"{len(jobs)} to queue, {estimate}" if estimate else f"{len(jobs)} to queue"
+    )
+
+    if not Confirm.ask(f"[bold][green]Go time![/bold] {to_queue}. Sound good?[/]"):
         core.app_exit(0)
 
     return
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3.6
+# Local record of finished encodes, to estimate new ones from
+
+import json
+import logging
+import os
+import time
+
+from ..app.utils import core
+from ..settings.manager import USER_SETTINGS_FILE, SettingsManager
+
+settings = SettingsManager()
+
+core.install_rich_tracebacks()
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["app"]["loglevel"])
+
+HISTORY_FILE = os.path.join(os.path.dirname(USER_SETTINGS_FILE), "encode_history.jsonl")
+
+# Most recent encodes kept. Older ones describe a farm that's since changed.
+HISTORY_LIMIT = 5000
+
+
+def record(job: dict, result: dict):
+    """Append a finished encode to the history
+
+    Args:
+        job: the job as queued, with its source metadata
+        result: the encode's stored result, from `get_encode_result`
+    """
+
+    if not isinstance(result, dict) or not result.get("encode_seconds"):
+        return
+
+    entry = {
+        "codec": job.get("codec"),
+        "resolution": job.get("resolution"),
+        "frames": int(job["frames"]),
+        "fps": job.get("fps"),
+        "worker": result.get("worker"),
+        "encode_seconds": result["encode_seconds"],
+        "finished_at": time.time(),
+    }
+
+    try:
+        os.makedirs(os.path.dirname(HISTORY_FILE), exist_ok=True)
+        with open(HISTORY_FILE, "a") as file:
+            file.write(json.dumps(entry) + "\n")
+
+    except OSError as e:
+        logger.warning(f"[yellow]Couldn't record encode history[/]\n{e}")
+
+
+def load() -> list:
+    """Load the most recent encodes, oldest first.
+
+    Trims the file back to `HISTORY_LIMIT` entries once it's
+    grown well past it, so it never needs reading in full for long.
+    """
+
+    try:
+        with open(HISTORY_FILE) as file:
+            lines = file.readlines()
+
+    except OSError:
+        return []
+
+    entries = []
+    for line in lines[-HISTORY_LIMIT:]:
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            continue
+
+    if len(lines) > HISTORY_LIMIT * 2:
+
+        try:
+            with open(HISTORY_FILE, "w") as file:
+                file.writelines(lines[-HISTORY_LIMIT:])
+        except OSError:
+            pass
+
+    return entries
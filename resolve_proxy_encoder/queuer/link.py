@@ -224,6 +224,44 @@ def find_and_link_proxies(project, proxy_files) -> Tuple[list, list]:
     return linked, failed
 
 
+def link_proxy_with_mpi(job) -> bool:
+    """Link a single finished proxy to its media pool item.
+
+    Args:
+        job (dict): job with a restored `media_pool_item` and its `proxy_media_path`
+
+    Returns:
+        bool: True if Resolve reports the proxy linked, False otherwise
+    """
+
+    logger.info(f"[cyan]:link: '{job['file_name']}'")
+
+    # Actually link proxies
+    try:
+
+        linked = job["media_pool_item"].LinkProxyMedia(job["proxy_media_path"])
+
+    except TypeError:
+        # MPI will be 'NoneType' if project change
+        linked = False
+
+    if not linked:
+
+        logger.error(f"[red bold]:x: Failed to link {job['file_name']}'\n")
+        return False
+
+    # TODO: Should probably use MediaInfo here instead of hardcode
+
+    # We only define the vertical res in `user_settings` so we can preserve aspect ratio.
+    # To get the proper resolution, we'd have to get the original file resolution.
+    # labels: enhancement
+
+    job.update({"proxy_status": "1280x720"})
+
+    logger.info(f"[green bold]:heavy_check_mark: Linked\n")
+    return True
+
+
 def link_proxies_with_mpi(
     jobs,
     linkable_types: list = ["Offline", "None"],
@@ -257,28 +295,9 @@ def link_proxies_with_mpi(
         if job["proxy_status"] not in linkable_types:
             continue
 
-        # TODO: Should probably use MediaInfo here instead of hardcode
-
-        # We only define the vertical res in `user_settings` so we can preserve aspect ratio.
-        # To get the proper resolution, we'd have to get the original file resolution.
-        # labels: enhancement
-
-        job.update({"proxy_status": "1280x720"})
-
-        logger.info(f"[cyan]:link: '{job['file_name']}'")
-
-        # Actually link proxies
-        try:
-
-            linked = job["media_pool_item"].LinkProxyMedia(job["proxy_media_path"])
-            assert linked
-
-            logger.info(f"[green bold]:heavy_check_mark: Linked\n")
+        if link_proxy_with_mpi(job):
             link_success.append(job)
-
-        except TypeError:
-            # MPI will be 'NoneType' if project change
-            logger.error(f"[red bold]:x: Failed to link {job['file_name']}'\n")
+        else:
             link_fail.append(job)
 
     if link_success:
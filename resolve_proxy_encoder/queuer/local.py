@@ -0,0 +1,178 @@
+#!/usr/bin/env python3.6
+# Encode on this machine without a broker, result backend or workers
+
+import logging
+import multiprocessing
+import os
+import platform
+import queue
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from celery import uuid
+
+from ..app.utils import core
+from ..settings.manager import SettingsManager
+from ..worker import affinity
+
+settings = SettingsManager()
+
+core.install_rich_tracebacks()
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["app"]["loglevel"])
+
+# Same custom state workers publish, so progress views can't tell the difference
+ENCODING_STATE = "ENCODING"
+
+
+def get_local_worker_count() -> int:
+    """Get how many encodes to run at once on this machine.
+
+    FFmpeg threads each encode, so half the logical cores
+    keeps the machine busy without oversubscribing it.
+    """
+
+    configured = settings["worker"]["local_workers"]
+    if configured:
+        return configured
+
+    return max(1, (os.cpu_count() or 2) // 2)
+
+
+def _init_process(workers: int, slots):
+    """Keep pool processes from drawing over the queuer's progress view.
+
+    Each also takes its share of the machine's cores, like a worker from 'rprox work'.
+    """
+
+    sys.stdout = open(os.devnull, "w")
+    sys.stderr = open(os.devnull, "w")
+
+    os.environ.update(
+        {
+            affinity.HOST_WORKERS_ENV: str(workers),
+            affinity.WORKER_SLOT_ENV: str(slots.get()),
+        }
+    )
+
+    # Each pool process encodes one job at a time, whatever workers are set to
+    settings["worker"]["concurrency"] = 1
+
+
+def encode_local(job: dict, task_id: str, progress_queue) -> dict:
+    """Encode a job in a pool process, sending progress back over `progress_queue`"""
+
+    from ..worker.tasks.encode.tasks import encode_job, get_progress_callback
+
+    def publish(meta):
+        progress_queue.put(
+            {"task_id": task_id, "status": ENCODING_STATE, "result": meta}
+        )
+
+    return encode_job(
+        job,
+        progress_callback=get_progress_callback(
+            publish, job["frames"], f"local-{os.getpid()}"
+        ),
+        worker=f"local@{platform.node()}",
+    )
+
+
+class LocalJobGroup:
+    """Encode jobs in a local process pool, tracked like a `JobGroupHandle`.
+
+    Runs the same encode as workers, with the same progress messages and
+    results, so waiting, progress and linking work unchanged.
+    Nothing outlives the queuer, so the group can't be reattached to.
+
+    Args:
+        jobs: job payloads with their settings embedded, in submission order
+        workers: processes to encode with. Sized to the machine if None.
+    """
+
+    reattachable = False
+
+    def __init__(self, jobs: list, workers: int = None):
+
+        self.id = uuid()
+        self.jobs = list(jobs)
+        self.task_ids = [uuid() for _ in self.jobs]
+        self.workers = workers if workers else get_local_worker_count()
+
+    def __len__(self):
+        return len(self.task_ids)
+
+    def __repr__(self):
+        return f"<LocalJobGroup: {self.id} [{len(self.task_ids)} jobs]>"
+
+    def iter_completed(self, on_message=None, on_interval=None, timeout=0.5):
+        """Encode every job, yielding each result as soon as it finishes.
+
+        Args:
+            on_message: optional callable, called with every progress message
+            on_interval: optional callable, called between checks for finished jobs
+            timeout: seconds to wait for a job to finish before calling `on_interval`
+
+        Yields:
+            (task_id, status, result) - result is the exception instance if the job failed
+        """
+
+        logger.info(
+            f"[cyan]Encoding {len(self.jobs)} jobs, {self.workers} at a time[/]"
+        )
+
+        with multiprocessing.Manager() as manager:
+
+            progress_queue = manager.Queue()
+
+            slots = manager.Queue()
+            for i in range(self.workers):
+                slots.put(i)
+
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_process,
+                initargs=(self.workers, slots),
+            ) as pool:
+
+                futures = {
+                    pool.submit(encode_local, job, task_id, progress_queue): task_id
+                    for job, task_id in zip(self.jobs, self.task_ids)
+                }
+                pending = set(futures)
+
+                try:
+
+                    while pending:
+
+                        done, pending = wait(
+                            pending, timeout=timeout, return_when=FIRST_COMPLETED
+                        )
+
+                        while True:
+                            try:
+                                message = progress_queue.get_nowait()
+                            except queue.Empty:
+                                break
+                            if on_message:
+                                on_message(message)
+
+                        for future in done:
+
+                            try:
+                                status, result = "SUCCESS", future.result()
+
+                            # FFmpeg failures can exit the pool process
+                            except (Exception, SystemExit) as e:
+                                status, result = "FAILURE", e
+
+                            yield futures[future], status, result
+
+                        if on_interval:
+                            on_interval()
+
+                except KeyboardInterrupt:
+
+                    for future in pending:
+                        future.cancel()
+                    raise
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3.6
+# Durable record of queued job groups
+
+import json
+import logging
+import os
+import time
+from typing import Union
+
+from ..app.utils import core
+from ..settings.manager import USER_SETTINGS_FILE, SettingsManager
+from ..worker.celery import app
+from .tracking import JobGroupHandle
+
+settings = SettingsManager()
+
+core.install_rich_tracebacks()
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["app"]["loglevel"])
+
+MANIFEST_DIR = os.path.join(os.path.dirname(USER_SETTINGS_FILE), "manifests")
+
+# Task states worth resubmitting
+RETRYABLE_STATES = ["FAILURE", "REVOKED"]
+
+
+def _manifest_path(group_id: str) -> str:
+    return os.path.join(MANIFEST_DIR, f"{group_id}.json")
+
+
+def _status_log_path(group_id: str) -> str:
+    return os.path.join(MANIFEST_DIR, f"{group_id}.status")
+
+
+def write_manifest(
+    group_id: str,
+    project: str,
+    timeline: str,
+    tasks: list,
+    profiles: Union[dict, None] = None,
+    local: bool = False,
+) -> str:
+    """Write a manifest for a queued job group.
+
+    The manifest keeps everything needed to pick up a group again after the queuer
+    has closed: which tasks belong to it, the exact job payloads sent
+    and which media pool items they link back to.
+
+    Args:
+        group_id(str): id of the queued group
+        project(str): Resolve project name the jobs were queued from
+        timeline(str): Resolve timeline name the jobs were queued from
+        tasks(list): list of dicts with `task_id` and `job` payload
+        profiles(dict): settings profiles the jobs reference, by settings hash
+        local(bool): encoded in the queuer's own process pool, never sent to the broker
+
+    Returns:
+        path(str): the manifest file path
+
+    Raises:
+        OSError: if the manifest directory can't be created
+    """
+
+    os.makedirs(MANIFEST_DIR, exist_ok=True)
+
+    manifest = {
+        "group_id": group_id,
+        "created": time.time(),
+        "project": project,
+        "timeline": timeline,
+        "tasks": tasks,
+        "profiles": profiles or {},
+        "local": local,
+    }
+
+    path = _manifest_path(group_id)
+    with open(path, "w") as file:
+        json.dump(manifest, file)
+
+    logger.debug(f"[magenta]Wrote job manifest:[/] '{path}'")
+    return path
+
+
+def record_status(group_id: str, task_id: str, status: str):
+    """Append a task's last known status to the group's status log.
+
+    Statuses are appended rather than rewriting the manifest so
+    large groups don't rewrite the whole file for every finished task.
+    """
+
+    try:
+
+        with open(_status_log_path(group_id), "a") as file:
+            file.write(json.dumps({"task_id": task_id, "status": status}) + "\n")
+
+    except OSError as e:
+        logger.warning(f"[yellow]Couldn't record status for task {task_id}[/]\n{e}")
+
+
+def list_manifests() -> list:
+    """Return manifest group ids, newest first"""
+
+    if not os.path.exists(MANIFEST_DIR):
+        return []
+
+    manifests = [
+        os.path.join(MANIFEST_DIR, x)
+        for x in os.listdir(MANIFEST_DIR)
+        if x.endswith(".json")
+    ]
+    manifests = sorted(manifests, key=os.path.getmtime, reverse=True)
+    return [os.path.splitext(os.path.basename(x))[0] for x in manifests]
+
+
+def load_manifest(group_id: Union[str, None] = None) -> Union[dict, None]:
+    """Load a group manifest, merged with any recorded task statuses.
+
+    Args:
+        group_id(str): full or partial group id. Loads the newest manifest if None.
+
+    Returns:
+        manifest(dict): the manifest, or None if no match
+    """
+
+    group_ids = list_manifests()
+
+    if group_id:
+        group_ids = [x for x in group_ids if x.startswith(group_id)]
+
+    if not group_ids:
+        logger.error(f"[red]No job manifest found matching '{group_id}'[/]")
+        return None
+
+    if len(group_ids) > 1 and group_id:
+        logger.warning(
+            f"[yellow]{len(group_ids)} manifests match '{group_id}'. "
+            f"Using newest: '{group_ids[0]}'[/]"
+        )
+
+    with open(_manifest_path(group_ids[0])) as file:
+        manifest = json.load(file)
+
+    statuses = dict()
+    if os.path.exists(_status_log_path(manifest["group_id"])):
+
+        with open(_status_log_path(manifest["group_id"])) as file:
+            for line in file:
+                if line.strip():
+                    entry = json.loads(line)
+                    statuses.update({entry["task_id"]: entry["status"]})
+
+    for task in manifest["tasks"]:
+        task.update({"status": statuses.get(task["task_id"], "PENDING")})
+
+    return manifest
+
+
+def replace_task_ids(manifest: dict, new_task_ids: dict):
+    """Point resubmitted tasks at their new task ids and rewrite the manifest.
+
+    Args:
+        manifest(dict): a loaded manifest
+        new_task_ids(dict): old task id to new task id
+    """
+
+    for task in manifest["tasks"]:
+
+        if task["task_id"] in new_task_ids:
+            task.update({"task_id": new_task_ids[task["task_id"]]})
+
+        task.pop("status", None)
+
+    write_manifest(
+        manifest["group_id"],
+        manifest["project"],
+        manifest["timeline"],
+        manifest["tasks"],
+        profiles=manifest.get("profiles"),
+        local=manifest.get("local", False),
+    )
+
+
+def require_broker(manifest: dict) -> bool:
+    """Check a manifest's tasks went through the broker, so they can be tracked.
+
+    Locally encoded groups' tasks never reached the result backend,
+    and waiting on them would never finish.
+    """
+
+    if not manifest.get("local"):
+        return True
+
+    logger.error(
+        f"[red]Group '{manifest['group_id']}' was encoded locally, "
+        "so its jobs can't be tracked through the broker.[/]\n"
+        "[yellow]Link any finished proxies with [bold]'rprox relink'[/bold], "
+        "or queue the timeline again.[/]"
+    )
+    return False
+
+
+def get_group_result(manifest: dict) -> JobGroupHandle:
+    """Rebuild a result handle for the manifest's tasks from the result backend"""
+
+    return JobGroupHandle(
+        manifest["group_id"], [x["task_id"] for x in manifest["tasks"]]
+    )
+
+
+def get_retryable_tasks(manifest: dict) -> list:
+    """Return manifest tasks that failed or were revoked.
+
+    The status log is preferred, since results may have expired from the backend.
+    Unknown statuses are checked against the backend.
+    """
+
+    retryable = []
+
+    for task in manifest["tasks"]:
+
+        status = task.get("status", "PENDING")
+        if status == "PENDING":
+            status = app.AsyncResult(task["task_id"]).status
+
+        if status in RETRYABLE_STATES:
+            retryable.append(task)
+
+    return retryable
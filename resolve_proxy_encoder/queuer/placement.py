@@ -0,0 +1,204 @@
+#!/usr/bin/env python3.6
+# Spread proxies across proxy roots
+
+import hashlib
+import json
+import logging
+import math
+import os
+import pathlib
+import shutil
+import time
+from functools import lru_cache
+from typing import Union
+
+from ..app.utils import core
+from ..settings.manager import USER_SETTINGS_FILE, SettingsManager
+
+settings = SettingsManager()
+
+core.install_rich_tracebacks()
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["app"]["loglevel"])
+
+PLACEMENT_POLICIES = ["hash", "free_space", "write_speed"]
+
+# Roots with less free space than this don't take new proxies
+MIN_FREE_BYTES = 10 * 1024**3
+
+# Write speed is measured once a day per root, not every queue
+WRITE_SPEED_CACHE_FILE = os.path.join(
+    os.path.dirname(USER_SETTINGS_FILE), "write_speeds.json"
+)
+WRITE_SPEED_MAX_AGE = 24 * 60 * 60
+WRITE_SPEED_SAMPLE_BYTES = 32 * 1024 * 1024
+
+
+def get_proxy_roots() -> list:
+    """Get every proxy root, the main `proxy_path_root` first"""
+
+    roots = [settings["paths"]["proxy_path_root"]]
+    roots += [x for x in settings["paths"]["proxy_path_roots"] if x not in roots]
+    return roots
+
+
+def get_proxy_dir(file_path: str, root: str) -> str:
+    """Get the dir a source's proxy goes in under a proxy root, mirroring the source's folders"""
+
+    p = pathlib.Path(file_path)
+    return os.path.normpath(
+        os.path.join(root, os.path.dirname(p.relative_to(*p.parts[:1])))
+    )
+
+
+def get_free_bytes(root: str) -> Union[int, None]:
+    """Get free space on a root's volume, or None if it can't be reached"""
+
+    try:
+        return shutil.disk_usage(root).free
+    except OSError:
+        return None
+
+
+def measure_write_speed(root: str) -> Union[float, None]:
+    """Time writing and syncing a sample file to a root, in MB per second"""
+
+    sample_file = os.path.join(root, f".rprox_write_test_{os.getpid()}")
+    chunk = os.urandom(1024 * 1024)
+
+    try:
+
+        started = time.monotonic()
+
+        with open(sample_file, "wb") as file:
+            for _ in range(WRITE_SPEED_SAMPLE_BYTES // len(chunk)):
+                file.write(chunk)
+            file.flush()
+            os.fsync(file.fileno())
+
+        elapsed = time.monotonic() - started
+
+    except OSError:
+        return None
+
+    finally:
+
+        try:
+            os.remove(sample_file)
+        except OSError:
+            pass
+
+    return round(WRITE_SPEED_SAMPLE_BYTES / 1024**2 / elapsed, 1) if elapsed else None
+
+
+def get_write_speeds(roots: list) -> dict:
+    """Get each root's write speed, measuring any without a recent measurement"""
+
+    try:
+        with open(WRITE_SPEED_CACHE_FILE) as file:
+            cached = json.load(file)
+    except (OSError, ValueError):
+        cached = {}
+
+    speeds = {}
+    now = time.time()
+
+    for root in roots:
+
+        entry = cached.get(root)
+        if entry and now - entry["measured_at"] < WRITE_SPEED_MAX_AGE:
+            speeds.update({root: entry["speed"]})
+            continue
+
+        speed = measure_write_speed(root)
+        logger.info(f"[cyan]'{root}' writes at {speed} MB/s[/]")
+
+        speeds.update({root: speed})
+        cached.update({root: {"speed": speed, "measured_at": now}})
+
+    try:
+        with open(WRITE_SPEED_CACHE_FILE, "w") as file:
+            json.dump(cached, file)
+    except OSError as e:
+        logger.warning(f"[yellow]Couldn't cache write speeds[/]\n{e}")
+
+    return speeds
+
+
+@lru_cache(maxsize=None)
+def get_weights(policy: str, roots: tuple) -> dict:
+    """Get each usable root's share of new proxies under a placement policy.
+
+    Unreachable roots and roots nearly out of space get no share.
+    Looked up once per queue run, so a run places consistently.
+    """
+
+    free = {x: get_free_bytes(x) for x in roots}
+    usable = [x for x in roots if free[x] is not None and free[x] >= MIN_FREE_BYTES]
+
+    for x in roots:
+        if x not in usable:
+            logger.warning(f"[yellow]Proxy root '{x}' is unreachable or full[/]")
+
+    if policy == "free_space":
+        return {x: float(free[x]) for x in usable}
+
+    if policy == "write_speed":
+        speeds = get_write_speeds(usable)
+        return {x: speeds[x] for x in usable if speeds[x]}
+
+    return {x: 1.0 for x in usable}
+
+
+def choose_root(file_path: str, weights: dict) -> Union[str, None]:
+    """Choose a source's proxy root by weighted rendezvous hashing.
+
+    Each root scores the source by a hash of both, scaled by the root's weight,
+    and the highest score wins. Sources spread across roots in proportion to
+    their weights, and a source always lands on the same root unless that
+    root's weight changes a lot or it drops out.
+    """
+
+    best, best_score = None, -math.inf
+
+    for root, weight in weights.items():
+
+        digest = hashlib.sha256(f"{root}|{file_path}".encode()).digest()
+        unit = (int.from_bytes(digest[:8], "big") + 1) / (2**64 + 1)
+        score = -weight / math.log(unit)
+
+        if score > best_score:
+            best, best_score = root, score
+
+    return best
+
+
+def place(file_path: str) -> str:
+    """Get the proxy dir for a new proxy of a source, on the root placement picks"""
+
+    roots = get_proxy_roots()
+    if len(roots) == 1:
+        return get_proxy_dir(file_path, roots[0])
+
+    weights = get_weights(settings["paths"]["proxy_placement"], tuple(roots))
+    root = choose_root(file_path, weights)
+
+    if root is None:
+        logger.warning("[yellow]No proxy root is usable. Using the main root.[/]")
+        root = roots[0]
+
+    return get_proxy_dir(file_path, root)
+
+
+def get_candidate_dirs(file_path: str, placed_dir: Union[str, None] = None) -> list:
+    """Get every dir an existing proxy of a source could be in, across all roots.
+
+    The dir placement would choose comes first.
+    """
+
+    dirs = [get_proxy_dir(file_path, x) for x in get_proxy_roots()]
+
+    if placed_dir:
+        dirs = [placed_dir] + [x for x in dirs if x != placed_dir]
+
+    return dirs
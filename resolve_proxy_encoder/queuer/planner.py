@@ -0,0 +1,213 @@
+#!/usr/bin/env python3.6
+# Predict how long a set of jobs will take on the current farm
+
+import logging
+import math
+from typing import Union
+
+from rich import print
+from rich.table import Table
+
+from ..app.utils import core
+from ..settings.manager import SettingsManager
+from ..worker import capabilities
+from ..worker.celery import app
+from ..worker.timelimits import get_work
+from ..worker.utils import get_queue
+from . import history, local, scheduler
+from .progress import format_eta
+
+settings = SettingsManager()
+
+core.install_rich_tracebacks()
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["app"]["loglevel"])
+
+# Seconds per frame per source megapixel when there's no history yet.
+# About 60 fps for a 1080p source.
+DEFAULT_RATE = 1 / (60 * 1920 * 1080 / 1e6)
+
+# Encodes of a source codec needed before it gets its own rate
+MIN_CODEC_SAMPLES = 3
+
+
+def fit_cost_model(entries: list) -> dict:
+    """Fit encode seconds per unit of work, per source codec and overall.
+
+    Each rate is total seconds over total work, so long encodes
+    count for more than short ones, as they do in a makespan.
+
+    Args:
+        entries: finished encodes, from `history.load`
+
+    Returns:
+        model: dict of `codecs` rates, a `default` rate and how many `samples` it's from
+    """
+
+    totals = dict()
+
+    for x in entries:
+
+        work = get_work(x)
+        if not work:
+            continue
+
+        seconds, total_work, count = totals.get(x.get("codec"), (0.0, 0.0, 0))
+        totals.update(
+            {
+                x.get("codec"): (
+                    seconds + x["encode_seconds"],
+                    total_work + work,
+                    count + 1,
+                )
+            }
+        )
+
+    all_seconds = sum(x[0] for x in totals.values())
+    all_work = sum(x[1] for x in totals.values())
+
+    return {
+        "codecs": {
+            codec: seconds / work
+            for codec, (seconds, work, count) in totals.items()
+            if codec and count >= MIN_CODEC_SAMPLES
+        },
+        "default": all_seconds / all_work if all_work else DEFAULT_RATE,
+        "samples": sum(x[2] for x in totals.values()),
+    }
+
+
+def predict_seconds(job: dict, model: dict) -> float:
+    """Predict a job's encode seconds on an average worker"""
+
+    rate = model["codecs"].get(job.get("codec"), model["default"])
+    return get_work(job) * rate
+
+
+def get_worker_count(
+    local_mode: bool = False, inspect: bool = True
+) -> Union[int, None]:
+    """Count workers that would take these jobs. 0 if none are online.
+
+    Workers' capability advertisements are counted if there are any, since
+    they're a quick read from Redis. Otherwise workers are asked over the broker,
+    which waits out a timeout, unless `inspect` is False.
+
+    Returns:
+        count: online workers, or None if they weren't counted
+    """
+
+    if local_mode:
+        return local.get_local_worker_count()
+
+    main_queue = get_queue()
+
+    advertised = capabilities.get_advertised() if capabilities.is_advertising() else []
+    if advertised:
+        return len(
+            [
+                x
+                for x in advertised
+                if any(y.startswith(main_queue) for y in x.get("queues", []))
+            ]
+        )
+
+    if not inspect:
+        return None
+
+    try:
+        online_workers = app.control.inspect().active_queues() or {}
+    except Exception as e:
+        logger.warning(f"[yellow]Couldn't reach the broker to count workers[/]\n{e}")
+        return 0
+
+    return len(
+        [
+            worker
+            for worker, queues in online_workers.items()
+            if any(x["name"].startswith(main_queue) for x in queues)
+        ]
+    )
+
+
+def plan_jobs(jobs: list, workers: int) -> dict:
+    """Predict each job's encode time and when the whole set would finish.
+
+    Jobs are ordered and segmented as the scheduler would,
+    then simulated on `workers` identical workers.
+
+    Returns:
+        plan: dict of `jobs` as (job, predicted seconds) in submission order,
+         `total` worker seconds, `makespan` seconds, `workers` and `samples`
+    """
+
+    model = fit_cost_model(history.load())
+
+    ordered = list(jobs)
+    if settings["scheduling"]["longest_first"]:
+        ordered = scheduler.order_longest_first(ordered)
+
+    segment_threshold = settings["scheduling"]["segment_threshold"]
+    segment_duration = settings["scheduling"]["segment_duration"]
+
+    predicted = []
+    durations = []
+
+    for x in ordered:
+
+        seconds = predict_seconds(x, model)
+        predicted.append((x, seconds))
+
+        # Segments of a long job run side by side
+        duration = scheduler.get_duration(x)
+        pieces = 1
+        if segment_threshold and duration > segment_threshold:
+            pieces = max(1, math.ceil(duration / segment_duration))
+
+        durations += [seconds / pieces] * pieces
+
+    makespan = scheduler.simulate_makespan(durations, max(1, workers))["makespan"]
+
+    return {
+        "jobs": predicted,
+        "total": sum(x[1] for x in predicted),
+        "makespan": makespan,
+        "workers": workers,
+        "samples": model["samples"],
+    }
+
+
+def print_plan(plan: dict):
+    """Print predicted encode times per job, and for the whole set"""
+
+    table = Table(title="Predicted encodes, in submission order")
+    table.add_column("File")
+    table.add_column("Codec")
+    table.add_column("Resolution")
+    table.add_column("Frames", justify="right")
+    table.add_column("Predicted", justify="right")
+
+    for job, seconds in plan["jobs"]:
+        table.add_row(
+            job["file_name"],
+            str(job.get("codec") or "?"),
+            "x".join(str(x) for x in job.get("resolution") or []),
+            str(job["frames"]),
+            format_eta(seconds),
+        )
+
+    print(table)
+
+    if plan["samples"]:
+        print(f"[cyan]Based on {plan['samples']} past encodes[/]")
+    else:
+        print("[yellow]No encode history yet. Assuming 60 fps at 1080p.[/]")
+
+    if not plan["workers"]:
+        print("[yellow]No workers online. Assuming one.[/]")
+
+    print(
+        f"[green]{len(plan['jobs'])} jobs, {format_eta(plan['total'])} of encoding. "
+        f"Done in about [bold]{format_eta(plan['makespan'])}[/bold] "
+        f"with {max(1, plan['workers'])} workers.[/]"
+    )
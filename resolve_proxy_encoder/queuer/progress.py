@@ -0,0 +1,196 @@
+#!/usr/bin/env python3.6
+# Live aggregated progress for queued job groups
+
+import logging
+import time
+
+from rich.console import Console
+from rich.live import Live
+from rich.progress_bar import ProgressBar
+from rich.table import Table
+
+from ..app.utils import core
+from ..settings.manager import SettingsManager
+
+settings = SettingsManager()
+
+core.install_rich_tracebacks()
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["app"]["loglevel"])
+
+# Custom task state published by workers while FFmpeg runs
+ENCODING_STATE = "ENCODING"
+
+
+def format_eta(seconds) -> str:
+    """Format seconds remaining as H:MM:SS, or '-:--:--' if unknown"""
+
+    if seconds is None:
+        return "-:--:--"
+
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class GroupProgress:
+    """Aggregate progress of a job group from task state messages.
+
+    Workers publish 'ENCODING' task states with frame counts and FPS.
+    Each state message is pushed to us by the result backend as it's stored,
+    so there's nothing to poll. Overall progress is weighted by frames,
+    not task count, so one long clip doesn't look like one short one.
+
+    Use as a context manager to render a live view while waiting.
+    """
+
+    def __init__(self, jobs_by_task_id: dict, console: Console = None):
+
+        self.frames_total = {k: int(v["frames"]) for k, v in jobs_by_task_id.items()}
+        self.file_names = {k: v["file_name"] for k, v in jobs_by_task_id.items()}
+        self.frames_done = {k: 0 for k in jobs_by_task_id}
+
+        # Segmented jobs report progress per segment under the job's task id
+        self.segment_frames = {k: dict() for k in jobs_by_task_id}
+
+        # Worker hostname to its current task, fps
+        self.workers = dict()
+
+        self.finished = set()
+        self.failed = set()
+        self.started = time.monotonic()
+
+        self.console = console if console else Console()
+        self._live = None
+
+    def __enter__(self):
+
+        self._live = Live(
+            self.render(),
+            console=self.console,
+            refresh_per_second=2,
+        )
+        self._live.start()
+        return self
+
+    def __exit__(self, *args):
+
+        self._live.update(self.render())
+        self._live.stop()
+        self._live = None
+
+    @property
+    def total(self) -> int:
+        return sum(self.frames_total.values())
+
+    @property
+    def done(self) -> int:
+        return sum(self.frames_done.values())
+
+    def eta(self):
+        """Seconds until the group finishes, from frame throughput so far"""
+
+        elapsed = time.monotonic() - self.started
+        done = self.done
+
+        if not done or not elapsed:
+            return None
+
+        return (self.total - done) / (done / elapsed)
+
+    def on_message(self, meta: dict):
+        """Update from a task state message. Pass as `on_message` to result iterators"""
+
+        task_id = meta.get("task_id")
+        status = meta.get("status")
+
+        if task_id not in self.frames_total:
+            return
+
+        if status == ENCODING_STATE:
+
+            result = meta.get("result") or {}
+            frames_done = int(result.get("frames_done", 0))
+
+            if "segment" in result:
+                self.segment_frames[task_id][result["segment"]] = frames_done
+                frames_done = sum(self.segment_frames[task_id].values())
+
+            self.frames_done[task_id] = min(frames_done, self.frames_total[task_id])
+            # Several workers can share a segmented job
+            self.workers[result.get("worker", "unknown")] = {
+                "task_id": task_id,
+                "fps": float(result.get("fps", 0.0)),
+            }
+
+        elif status == "SUCCESS":
+
+            self.finished.add(task_id)
+            self.frames_done[task_id] = self.frames_total[task_id]
+            self._release_worker(task_id)
+
+        elif status in ["FAILURE", "REVOKED"]:
+
+            # Failed frames still count as done, or the ETA would never reach zero
+            self.failed.add(task_id)
+            self.frames_done[task_id] = self.frames_total[task_id]
+            self._release_worker(task_id)
+
+        self.refresh()
+
+    def _release_worker(self, task_id):
+
+        for worker, current in list(self.workers.items()):
+            if current["task_id"] == task_id:
+                del self.workers[worker]
+
+    def refresh(self):
+        """Redraw the live view. Pass as `on_interval` to keep the ETA ticking"""
+
+        if self._live:
+            self._live.update(self.render())
+
+    def render(self) -> Table:
+
+        total = self.total
+        done = self.done
+        percentage = done / total * 100 if total else 100
+
+        overall = Table.grid(padding=(0, 2))
+        overall.add_row(
+            "[cyan]Overall[/]",
+            ProgressBar(total=total or 1, completed=done, width=40),
+            f"{percentage:>3.0f}%",
+            f"{len(self.finished)}/{len(self.frames_total)} done"
+            + (f", [red]{len(self.failed)} failed[/]" if self.failed else ""),
+            f"[yellow]ETA:[/] {format_eta(self.eta())}",
+        )
+
+        workers = Table(box=None, padding=(0, 2), show_edge=False)
+        workers.add_column("Worker", style="magenta")
+        workers.add_column("Encoding")
+        workers.add_column("Progress", justify="right")
+        workers.add_column("FPS", justify="right")
+
+        for worker, current in sorted(self.workers.items()):
+
+            task_id = current["task_id"]
+            task_percentage = (
+                self.frames_done[task_id] / self.frames_total[task_id] * 100
+                if self.frames_total[task_id]
+                else 0
+            )
+            workers.add_row(
+                worker,
+                self.file_names[task_id],
+                f"{task_percentage:>3.0f}%",
+                f"{current['fps']:.1f}",
+            )
+
+        farm_fps = sum([x["fps"] for x in self.workers.values()])
+        workers.add_row("", "", "[cyan]Total[/]", f"[cyan]{farm_fps:.1f}[/]")
+
+        view = Table.grid()
+        view.add_row(overall)
+        view.add_row("")
+        view.add_row(workers)
+        return view
@@ -1,15 +1,32 @@
 #!/usr/bin/env python3.6
 
+import getpass
 import logging
 import os
 
-from celery import group
+from celery import chord, uuid
 from rich import print as print
+from rich.prompt import Confirm
 
 from ..app.utils import core
 from ..settings.manager import SettingsManager
+from ..worker import cancel, fairshare, locks, priority, registry
+from ..worker.celery import app
+from ..worker.tasks.batch.tasks import get_batch_signature
 from ..worker.tasks.encode.tasks import encode_proxy
-from . import handlers, link, resolve
+from ..worker.tasks.segment.tasks import get_segmented_signature
+from . import (
+    handlers,
+    history,
+    link,
+    local,
+    manifest,
+    planner,
+    progress,
+    resolve,
+    scheduler,
+    tracking,
+)
 
 settings = SettingsManager()
 
@@ -20,6 +37,26 @@ logger.setLevel(settings["app"]["loglevel"])
 # Set global flags
 SOME_ACTION_TAKEN = False
 
+# Jobs claimed and published per broker connection
+SUBMIT_CHUNK_SIZE = 500
+
+# Job keys only the queuer uses. Kept in the manifest, left out of task payloads.
+QUEUER_ONLY_KEYS = [
+    "clip_name",
+    "duration",
+    "proxy_status",
+    "proxy_media_path",
+    "start",
+    "end",
+    "end_tc",
+    "media_pool_item",
+    "queue",
+    "priority",
+    "deadline",
+    "batch",
+    "codec",
+]
+
 
 def add_queuer_data(jobs, **kwargs):
     """
@@ -40,49 +77,584 @@ def add_queuer_data(jobs, **kwargs):
     return jobs
 
 
-def queue_jobs(jobs):
-    """Send jobs as a Celery 'group'"""
+def get_task_payload(job):
+    """Strip a job down to what workers need to encode it
+
+    Settings are sent once as a published profile rather than with every task,
+    so with its settings hash a payload is only a few hundred bytes.
+    """
+
+    return {k: v for k, v in job.items() if k not in QUEUER_ONLY_KEYS}
+
 
-    # Wrap job objects in Celery task function
-    callable_tasks = [encode_proxy.s(x) for x in jobs]
-    logger.debug(f"[magenta]callable_tasks:[/] {callable_tasks}")
+def get_signature(job, task_id):
+    """Get the Celery signature that encodes a job.
+
+    Long jobs marked for segmenting become a chord of segment encodes.
+    Others are a single `encode_proxy` task. Either way every task it sends
+    goes to the job's scheduled queue, with its priority and deadline.
+    """
+
+    payload = get_task_payload(job)
+
+    if job.get("segment_duration"):
+        signature = get_segmented_signature(
+            payload, task_id=task_id, queue=job.get("queue")
+        )
 
-    # Create job group to retrieve job results as batch
-    task_group = group(callable_tasks)
+    else:
+
+        signature = encode_proxy.s(payload).set(task_id=task_id)
+
+        if job.get("queue"):
+            signature = signature.set(queue=job["queue"])
+
+    return signature.set(**priority.get_task_options(job))
+
+
+def get_batch_signatures(jobs, task_ids):
+    """Pack very short jobs into batch tasks, each encoded by a single worker.
+
+    Jobs only share a batch with jobs bound for the same queue and priority.
+    Each job keeps its own task id, so it's tracked as if sent individually.
+
+    Returns:
+        signatures: list of (signature, jobs in it, their task ids)
+    """
+
+    packable = dict()
+    for x, task_id in zip(jobs, task_ids):
+        key = (x.get("queue"), x.get("priority"), x.get("deadline"))
+        packable.setdefault(key, []).append((x, task_id))
+
+    size = settings["scheduling"]["batch_size"]
+    signatures = []
+
+    for items in packable.values():
+
+        for i in range(0, len(items), size):
+
+            batch = [x for x, _ in items[i : i + size]]
+            batch_task_ids = [task_id for _, task_id in items[i : i + size]]
+            signature = get_batch_signature(
+                [get_task_payload(x) for x in batch], batch_task_ids
+            )
+
+            if batch[0].get("queue"):
+                signature = signature.set(queue=batch[0]["queue"])
+
+            signatures.append(
+                (
+                    signature.set(**priority.get_task_options(batch[0])),
+                    batch,
+                    batch_task_ids,
+                )
+            )
+
+    return signatures
+
+
+def queue_jobs(jobs, chunk_size=SUBMIT_CHUNK_SIZE):
+    """Send jobs to workers, returning a lightweight handle to track them as a batch
+
+    Jobs are sent in order, in bounded chunks. Each chunk claims its jobs
+    in one pipelined round trip and publishes over a single broker connection,
+    so the queuer stays responsive when submitting thousands of clips.
+    Segmented jobs are chords, which can't be nested in a plain group,
+    so every job is sent individually and tracked by task id.
+    Very short jobs are packed into batch tasks after the rest of their chunk.
+
+    Jobs already being encoded with the same settings, queued by anyone,
+    aren't sent again. Their in-flight task is tracked instead.
+
+    With fair share enabled, jobs are staged rather than sent, then dispatched
+    interleaved with other queuers' jobs. Urgent jobs skip the line.
+
+    Args:
+        jobs: scheduled jobs, in submission order
+        chunk_size: jobs claimed and published per broker connection
+
+    Returns:
+        job_group: `JobGroupHandle` of task ids, in the same order as `jobs`
+    """
 
-    # Queue job
-    queued_group = task_group.apply_async()
+    task_ids = []
+    attached = []
+    fair_share = fairshare.is_enabled()
+
+    for i in range(0, len(jobs), chunk_size):
+
+        chunk = jobs[i : i + chunk_size]
+        chunk_ids = [uuid() for _ in chunk]
+        existing = locks.claim_jobs(
+            chunk, chunk_ids, get_state=lambda id_: app.AsyncResult(id_).state
+        )
+
+        signatures = []
+        batchable = []
+
+        for x, task_id, existing_id in zip(chunk, chunk_ids, existing):
+
+            if existing_id:
+
+                logger.debug(
+                    f"[magenta]'{x['file_name']}' is already encoding, "
+                    f"attaching to task {existing_id}[/]"
+                )
+                attached.append(x)
+                task_ids.append(existing_id)
+                continue
+
+            task_ids.append(task_id)
+
+            if x.get("batch"):
+                batchable.append((x, task_id))
+                continue
+
+            signatures.append((get_signature(x, task_id), [x], [task_id]))
+
+        if batchable:
+            signatures += get_batch_signatures(*zip(*batchable))
+
+        staged = dict()
+
+        with app.producer_or_acquire() as producer:
+
+            for signature, signature_jobs, signature_task_ids in signatures:
+
+                logger.debug(f"[magenta]callable_task:[/] {signature}")
+
+                if fair_share and (
+                    signature.options["priority"] != priority.PRIORITIES["urgent"]
+                ):
+                    tenant = fairshare.get_tenant(signature_jobs[0])
+                    cost = sum(scheduler.estimate_cost(x) for x in signature_jobs)
+                    staged.setdefault(tenant, []).append(
+                        (signature, cost, signature_task_ids)
+                    )
+                    continue
+
+                # Chords copy their options to the body, which must stay serializable
+                if isinstance(signature, chord):
+                    signature.apply_async()
+                else:
+                    signature.apply_async(producer=producer)
+
+        for tenant, items in staged.items():
+            fairshare.stage(tenant, *zip(*items))
+
+        locks.mark_queued([y for x in signatures for y in x[2]])
+
+        logger.debug(f"[magenta]Submitted {len(task_ids)}/{len(jobs)} jobs[/]")
+
+    if attached:
+        logger.info(
+            f"[cyan]{len(attached)} jobs are already encoding from another queuer. "
+            "Attaching to them instead.[/]"
+        )
+
+    # Not skipped if another dispatcher holds the lock, so the first jobs go out now
+    if fair_share:
+        fairshare.dispatch(wait=True)
+
+    queued_group = tracking.JobGroupHandle(uuid(), task_ids)
     logger.debug(f"[cyan]Queued tasks {queued_group}[/]")
 
     return queued_group
 
 
-def wait_jobs(jobs):
-    """Block until all queued jobs finish, notify results."""
+def cancel_jobs(job_group) -> list:
+    """Stop a queued group's unfinished jobs, without touching anyone else's.
+
+    Staged jobs are dropped, queued ones are revoked and workers encoding
+    one kill FFmpeg, delete the partial proxy and move on to other work.
+
+    Args:
+        job_group: `JobGroupHandle` of the group's tasks
+
+    Returns:
+        cancelled: task ids that hadn't finished, now marked revoked
+    """
+
+    task_ids = job_group.get_unfinished()
+    if not task_ids:
+        return []
+
+    # Flag first, so nothing dispatched or picked up from here on gets far
+    cancel.request_cancel(task_ids)
+    fairshare.unstage(task_ids)
+    app.control.revoke(task_ids)
+
+    # Jobs that never started can be queued again straight away
+    locks.release_tasks(task_ids)
+
+    # Waiters needn't wait on workers for jobs that never started
+    for x in task_ids:
+        app.backend.mark_as_revoked(x, reason="cancelled")
+
+    logger.debug(f"[magenta]Cancelled {len(task_ids)} tasks of {job_group}[/]")
+    return task_ids
+
 
-    result = jobs.join()
+def release_purged() -> int:
+    """Forget jobs purged from the broker, so they can be queued again straight away.
+
+    Staged jobs are dropped too, since they'd otherwise be sent after the purge.
+
+    Returns:
+        released: count of purged jobs released
+    """
+
+    fairshare.clear()
+    released = locks.release_unstarted(get_state=lambda id_: app.AsyncResult(id_).state)
+
+    logger.debug(f"[magenta]Released {released} purged jobs[/]")
+    return released
+
+
+def iter_completed(job_group, on_message=None, on_interval=None):
+    """Yield each task's result as soon as it finishes, regardless of queue order.
+
+    Args:
+        job_group: `JobGroupHandle` returned by `queue_jobs`
+        on_message: optional callable, called with every task state message
+         as it's published, including progress states. Redis backends only.
+        on_interval: optional callable, called between checks for new messages
+
+    Yields:
+        (task_id, status, result) - result is the exception instance if the task failed
+    """
+
+    yield from job_group.iter_completed(on_message=on_message, on_interval=on_interval)
+
+
+def wait_jobs(
+    job_group, on_success=None, on_failure=None, group_progress=None, on_interval=None
+):
+    """Block until all queued jobs finish, notify results.
+
+    Args:
+        job_group: `JobGroupHandle` returned by `queue_jobs`
+        on_success: optional callable, called with the task id and result of each job
+         as soon as it finishes successfully. Used to link proxies progressively.
+        on_failure: optional callable, called with the task id and status of each failed job
+        group_progress: optional `GroupProgress` to update with task state messages
+        on_interval: optional callable, called between checks for finished jobs
+
+    Returns:
+        failed - list of task ids that failed to encode
+    """
+
+    failed = []
+    completed = 0
+
+    def _on_interval():
+
+        if group_progress:
+            group_progress.refresh()
+
+        if on_interval:
+            on_interval()
+
+    for task_id, status, result in iter_completed(
+        job_group,
+        on_message=group_progress.on_message if group_progress else None,
+        on_interval=_on_interval,
+    ):
+
+        # Non-native backends don't stream state messages
+        if group_progress:
+            group_progress.on_message(
+                {"task_id": task_id, "status": status, "result": result}
+            )
+
+        if status != "SUCCESS":
+
+            logger.error(f"[red]Task {task_id} failed:[/] {result}")
+            failed.append(task_id)
+
+            if on_failure:
+                on_failure(task_id, status)
+
+            continue
+
+        completed += 1
+        logger.debug(f"[magenta]Task {task_id} finished:[/] {result}")
+
+        if on_success:
+            on_success(task_id, result)
 
     # Notify failed
-    if jobs.failed():
+    if failed:
         fail_message = (
-            "Some videos failed to encode!"
+            f"{len(failed)} videos failed to encode! "
             + f"Check flower dashboard at address: {settings['celery']['flower_url']}."
         )
-        print("[red]fail_message[/]")
+        print(f"[red]{fail_message}[/]")
         core.notify(fail_message)
 
     # Notify complete
-    complete_message = f"Completed encoding {jobs.completed_count()} proxies."
+    complete_message = f"Completed encoding {completed} proxies."
     print(f"[green]{complete_message}[/]")
     print("\n")
 
     core.notify(complete_message)
 
-    return result
+    return failed
+
+
+def restore_media_pool_items(jobs, media_pool_items):
+    """Swap stringified media pool items in jobs back for their Resolve objects
+
+    Args:
+        jobs: list of jobs with `media_pool_item` as its string representation
+        media_pool_items: dict of stringified media pool items to Resolve objects
+
+    Returns:
+        jobs - the same jobs, restored in place
+    """
+
+    for x in jobs:
+
+        mpi = media_pool_items.get(x["media_pool_item"])
+        if mpi is not None:
+            x.update({"media_pool_item": mpi})
+
+    return jobs
+
+
+def recover_media_pool_items(jobs, project_name, timeline_name):
+    """Find media pool items for jobs queued in a previous session.
+
+    Media pool items can't outlive the queuer that fetched them, so we
+    search the project's timelines again, queued timeline first, and match
+    each job on its stringified media pool item, UUID or source file path.
+
+    Args:
+        jobs: list of job payloads with stringified `media_pool_item`
+        project_name: project the jobs were queued from
+        timeline_name: timeline the jobs were queued from
+
+    Returns:
+        media_pool_items - dict of stringified media pool items to Resolve objects
+    """
+
+    r_ = resolve.ResolveObjects()
+
+    if r_.project.GetName() != project_name:
+
+        logger.warning(
+            f"[yellow]Jobs were queued from project '{project_name}', "
+            f"but '{r_.project.GetName()}' is open.[/]"
+        )
+        if not Confirm.ask("[cyan]Search the open project anyway?[/]"):
+            core.app_exit(0)
+
+    wanted_uuids = {
+        resolve.get_media_pool_item_uuid(x["media_pool_item"]): x for x in jobs
+    }
+    wanted_paths = {x["file_path"]: x for x in jobs}
+    media_pool_items = dict()
+
+    timelines = resolve.get_resolve_timelines(r_.project) or []
+    timelines = sorted(timelines, key=lambda x: x.GetName() != timeline_name)
+
+    for timeline in timelines:
+
+        track_items = resolve.get_video_track_items(timeline)
+
+        for mpi in resolve.get_media_pool_items(track_items):
+
+            job = wanted_uuids.get(resolve.get_media_pool_item_uuid(mpi))
+
+            if job is None:
+
+                try:
+                    job = wanted_paths.get(mpi.GetClipProperty("File Path"))
+                except AttributeError:
+                    continue
+
+            if job is not None:
+                media_pool_items.update({job["media_pool_item"]: mpi})
+
+        if len(media_pool_items) == len(jobs):
+            break
+
+    logger.info(
+        f"[cyan]Recovered {len(media_pool_items)}/{len(jobs)} media pool items[/]"
+    )
+    return media_pool_items
+
+
+def wait_and_link(
+    job_group, jobs_by_task_id, media_pool_items, group_id, progressive_link=True
+):
+    """Wait for a queued group to finish and link its proxies.
+
+    Task statuses are recorded to the group's manifest as they finish
+    so the group can be relinked or retried later.
+
+    Args:
+        job_group: result handle for the queued tasks
+        jobs_by_task_id: dict of task ids to job payloads
+        media_pool_items: dict of stringified media pool items to Resolve objects
+        group_id: manifest group id
+        progressive_link: link each proxy as soon as its encode finishes
+    """
+
+    link_failed = []
+
+    def on_success(task_id, result):
+
+        manifest.record_status(group_id, task_id, "SUCCESS")
+        history.record(jobs_by_task_id[task_id], result)
+
+        if not progressive_link:
+            return
+
+        job = jobs_by_task_id[task_id]
+        restore_media_pool_items([job], media_pool_items)
+
+        if not link.link_proxy_with_mpi(job):
+            link_failed.append(job)
+
+    def on_failure(task_id, status):
+
+        manifest.record_status(group_id, task_id, status)
+
+    def maintain_queue():
+
+        # Local groups never touch the broker
+        if not job_group.reattachable:
+            return
+
+        try:
+            priority.escalate_deadlines()
+            fairshare.dispatch()
+
+        except Exception as e:
+            logger.warning(f"[yellow]Couldn't maintain queue[/]\n{e}")
+
+    if progressive_link:
+        print(f"[yellow]Linking proxies as they finish. Feel free to minimize.[/]")
+    else:
+        print(f"[yellow]Waiting for job to finish. Feel free to minimize.[/]")
+
+    try:
+
+        with progress.GroupProgress(jobs_by_task_id) as group_progress:
+
+            failed = wait_jobs(
+                job_group,
+                on_success=on_success,
+                on_failure=on_failure,
+                group_progress=group_progress,
+                on_interval=maintain_queue,
+            )
 
+    except KeyboardInterrupt:
 
-def main():
-    """Main function"""
+        if not job_group.reattachable:
+            print("\n[yellow]Stopped encoding. Unfinished proxies weren't encoded.[/]")
+            core.app_exit(0, -1)
+
+        if Confirm.ask("\n[yellow]Cancel the unfinished encodes too?[/]"):
+
+            cancelled = cancel_jobs(job_group)
+            for x in cancelled:
+                manifest.record_status(group_id, x, "REVOKED")
+
+            print(
+                f"[yellow]Cancelled {len(cancelled)} encodes.\n"
+                f"Queue them again with [bold]'rprox retry {group_id}'[/bold][/]"
+            )
+            core.app_exit(0, -1)
+
+        print(
+            "[yellow]Stopped waiting. Encoding continues on the workers.\n"
+            f"Pick up again with [bold]'rprox reattach {group_id}'[/bold][/]"
+        )
+        core.app_exit(0, -1)
+
+    if progressive_link:
+
+        if link_failed:
+
+            # Retry now the whole group is done, offering a project-wide search.
+            # Not re-rendering, since these proxies encoded fine.
+            link.link_proxies_with_mpi(
+                link_failed,
+                linkable_types=["None"],
+                prompt_rerender=False,
+            )
+
+        if failed:
+            print(f"[yellow]Retry failed encodes with 'rprox retry {group_id}'[/]")
+
+        core.app_exit(0)
+
+    # Get media pool items back
+    logger.debug(f"[magenta]Restoring media-pool-items[/]")
+
+    finished = [v for k, v in jobs_by_task_id.items() if k not in failed]
+    restore_media_pool_items(finished, media_pool_items)
+
+    try:
+
+        unlinkable = link.link_proxies_with_mpi(
+            finished,
+            linkable_types=["None"],
+            prompt_rerender=False,
+        )
+        assert len(unlinkable) == 0
+
+    except Exception as e:
+
+        logger.error(f"[red]Couldn't link jobs. Link manually.[/]\nError: {e}")
+        core.app_exit(1, -1)
+
+    finally:
+        print("[bold][green]All linked up![/bold] Nothing to queue[/] :link:")
+        core.app_exit(0)
+
+
+def queue_local(tasks):
+    """Encode jobs in a local process pool instead of queuing them.
+
+    Jobs go longest first, so the pool isn't left waiting on one long
+    clip at the end. Segmenting and batching only help spread work
+    across workers, so jobs are encoded whole, one per process.
+
+    Args:
+        tasks: jobs with their settings embedded
+
+    Returns:
+        job_group: `local.LocalJobGroup` to wait on
+        tasks: the jobs in the order they're encoded
+    """
+
+    tasks = scheduler.order_longest_first(tasks)
+    return local.LocalJobGroup([get_task_payload(x) for x in tasks]), tasks
+
+
+def main(
+    progressive_link: bool = True,
+    priority_name: str = None,
+    deadline: float = None,
+    local_mode: bool = False,
+    dry_run: bool = False,
+):
+    """Main function
+
+    Args:
+        progressive_link: link each proxy as soon as its encode finishes,
+         instead of waiting for the whole group to finish first.
+        priority_name: 'urgent', 'high', 'normal' or 'low'. Configured default if None.
+        deadline: optional UNIX timestamp the jobs are needed by.
+         Jobs escalate in priority as it approaches.
+        local_mode: encode in a local process pool, without a broker or workers
+        dry_run: print predicted encode times and exit without queuing anything
+    """
 
     r_ = resolve.ResolveObjects()
     project_name = r_.project.GetName()
@@ -110,10 +682,31 @@ def main():
     jobs = handlers.handle_offline_proxies(jobs)
     logger.debug(f"[magenta]Remaining queuable:[/]\n{[x['file_name'] for x in jobs]}")
 
+    print()
+    jobs = handlers.handle_cached_proxies(jobs, unlinked_types=["Offline", "None"])
+    logger.debug(f"[magenta]Remaining queuable:[/]\n{[x['file_name'] for x in jobs]}")
+
     print("\n")
 
+    # Predict from past encodes how long this will take.
+    # Only a dry run waits on the broker to count workers.
+    workers = planner.get_worker_count(local_mode, inspect=dry_run)
+    plan = planner.plan_jobs(jobs, workers or 0)
+
+    if dry_run:
+        planner.print_plan(plan)
+        core.app_exit(0)
+
+    if workers is None:
+        estimate = f"about {progress.format_eta(plan['total'])} of encoding"
+    else:
+        estimate = (
+            f"about {progress.format_eta(plan['makespan'])} "
+            f"on {max(1, plan['workers'])} workers"
+        )
+
     # Alert user final queuable. Confirm.
-    handlers.handle_final_queuable(jobs)
+    handlers.handle_final_queuable(jobs, estimate=estimate)
 
     # Get output paths for queueable jobs
     for x in jobs:
@@ -133,54 +726,208 @@ def main():
 
     # Celery can't accept MPI (pyremoteobj)
     # Convert to string for later reference
-    jobs_with_mpi = []
+    media_pool_items = dict()
     for x in jobs:
-        jobs_with_mpi.append({str(x["media_pool_item"]): x["media_pool_item"]})
+        media_pool_items.update({str(x["media_pool_item"]): x["media_pool_item"]})
         x.update({"media_pool_item": str(x["media_pool_item"])})
 
-    tasks = add_queuer_data(
-        jobs,
+    # Publish settings once, jobs only carry the hash
+    profile = registry.get_profile(settings["proxy"], settings["paths"])
+    settings_hash = None if local_mode else registry.publish_profile(profile)
+
+    queuer_data = dict(
+        user=getpass.getuser(),
         project=project_name,
         timeline=timeline_name,
-        proxy_settings=settings["proxy"],
-        paths_settings=settings["paths"],
+        priority=priority_name,
+        deadline=deadline,
     )
 
+    if settings_hash:
+        tasks = add_queuer_data(jobs, settings_hash=settings_hash, **queuer_data)
+
+    else:
+        tasks = add_queuer_data(jobs, **queuer_data, **profile)
+
     print("\n")
 
-    job_group = queue_jobs(tasks)
+    if local_mode:
+        job_group, tasks = queue_local(tasks)
+
+    else:
+        tasks = scheduler.schedule_jobs(tasks)
+        job_group = queue_jobs(tasks)
+
+    # Task ids keep submission order
+    task_ids = job_group.task_ids
+    jobs_by_task_id = dict(zip(task_ids, tasks))
+
+    manifest.write_manifest(
+        job_group.id,
+        project_name,
+        timeline_name,
+        [{"task_id": k, "job": v} for k, v in zip(task_ids, tasks)],
+        profiles={settings_hash: profile} if settings_hash else None,
+        local=local_mode,
+    )
 
     core.notify(f"Started encoding job '{project_name} - {timeline_name}'")
-    print(f"[yellow]Waiting for job to finish. Feel free to minimize.[/]")
-    wait_jobs(job_group)
+    wait_and_link(
+        job_group,
+        jobs_by_task_id,
+        media_pool_items,
+        job_group.id,
+        progressive_link=progressive_link,
+    )
 
-    # Get media pool items back
-    logger.debug(f"[magenta]Restoring media-pool-items[/]")
 
-    for x, y in zip(jobs, jobs_with_mpi):
-        for k, v in y.items():
-            assert hasattr(v, "GetClipProperty()")
-            if x["media_pool_item"] == k:
-                x.update({"media_pool_item": v})
+def reattach(group_id=None, progressive_link: bool = True):
+    """Wait on and link a group queued by a previous, closed queuer session
 
-    try:
+    Args:
+        group_id: full or partial manifest group id, newest if None
+        progressive_link: link each proxy as soon as its encode finishes
+    """
 
-        unlinkable = link.link_proxies_with_mpi(
-            jobs,
-            linkable_types=["None"],
-            prompt_rerender=False,
-        )
-        assert len(unlinkable) == 0
+    manifest_ = manifest.load_manifest(group_id)
+    if not manifest_ or not manifest.require_broker(manifest_):
+        core.app_exit(1, -1)
 
-    except Exception as e:
+    jobs_by_task_id = {x["task_id"]: x["job"] for x in manifest_["tasks"]}
+    media_pool_items = recover_media_pool_items(
+        list(jobs_by_task_id.values()), manifest_["project"], manifest_["timeline"]
+    )
 
-        logger.error(f"[red]Couldn't link jobs. Link manually.[/]\nError: {e}")
+    print(
+        f"[cyan]Reattached to '{manifest_['project']} - {manifest_['timeline']}', "
+        f"{len(jobs_by_task_id)} jobs[/]\n"
+    )
+
+    wait_and_link(
+        manifest.get_group_result(manifest_),
+        jobs_by_task_id,
+        media_pool_items,
+        manifest_["group_id"],
+        progressive_link=progressive_link,
+    )
+
+
+def relink(group_id=None):
+    """Link proxies from a previously queued group whose output exists on disk
+
+    Doesn't rely on the result backend, since results may have long expired.
+
+    Args:
+        group_id: full or partial manifest group id, newest if None
+    """
+
+    manifest_ = manifest.load_manifest(group_id)
+    if not manifest_:
         core.app_exit(1, -1)
 
-    finally:
-        print("[bold][green]All linked up![/bold] Nothing to queue[/] :link:")
+    jobs = [x["job"] for x in manifest_["tasks"]]
+    linkable = [x for x in jobs if os.path.exists(x["proxy_media_path"])]
+
+    logger.info(f"[cyan]{len(linkable)}/{len(jobs)} proxies exist on disk[/]")
+
+    if not linkable:
+        print("[yellow]No finished proxies to link yet.[/]")
+        core.app_exit(0, -1)
+
+    media_pool_items = recover_media_pool_items(
+        linkable, manifest_["project"], manifest_["timeline"]
+    )
+    restore_media_pool_items(linkable, media_pool_items)
+
+    link.link_proxies_with_mpi(
+        linkable,
+        linkable_types=["Offline", "None"],
+        prompt_rerender=False,
+    )
+
+    core.app_exit(0)
+
+
+def cancel_group(group_id=None):
+    """Cancel the unfinished jobs of a previously queued group
+
+    Args:
+        group_id: full or partial manifest group id, newest if None
+    """
+
+    manifest_ = manifest.load_manifest(group_id)
+    if not manifest_ or not manifest.require_broker(manifest_):
+        core.app_exit(1, -1)
+
+    job_group = manifest.get_group_result(manifest_)
+
+    if not Confirm.ask(
+        f"[yellow]Cancel unfinished encodes of '{manifest_['project']} - "
+        f"{manifest_['timeline']}' ({manifest_['group_id']})?[/]"
+    ):
+        core.app_exit(0)
+
+    cancelled = cancel_jobs(job_group)
+
+    if not cancelled:
+        print("[green]Every job in the group has already finished[/]")
+        core.app_exit(0, -1)
+
+    for x in cancelled:
+        manifest.record_status(manifest_["group_id"], x, "REVOKED")
+
+    print(
+        f"[green]Cancelled {len(cancelled)}/{len(job_group)} encodes.[/]\n"
+        f"[yellow]Queue them again with [bold]'rprox retry {manifest_['group_id']}'[/bold][/]"
+    )
+    core.app_exit(0)
+
+
+def retry(group_id=None, progressive_link: bool = True):
+    """Resubmit only the failed tasks of a previously queued group, then wait and link
+
+    Args:
+        group_id: full or partial manifest group id, newest if None
+        progressive_link: link each proxy as soon as its encode finishes
+    """
+
+    manifest_ = manifest.load_manifest(group_id)
+    if not manifest_ or not manifest.require_broker(manifest_):
+        core.app_exit(1, -1)
+
+    retryable = manifest.get_retryable_tasks(manifest_)
+
+    if not retryable:
+        print("[green]No failed tasks to retry[/]")
+        core.app_exit(0, -1)
+
+    if not Confirm.ask(f"[yellow]Retry {len(retryable)} failed tasks?[/]"):
         core.app_exit(0)
 
+    # Published profiles may have expired since the group was queued
+    for profile in manifest_.get("profiles", {}).values():
+        registry.publish_profile(profile)
+
+    # Cancelled tasks that never started may still hold their jobs' keys
+    locks.release_tasks([x["task_id"] for x in retryable])
+
+    job_group = queue_jobs([x["job"] for x in retryable])
+    new_task_ids = dict(zip([x["task_id"] for x in retryable], job_group.task_ids))
+    manifest.replace_task_ids(manifest_, new_task_ids)
+
+    jobs_by_task_id = {new_task_ids[x["task_id"]]: x["job"] for x in retryable}
+    media_pool_items = recover_media_pool_items(
+        list(jobs_by_task_id.values()), manifest_["project"], manifest_["timeline"]
+    )
+
+    wait_and_link(
+        job_group,
+        jobs_by_task_id,
+        media_pool_items,
+        manifest_["group_id"],
+        progressive_link=progressive_link,
+    )
+
 
 if __name__ == "__main__":
     main()
@@ -1,13 +1,14 @@
 import imp
-import pathlib
 import logging
 import os
 import sys
+from typing import Union
 
 from rich import print
 
 from ..app.utils import core
 from ..settings.manager import SettingsManager
+from . import placement
 
 settings = SettingsManager()
 
@@ -136,6 +137,20 @@ def get_media_pool_items(track_items):
     return all_media_pool_items
 
 
+def get_media_pool_item_uuid(media_pool_item) -> Union[str, None]:
+    """Parse the UUID from a media pool item, or its string representation
+
+    Returns:
+        uuid(str): the UUID, or None if the item has none (invalid or internal media)
+    """
+
+    try:
+        return str(media_pool_item).split("UUID:")[1].split("]")[0]
+
+    except IndexError:
+        return None
+
+
 def get_resolve_timelines(project, active_timeline_first=True):
     """Return a list of all Resolve timeline objects in current project."""
 
@@ -191,12 +206,12 @@ def get_resolve_proxy_jobs(media_pool_items):
     for media_pool_item in media_pool_items:
 
         # Check media pool item is valid, get UUID
-        try:
+        mpi_uuid = get_media_pool_item_uuid(media_pool_item)
 
-            mpi_uuid = str(media_pool_item).split("UUID:")[1].split("]")[0]
+        if mpi_uuid:
             logger.debug(f"[magenta]Media Pool Item: {mpi_uuid}")
 
-        except:
+        else:
 
             logger.debug(
                 f"[magenta]Media Pool Item: 'None'[/]\n"
@@ -267,16 +282,8 @@ def get_resolve_proxy_jobs(media_pool_items):
                 )
                 continue
 
-        # Get expected proxy path
-        file_path = clip_properties["File Path"]
-        p = pathlib.Path(file_path)
-
-        proxy_dir = os.path.normpath(
-            os.path.join(
-                settings["paths"]["proxy_path_root"],
-                os.path.dirname(p.relative_to(*p.parts[:1])),
-            )
-        )
+        # Get expected proxy path, on whichever proxy root placement picks
+        proxy_dir = placement.place(clip_properties["File Path"])
 
         # TODO: These would definitely be nicer as class attributes
         # labels: enhancement
@@ -287,6 +294,7 @@ def get_resolve_proxy_jobs(media_pool_items):
             "file_path": cp["File Path"],
             "duration": cp["Duration"],
             "resolution": str(cp["Resolution"]).split("x"),
+            "codec": cp.get("Video Codec"),
             "frames": int(cp["Frames"]),
             "fps": float(cp["FPS"]),
             "h_flip": True if cp["H-FLIP"] == "On" else False,
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3.6
+# Order and route jobs to keep the whole farm busy
+
+import heapq
+import logging
+
+from ..app.utils import core
+from ..settings.manager import SettingsManager
+from ..worker import capabilities, locality
+from ..worker.utils import SHORT_LANE, get_queue, get_resolution
+
+settings = SettingsManager()
+
+core.install_rich_tracebacks()
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["app"]["loglevel"])
+
+
+def estimate_cost(job: dict) -> int:
+    """Estimate relative encode cost of a job as frames x source pixels.
+
+    Decode and scale dominate proxy encodes, both of which
+    scale with pixel count, so this orders jobs well without needing
+    any history of real encode times.
+    """
+
+    width, height = get_resolution(job)
+    return int(job["frames"]) * width * height
+
+
+def get_duration(job: dict) -> float:
+    """Job duration in seconds, from frames and framerate"""
+
+    fps = float(job.get("fps") or 0)
+    return int(job["frames"]) / fps if fps else 0.0
+
+
+def order_longest_first(jobs: list) -> list:
+    """Sort jobs longest-processing-time first (LPT).
+
+    Workers take jobs from the queue in submission order. If a long clip is
+    submitted last, one worker finishes it while the rest sit idle.
+    Submitting the longest first lets short jobs fill in the gaps at the end.
+    """
+
+    return sorted(jobs, key=estimate_cost, reverse=True)
+
+
+def is_short(job: dict, threshold: float) -> bool:
+    """Return True if the job is shorter than threshold seconds. 0 disables"""
+
+    return bool(threshold) and get_duration(job) < threshold
+
+
+def schedule_jobs(jobs: list) -> list:
+    """Order jobs for submission and tag each with its destination queue
+
+    Jobs shorter than the configured threshold go to the short lane,
+    served by dedicated worker slots, so they aren't stuck behind long clips.
+    Jobs longer than the segment threshold are marked for segment-parallel encoding.
+    Jobs shorter than the batch threshold are marked to be packed into batch tasks.
+    With capability routing, high resolution jobs go to a lane only
+    workers capable of them take from, whether short or not, and
+    sources needing a special decoder only to workers that have it.
+    With locality routing, jobs then go to the local-access version of
+    their lane, taken by workers that read the source locally.
+
+    Args:
+        jobs: queuable jobs
+
+    Returns:
+        jobs: the same jobs in submission order, each with a `queue` key
+    """
+
+    if settings["scheduling"]["longest_first"]:
+        jobs = order_longest_first(jobs)
+
+    main_queue = get_queue()
+    short_queue = get_queue(SHORT_LANE)
+    threshold = settings["scheduling"]["short_job_threshold"]
+    segment_threshold = settings["scheduling"]["segment_threshold"]
+    batch_threshold = settings["scheduling"]["batch_threshold"]
+
+    advertised = None
+    if capabilities.is_enabled() or locality.is_enabled():
+        advertised = capabilities.get_advertised()
+        logger.debug(f"[magenta]{len(advertised)} workers advertise capabilities[/]")
+
+    for x in jobs:
+
+        x.update({"queue": short_queue if is_short(x, threshold) else main_queue})
+
+        # Demanding sources only go to workers that can handle them
+        if capabilities.is_enabled():
+            x.update({"queue": capabilities.route_job(x, advertised, x["queue"])})
+
+        # Keep source reads off the WAN where we can
+        if locality.is_enabled():
+            x.update({"queue": locality.route_job(x, advertised, x["queue"])})
+
+        # Long sources are split and encoded across workers
+        if segment_threshold and get_duration(x) > segment_threshold:
+            x.update({"segment_duration": settings["scheduling"]["segment_duration"]})
+
+        # Tiny clips cost more in task overhead than encoding
+        elif is_short(x, batch_threshold):
+            x.update({"batch": True})
+
+    segmented = [x for x in jobs if x.get("segment_duration")]
+    if segmented:
+        logger.info(f"[cyan]Splitting {len(segmented)} long jobs into segments[/]")
+
+    batched = [x for x in jobs if x.get("batch")]
+    if batched:
+        logger.info(f"[cyan]Packing {len(batched)} very short jobs into batches[/]")
+
+    short_jobs = [x for x in jobs if x["queue"] == short_queue]
+    if short_jobs:
+        logger.info(f"[cyan]Routing {len(short_jobs)} short jobs to the short lane[/]")
+
+    routed = [x for x in jobs if x["queue"] not in [main_queue, short_queue]]
+    if routed:
+        logger.info(
+            f"[cyan]Routing {len(routed)} jobs to capable or local workers only[/]"
+        )
+
+    return jobs
+
+
+def simulate_makespan(
+    durations: list,
+    workers: int,
+    short_threshold: float = 0,
+    short_workers: int = 0,
+) -> dict:
+    """Simulate a FIFO worker pool encoding jobs in the given order.
+
+    General workers take from the main queue first, then the short lane.
+    Dedicated short workers only take from the short lane.
+
+    Args:
+        durations: job durations in seconds, in submission order
+        workers: count of general workers
+        short_threshold: jobs shorter than this go to the short lane. 0 disables
+        short_workers: count of workers dedicated to the short lane
+
+    Returns:
+        dict:
+            - makespan: seconds until the last job finishes
+            - finishes: finish time of each job, in the same order as `durations`
+    """
+
+    def _is_short(duration):
+        return bool(short_threshold) and duration < short_threshold
+
+    # Reversed so we can pop from the front of each queue cheaply
+    main_lane = [i for i, x in enumerate(durations) if not _is_short(x)][::-1]
+    short_lane = [i for i, x in enumerate(durations) if _is_short(x)][::-1]
+
+    # (time free, is dedicated short worker, worker index)
+    pool = [(0.0, False, i) for i in range(workers)]
+    pool += [(0.0, True, workers + i) for i in range(short_workers)]
+    heapq.heapify(pool)
+
+    finishes = [0.0] * len(durations)
+
+    while pool and (main_lane or short_lane):
+
+        free_at, dedicated, index = heapq.heappop(pool)
+
+        if not dedicated and main_lane:
+            job = main_lane.pop()
+        elif short_lane:
+            job = short_lane.pop()
+        else:
+            # Dedicated worker with nothing left it can take
+            continue
+
+        finishes[job] = free_at + durations[job]
+        heapq.heappush(pool, (finishes[job], dedicated, index))
+
+    return {
+        "makespan": max(finishes) if finishes else 0.0,
+        "finishes": finishes,
+    }
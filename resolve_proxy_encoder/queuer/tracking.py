@@ -0,0 +1,191 @@
+#!/usr/bin/env python3.6
+# Track very large job groups without a result object per task
+
+import logging
+import time
+from typing import Union
+
+from celery import states
+from celery.backends.redis import RedisBackend
+
+from ..app.utils import core
+from ..settings.manager import SettingsManager
+from ..worker.celery import app
+
+settings = SettingsManager()
+
+core.install_rich_tracebacks()
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["app"]["loglevel"])
+
+# Keys fetched per round trip when catching up on results
+CATCH_UP_CHUNK = 1000
+
+# Seconds between catch-up sweeps for results published while we weren't listening
+CATCH_UP_INTERVAL = 30
+
+
+class JobGroupHandle:
+    """Lightweight handle on a queued group, tracked by task id alone.
+
+    Celery's `GroupResult` holds an `AsyncResult` per task and subscribes
+    to a channel per task, which gets slow with tens of thousands of tasks.
+    With a Redis result backend this instead pattern-subscribes once to all
+    result channels and filters by task id, then sweeps any results it missed
+    with chunked `MGET`s. Other backends fall back to polling each task in order.
+
+    Args:
+        id: group id
+        task_ids: task ids in submission order
+    """
+
+    # Tasks outlive the queuer, so a closed queuer can pick the group up again
+    reattachable = True
+
+    def __init__(self, id: str, task_ids: list):
+
+        self.id = id
+        self.task_ids = list(task_ids)
+        self.backend = app.backend
+
+    def __len__(self):
+        return len(self.task_ids)
+
+    def __repr__(self):
+        return f"<JobGroupHandle: {self.id} [{len(self.task_ids)} tasks]>"
+
+    @property
+    def client(self) -> Union[object, None]:
+        """Result backend Redis client, or None if results aren't in Redis"""
+
+        if isinstance(self.backend, RedisBackend):
+            return self.backend.client
+
+        return None
+
+    def _decode(self, payload) -> dict:
+        return self.backend.decode_result(payload)
+
+    def _catch_up(self, pending: set, on_message=None):
+        """Fetch stored states of pending tasks in chunks, yielding finished ones"""
+
+        task_ids = [x for x in self.task_ids if x in pending]
+
+        for i in range(0, len(task_ids), CATCH_UP_CHUNK):
+
+            chunk = task_ids[i : i + CATCH_UP_CHUNK]
+            keys = [self.backend.get_key_for_task(x) for x in chunk]
+
+            for task_id, payload in zip(chunk, self.client.mget(keys)):
+
+                if payload is None:
+                    continue
+
+                meta = self._decode(payload)
+                meta.setdefault("task_id", task_id)
+
+                if on_message:
+                    on_message(meta)
+
+                if meta["status"] in states.READY_STATES:
+                    pending.discard(task_id)
+                    yield task_id, meta["status"], meta["result"]
+
+    def get_unfinished(self) -> list:
+        """Get ids of tasks that haven't finished yet, in submission order"""
+
+        if self.client is None:
+            return [
+                x
+                for x in self.task_ids
+                if app.AsyncResult(x).state not in states.READY_STATES
+            ]
+
+        unfinished = []
+
+        for i in range(0, len(self.task_ids), CATCH_UP_CHUNK):
+
+            chunk = self.task_ids[i : i + CATCH_UP_CHUNK]
+            keys = [self.backend.get_key_for_task(x) for x in chunk]
+
+            for task_id, payload in zip(chunk, self.client.mget(keys)):
+
+                if payload is None:
+                    unfinished.append(task_id)
+                    continue
+
+                if self._decode(payload)["status"] not in states.READY_STATES:
+                    unfinished.append(task_id)
+
+        return unfinished
+
+    def iter_completed(self, on_message=None, on_interval=None, timeout=1.0):
+        """Yield each task's result as soon as it finishes, regardless of queue order.
+
+        Args:
+            on_message: optional callable, called with every task state message
+             as it's published, including progress states
+            on_interval: optional callable, called between checks for new messages
+            timeout: seconds to wait for a message before calling `on_interval`
+
+        Yields:
+            (task_id, status, result) - result is the exception instance if the task failed
+        """
+
+        if self.client is None:
+            yield from self._iter_polling(on_interval)
+            return
+
+        pending = set(self.task_ids)
+        pattern = self.backend.get_key_for_task("*")
+
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(pattern)
+
+        try:
+
+            # Anything that finished before we subscribed
+            yield from self._catch_up(pending, on_message)
+            last_catch_up = time.monotonic()
+
+            while pending:
+
+                message = pubsub.get_message(timeout=timeout)
+
+                if message and message["type"] == "pmessage":
+
+                    meta = self._decode(message["data"])
+                    task_id = meta.get("task_id")
+
+                    if task_id in pending:
+
+                        if on_message:
+                            on_message(meta)
+
+                        if meta["status"] in states.READY_STATES:
+                            pending.discard(task_id)
+                            yield task_id, meta["status"], meta["result"]
+
+                if on_interval:
+                    on_interval()
+
+                # Pub/sub is fire and forget, so sweep for anything dropped
+                if time.monotonic() - last_catch_up > CATCH_UP_INTERVAL:
+                    yield from self._catch_up(pending, on_message)
+                    last_catch_up = time.monotonic()
+
+        finally:
+
+            pubsub.punsubscribe()
+            pubsub.close()
+
+    def _iter_polling(self, on_interval=None):
+        """Collect results one at a time, in submission order"""
+
+        for task_id in self.task_ids:
+
+            task = app.AsyncResult(task_id)
+            result = task.get(
+                propagate=False, disable_sync_subtasks=False, on_interval=on_interval
+            )
+            yield task_id, task.status, result
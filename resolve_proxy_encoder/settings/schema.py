@@ -1,7 +1,7 @@
 import re
 from commonregex import link
 import os
-from schema import Schema, And, Optional
+from schema import Schema, And, Optional, Or
 
 
 settings_schema = Schema(
@@ -15,6 +15,11 @@ settings_schema = Schema(
         },
         "paths": {
             "proxy_path_root": lambda p: os.path.exists(p),
+            "proxy_path_roots": And(
+                list, lambda l: all(map(lambda s: isinstance(s, str), l))
+            ),
+            "proxy_placement": lambda s: s in ["hash", "free_space", "write_speed"],
+            "proxy_cache": bool,
             "ffmpeg_logfile_path": lambda p: os.path.exists(os.path.dirname(p)),
         },
         "proxy": {
@@ -35,8 +40,14 @@ settings_schema = Schema(
             "pix_fmt": str,
             "audio_codec": str,
             "audio_samplerate": str,
+            "audio_copy": bool,
+            "audio_tracks": lambda s: s in ["first", "all", "downmix", "none"],
             Optional("misc_args"): list,
             "ext": And(str, lambda s: s.startswith(".")),
+            "renditions": And(
+                list,
+                lambda l: all(map(lambda d: isinstance(d, dict) and "name" in d, l)),
+            ),
         },
         "filters": {
             "extension_whitelist": And(
@@ -44,12 +55,33 @@ settings_schema = Schema(
             ),
             "framerate_whitelist": And(list, lambda l: all(map(lambda s: int(s), l))),
         },
+        "scheduling": {
+            "longest_first": bool,
+            "short_job_threshold": And(Or(int, float), lambda n: n >= 0),
+            "segment_threshold": And(Or(int, float), lambda n: n >= 0),
+            "segment_duration": And(Or(int, float), lambda n: n > 0),
+            "batch_threshold": And(Or(int, float), lambda n: n >= 0),
+            "batch_size": And(int, lambda n: n > 0),
+            "default_priority": lambda s: s in ["urgent", "high", "normal", "low"],
+            "deadline_high_within": And(Or(int, float), lambda n: n >= 0),
+            "deadline_urgent_within": And(Or(int, float), lambda n: n >= 0),
+            "fair_share": bool,
+            "fair_share_key": lambda s: s in ["user", "project"],
+            "fair_share_weights": And(
+                dict, lambda d: all(map(lambda w: float(w) > 0, d.values()))
+            ),
+            "fair_share_depth": And(int, lambda n: n > 0),
+            "capability_routing": bool,
+            "locality_routing": bool,
+        },
         "celery": {
             "host_address": str,
             "broker_url": str,
             "flower_url": str,
             "result_backend": str,
             "result_expires": int,
+            "compact_serialization": bool,
+            "compression_threshold": And(int, lambda n: n >= 0),
         },
         "worker": {
             "loglevel": lambda s: s
@@ -57,6 +89,23 @@ settings_schema = Schema(
             "concurrency": int,
             "prefetch_multiplier": int,
             "max_tasks_per_child": int,
+            "short_queue_workers": And(int, lambda n: n >= 0),
+            "local_workers": And(int, lambda n: n >= 0),
+            "ffmpeg_threads": And(int, lambda n: n >= 0),
+            "pin_cpus": bool,
+            "read_slots": And(
+                dict, lambda d: all(map(lambda n: int(n) > 0, d.values()))
+            ),
+            "write_slots": And(
+                dict, lambda d: all(map(lambda n: int(n) > 0, d.values()))
+            ),
+            "storage_roots": And(
+                list, lambda l: all(map(lambda s: isinstance(s, str), l))
+            ),
+            "stall_timeout": And(Or(int, float), lambda n: n >= 0),
+            "time_limit_factor": And(Or(int, float), lambda n: n >= 0),
+            "scratch_dir": str,
+            "publish_rate_limit": And(Or(int, float), lambda n: n >= 0),
             "terminal_args": list,
             "celery_args": list,
         },
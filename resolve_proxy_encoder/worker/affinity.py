@@ -0,0 +1,205 @@
+import glob
+import logging
+import os
+from functools import lru_cache
+from typing import Union
+
+from ..app.utils import core
+from ..settings.manager import SettingsManager
+
+core.install_rich_tracebacks()
+
+settings = SettingsManager()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["worker"]["loglevel"])
+
+# Set by 'rprox work' on each worker it starts: workers on this machine, and which this is
+HOST_WORKERS_ENV = "RPROX_HOST_WORKERS"
+WORKER_SLOT_ENV = "RPROX_WORKER_SLOT"
+
+# Where Linux lists each NUMA node's CPUs
+NUMA_NODE_CPULISTS = "/sys/devices/system/node/node*/cpulist"
+
+
+def get_available_cpus() -> list:
+    """Get the CPUs this process may run on"""
+
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cpulist(cpulist: str) -> list:
+    """Parse a Linux cpulist, like '0-7,16-23', into CPU numbers"""
+
+    cpus = []
+
+    for x in cpulist.strip().split(","):
+
+        if not x:
+            continue
+
+        start, _, end = x.partition("-")
+        cpus += list(range(int(start), int(end or start) + 1))
+
+    return cpus
+
+
+@lru_cache(maxsize=1)
+def get_numa_nodes() -> list:
+    """Get the available CPUs on each NUMA node.
+
+    Returns:
+        nodes: list of sorted CPU lists. Just one of every available CPU
+         if the machine has one node, or its nodes can't be read.
+    """
+
+    available = set(get_available_cpus())
+    nodes = []
+
+    for path in sorted(glob.glob(NUMA_NODE_CPULISTS)):
+
+        try:
+            with open(path) as file:
+                cpus = [x for x in parse_cpulist(file.read()) if x in available]
+
+        except (OSError, ValueError):
+            continue
+
+        if cpus:
+            nodes.append(cpus)
+
+    return nodes or [sorted(available)]
+
+
+def get_host_workers() -> int:
+    """Get how many workers 'rprox work' started on this machine"""
+
+    try:
+        return max(1, int(os.environ.get(HOST_WORKERS_ENV) or 1))
+    except ValueError:
+        return 1
+
+
+def get_concurrency() -> int:
+    """Get how many encodes each worker runs at once"""
+
+    return max(1, settings["worker"]["concurrency"])
+
+
+def get_worker_slot() -> Union[int, None]:
+    """Get which of this machine's workers this is, from 0. None if not started by 'rprox work'."""
+
+    try:
+        return int(os.environ[WORKER_SLOT_ENV])
+    except (KeyError, ValueError):
+        return None
+
+
+def get_affinity(
+    slot: Union[int, None] = None, workers: Union[int, None] = None
+) -> Union[set, None]:
+    """Get the CPUs a worker's encodes are pinned to.
+
+    Workers are spread round robin across NUMA nodes, and each gets
+    an equal share of its node's CPUs, so no encode spans two nodes.
+    A worker's concurrent encodes share its CPUs.
+
+    Args:
+        slot: which of the machine's workers. Defaults to this worker's.
+        workers: workers on the machine. Defaults to `get_host_workers`.
+
+    Returns:
+        cpus: set of CPU numbers, or None if the worker's slot isn't known
+    """
+
+    slot = get_worker_slot() if slot is None else slot
+    if slot is None:
+        return None
+
+    workers = workers or get_host_workers()
+    slot %= workers
+
+    nodes = get_numa_nodes()
+    node = nodes[slot % len(nodes)]
+
+    # Workers sharing this node, and this one's place among them
+    sharing = len(range(slot % len(nodes), workers, len(nodes)))
+    index = slot // len(nodes)
+
+    share = max(1, len(node) // sharing)
+    start = (index * share) % len(node)
+
+    return set(node[start : start + share])
+
+
+def is_pinning() -> bool:
+    return bool(settings["worker"]["pin_cpus"]) and hasattr(os, "sched_setaffinity")
+
+
+def get_thread_count(
+    slot: Union[int, None] = None, workers: Union[int, None] = None
+) -> int:
+    """Get the threads each FFmpeg encode may use.
+
+    `ffmpeg_threads` if set. Otherwise an equal share, between the worker's
+    concurrent encodes, of its pinned CPUs, or of the machine's CPUs split
+    between all of its workers' encodes. Left to itself, FFmpeg starts
+    threads for every core in every encode.
+
+    Args:
+        slot: which of the machine's workers. Defaults to this worker's.
+        workers: workers on the machine. Defaults to `get_host_workers`.
+    """
+
+    configured = settings["worker"]["ffmpeg_threads"]
+    if configured:
+        return configured
+
+    if is_pinning():
+        cpus = get_affinity(slot, workers)
+        if cpus:
+            return max(1, len(cpus) // get_concurrency())
+
+    encodes = (workers or get_host_workers()) * get_concurrency()
+    return max(1, len(get_available_cpus()) // encodes)
+
+
+def get_input_thread_args(threads: int) -> list:
+    """Get FFmpeg args limiting decode and filter threads. Go before the input."""
+
+    threads = str(threads)
+    return [
+        "-threads",
+        threads,
+        "-filter_threads",
+        threads,
+        "-filter_complex_threads",
+        threads,
+    ]
+
+
+def get_output_thread_args(threads: int) -> list:
+    """Get FFmpeg args limiting an output's encoder threads. Go before the output."""
+
+    return ["-threads", str(threads)]
+
+
+def get_preexec_fn(slot: Union[int, None] = None, workers: Union[int, None] = None):
+    """Get a function that pins a subprocess to the worker's CPUs, for `subprocess.Popen`.
+
+    Pinned before FFmpeg starts, so every thread it starts is pinned too.
+    None if pinning is disabled, unsupported here, or the worker's slot isn't known.
+    """
+
+    if not is_pinning():
+        return None
+
+    cpus = get_affinity(slot, workers)
+    if not cpus:
+        return None
+
+    logger.debug(f"[magenta]Pinning FFmpeg to CPUs {sorted(cpus)}[/]")
+    return lambda: os.sched_setaffinity(0, cpus)
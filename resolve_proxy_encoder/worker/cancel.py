@@ -0,0 +1,120 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+from ..app.utils import core
+from ..settings.manager import SettingsManager
+from .utils import get_redis
+
+core.install_rich_tracebacks()
+
+settings = SettingsManager()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["worker"]["loglevel"])
+
+# Set for each cancelled task id, so workers stop it wherever it's at
+CANCEL_KEY = "rprox:cancel:{}"
+
+# Seconds a cancellation is kept. Long enough for any queued copy to be picked up.
+CANCEL_TTL = 24 * 60 * 60
+
+# Seconds between checks for cancellation while encoding
+CANCEL_POLL_INTERVAL = 2
+
+
+class Cancelled(Exception):
+    """The task's job group was cancelled"""
+
+
+def request_cancel(task_ids: list):
+    """Flag tasks as cancelled for any worker that runs, or is running, them"""
+
+    r = get_redis()
+    if r is None:
+        return
+
+    with r.pipeline(transaction=False) as pipe:
+
+        for x in task_ids:
+            pipe.set(CANCEL_KEY.format(x), 1, ex=CANCEL_TTL)
+
+        pipe.execute()
+
+
+def is_cancelled(task_ids: list) -> bool:
+    """Check if any of the given task ids have been cancelled"""
+
+    r = get_redis()
+    if r is None or not task_ids:
+        return False
+
+    return any(r.mget([CANCEL_KEY.format(x) for x in task_ids]))
+
+
+def check(task_ids: list):
+    """Raise `Cancelled` if any of the given task ids have been cancelled"""
+
+    if is_cancelled(task_ids):
+        raise Cancelled(f"Task {task_ids[0]} was cancelled")
+
+
+@contextmanager
+def watch(task_ids: list, on_cancel):
+    """Call `on_cancel` once if any of the task ids are cancelled while the block runs
+
+    Checked every `CANCEL_POLL_INTERVAL` seconds in the background.
+
+    Yields:
+        cancelled: `threading.Event`, set once `on_cancel` has been called
+    """
+
+    cancelled = threading.Event()
+
+    if get_redis() is None or not task_ids:
+        yield cancelled
+        return
+
+    stop_watching = threading.Event()
+
+    def poll():
+
+        while not stop_watching.wait(CANCEL_POLL_INTERVAL):
+
+            try:
+                if not is_cancelled(task_ids):
+                    continue
+
+            except Exception as e:
+                logger.warning(f"[yellow]Couldn't check for cancellation[/]\n{e}")
+                continue
+
+            logger.warning("[yellow]Job was cancelled. Stopping encode...[/]")
+            cancelled.set()
+            on_cancel()
+            return
+
+    watcher = threading.Thread(target=poll, daemon=True)
+    watcher.start()
+
+    try:
+        yield cancelled
+
+    finally:
+        stop_watching.set()
+        watcher.join()
+
+
+def remove_partial(path: str):
+    """Delete a partially written output, if there is one"""
+
+    try:
+        os.remove(path)
+        logger.info(f"[yellow]Removed partial output '{path}'[/]")
+
+    except FileNotFoundError:
+        pass
+
+    except OSError as e:
+        logger.warning(f"[yellow]Couldn't remove partial output '{path}'[/]\n{e}")
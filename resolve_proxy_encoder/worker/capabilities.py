@@ -0,0 +1,508 @@
+import json
+import logging
+import os
+import platform
+import re
+import subprocess
+import time
+from typing import Union
+
+from celery.signals import heartbeat_sent, task_prerun, worker_ready, worker_shutdown
+
+from ..app.utils import core
+from ..settings.manager import USER_SETTINGS_FILE, SettingsManager
+from . import locality
+from .utils import CAPABILITY_LANES, LANES_KEY, get_queue, get_redis, get_resolution
+
+core.install_rich_tracebacks()
+
+settings = SettingsManager()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["worker"]["loglevel"])
+
+# Capability classes, least demanding first. The first is served by the main queue.
+CAPABILITY_CLASSES = ["hd", *CAPABILITY_LANES]
+
+# Most source pixels a class handles. Anything bigger needs the next class up.
+CLASS_MAX_PIXELS = {"hd": 2560 * 1440, "uhd": 4096 * 2304}
+
+# Source codecs, as Resolve names them, that need a decoder stock FFmpeg builds lack
+SOURCE_DECODERS = {
+    "Blackmagic RAW": "braw",
+    "ProRes RAW": "prores_raw",
+    "RED": "r3d",
+    "ARRIRAW": "arriraw",
+    "X-OCN": "xocn",
+}
+
+# What a worker needs to join a class. Measured speed is 1080p frames per second.
+CLASS_REQUIREMENTS = {
+    "uhd": {"cores": 8, "memory_gb": 16, "encode_fps": 50},
+    "8k": {"cores": 16, "memory_gb": 32, "encode_fps": 100},
+}
+
+# Workers started by 'rprox work' share one probe per machine
+PROBE_CACHE_FILE = os.path.join(
+    os.path.dirname(USER_SETTINGS_FILE), "capabilities.json"
+)
+
+# Seconds a cached probe is trusted before probing again
+PROBE_MAX_AGE = 24 * 60 * 60
+
+# Seconds an advertisement outlives its last refresh. Busy solo workers
+# can't refresh mid-encode, so this comfortably covers a long encode.
+ADVERTISE_TTL = 6 * 60 * 60
+ADVERTISE_KEY = "rprox:capabilities:{}"
+
+# Seconds between refreshes from the same worker
+ADVERTISE_INTERVAL = 60
+
+# Frames encoded to measure speed
+SPEED_TEST_FRAMES = 50
+
+_advertisement = None
+_last_advertised = 0.0
+
+
+def is_enabled() -> bool:
+    """Advertisements live in Redis, so routing needs it"""
+
+    return settings["scheduling"]["capability_routing"] and get_redis() is not None
+
+
+def is_advertising() -> bool:
+    """Workers only probe and advertise if something routes by it"""
+
+    return (
+        settings["scheduling"]["capability_routing"]
+        or settings["scheduling"]["locality_routing"]
+    )
+
+
+def probe_encoders() -> list:
+    """Get the encoders this machine's FFmpeg build supports"""
+
+    try:
+        output = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        ).stdout.decode("utf-8", "replace")
+
+    except OSError:
+        return []
+
+    # e.g. ' V....D dnxhd                VC3/DNxHD'
+    return re.findall(r"^ [VAS][\w.]{5} (\S+)", output, re.MULTILINE)
+
+
+def probe_decoders() -> list:
+    """Get the decoders this machine's FFmpeg build supports"""
+
+    try:
+        output = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-decoders"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        ).stdout.decode("utf-8", "replace")
+
+    except OSError:
+        return []
+
+    # e.g. ' VFS..D prores               Apple ProRes (iCodec Pro)'
+    return re.findall(r"^ [VAS][\w.]{5} (\S+)", output, re.MULTILINE)
+
+
+def probe_ffmpeg_version() -> Union[str, None]:
+    """Get FFmpeg's version string, or None if it isn't installed"""
+
+    try:
+        output = subprocess.run(
+            ["ffmpeg", "-version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        ).stdout.decode("utf-8", "replace")
+
+    except OSError:
+        return None
+
+    match = re.match(r"ffmpeg version (\S+)", output)
+    return match.group(1) if match else None
+
+
+def probe_memory_gb() -> Union[float, None]:
+    """Get total physical memory in GB, or None if it can't be read"""
+
+    try:
+
+        if platform.system() == "Windows":
+
+            import ctypes
+
+            class MEMORYSTATUSEX(ctypes.Structure):
+                _fields_ = [
+                    ("dwLength", ctypes.c_ulong),
+                    ("dwMemoryLoad", ctypes.c_ulong),
+                    ("ullTotalPhys", ctypes.c_ulonglong),
+                    ("ullAvailPhys", ctypes.c_ulonglong),
+                    ("ullTotalPageFile", ctypes.c_ulonglong),
+                    ("ullAvailPageFile", ctypes.c_ulonglong),
+                    ("ullTotalVirtual", ctypes.c_ulonglong),
+                    ("ullAvailVirtual", ctypes.c_ulonglong),
+                    ("sullAvailExtendedVirtual", ctypes.c_ulonglong),
+                ]
+
+            status = MEMORYSTATUSEX()
+            status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+            ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status))
+            total = status.ullTotalPhys
+
+        else:
+            total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+    except (AttributeError, OSError, ValueError):
+        return None
+
+    return round(total / 1024**3, 1)
+
+
+def measure_encode_speed(proxy_settings: dict) -> Union[float, None]:
+    """Time a short synthetic 1080p encode with the proxy codec, in frames per second
+
+    Returns:
+        fps: measured speed, or None if the encode failed
+    """
+
+    command = [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc=size=1920x1080:rate=25,trim=end_frame={SPEED_TEST_FRAMES}",
+        "-c:v",
+        proxy_settings["codec"],
+        "-profile:v",
+        proxy_settings["profile"],
+        "-pix_fmt",
+        proxy_settings["pix_fmt"],
+        "-vf",
+        f"scale=-2:{proxy_settings['vertical_res']}",
+        "-f",
+        "null",
+        "-",
+    ]
+
+    started = time.monotonic()
+
+    try:
+        process = subprocess.run(
+            command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+    except OSError:
+        return None
+
+    if process.returncode != 0:
+        return None
+
+    return round(SPEED_TEST_FRAMES / (time.monotonic() - started), 1)
+
+
+def get_capability_class(capabilities: dict) -> str:
+    """Get the most demanding class a machine meets every requirement of.
+
+    Unknown measurements don't count against it, so a machine that
+    couldn't be fully probed is judged on what could be.
+    """
+
+    best = CAPABILITY_CLASSES[0]
+
+    for name in CAPABILITY_CLASSES[1:]:
+
+        for key, minimum in CLASS_REQUIREMENTS[name].items():
+            if capabilities.get(key) is not None and capabilities[key] < minimum:
+                return best
+
+        best = name
+
+    return best
+
+
+def get_cached_probe() -> Union[dict, None]:
+    """Load the last probe, however old, without probing again"""
+
+    try:
+        with open(PROBE_CACHE_FILE) as file:
+            return json.load(file)
+
+    except (OSError, ValueError):
+        return None
+
+
+def probe(use_cache: bool = True) -> dict:
+    """Probe this machine's capabilities, or load a recent probe.
+
+    Args:
+        use_cache: reuse the last probe if it's recent. Set False to probe again.
+
+    Returns:
+        capabilities: FFmpeg version, encoders and decoders, cores, memory,
+         measured encode speed and the resulting capability class,
+         and read throughput from each storage root the worker reaches
+    """
+
+    storage_roots = settings["worker"]["storage_roots"]
+
+    if use_cache:
+
+        try:
+            with open(PROBE_CACHE_FILE) as file:
+                cached = json.load(file)
+
+            if (
+                time.time() - cached["probed_at"] < PROBE_MAX_AGE
+                and list(cached["storage"]) == storage_roots
+                and "decoders" in cached
+            ):
+                return cached
+
+        except (OSError, ValueError, KeyError):
+            pass
+
+    logger.info("[cyan]Probing worker capabilities...[/]")
+
+    capabilities = {
+        "host": platform.node(),
+        "ffmpeg_version": probe_ffmpeg_version(),
+        "encoders": probe_encoders(),
+        "decoders": probe_decoders(),
+        "cores": os.cpu_count(),
+        "memory_gb": probe_memory_gb(),
+        "encode_fps": measure_encode_speed(settings["proxy"]),
+        "storage": locality.probe_storage(storage_roots),
+        "probed_at": time.time(),
+    }
+    capabilities.update({"capability_class": get_capability_class(capabilities)})
+
+    try:
+        os.makedirs(os.path.dirname(PROBE_CACHE_FILE), exist_ok=True)
+        with open(PROBE_CACHE_FILE, "w") as file:
+            json.dump(capabilities, file)
+
+    except OSError as e:
+        logger.warning(f"[yellow]Couldn't cache capabilities[/]\n{e}")
+
+    logger.info(
+        f"[cyan]{capabilities['cores']} cores, {capabilities['memory_gb']} GB, "
+        f"{capabilities['encode_fps']} fps at 1080p. "
+        f"Capability class: '{capabilities['capability_class']}'[/]"
+    )
+
+    return capabilities
+
+
+def get_class_queues(capability_class: str) -> list:
+    """Get the capability lanes a worker of this class takes jobs from.
+
+    A worker takes every class up to its own, so demanding jobs
+    can always fall back to the most capable machines.
+    """
+
+    index = CAPABILITY_CLASSES.index(capability_class)
+    return [get_queue(x) for x in CAPABILITY_CLASSES[1 : index + 1]]
+
+
+def get_decoder_lane(decoder: str) -> str:
+    """Get the lane name for jobs whose sources need a special decoder"""
+
+    return "dec-" + re.sub(r"[^\w-]", "_", decoder)
+
+
+def get_decoder_queue(queue: str, decoder: str) -> str:
+    """Get the version of a queue for sources needing `decoder`.
+
+    Keeps the queue's own lane, so short or capability routing still applies
+    to workers that can decode the source.
+    """
+
+    main_queue = get_queue()
+    suffix = queue[len(main_queue) :] if queue.startswith(main_queue) else ""
+    return get_queue(get_decoder_lane(decoder)) + suffix
+
+
+def get_decoder_queues(queues: list, decoders: list) -> list:
+    """Get the decoder versions of a worker's queues, for every special decoder it has"""
+
+    special = [x for x in SOURCE_DECODERS.values() if x in decoders]
+    return [get_decoder_queue(queue, x) for x in special for queue in queues]
+
+
+def get_source_decoder(job: dict) -> Union[str, None]:
+    """Get the special decoder a job's source codec needs, or None if any FFmpeg will do"""
+
+    codec = job.get("codec") or ""
+
+    for name, decoder in SOURCE_DECODERS.items():
+        if re.search(rf"\b{re.escape(name)}\b", codec, re.IGNORECASE):
+            return decoder
+
+    return None
+
+
+def advertise(hostname: str, capabilities: dict, queues: list):
+    """Publish what a worker can do, so queuers route jobs it can handle.
+
+    Its queues are registered too, so queue maintenance covers them.
+    """
+
+    r = get_redis()
+    if r is None:
+        return
+
+    with r.pipeline() as pipe:
+
+        pipe.set(
+            ADVERTISE_KEY.format(hostname),
+            json.dumps(dict(capabilities, worker=hostname, queues=queues)),
+            ex=ADVERTISE_TTL,
+        )
+        if queues:
+            pipe.sadd(LANES_KEY, *queues)
+
+        pipe.execute()
+
+
+def get_advertised() -> list:
+    """Get every live worker's advertised capabilities"""
+
+    r = get_redis()
+    if r is None:
+        return []
+
+    keys = list(r.scan_iter(match=ADVERTISE_KEY.format("*"), count=1000))
+    if not keys:
+        return []
+
+    return [json.loads(x) for x in r.mget(keys) if x is not None]
+
+
+def get_job_class(job: dict) -> str:
+    """Get the least capable class that can encode a job's source resolution"""
+
+    width, height = get_resolution(job)
+
+    for name in CAPABILITY_CLASSES[:-1]:
+        if width * height <= CLASS_MAX_PIXELS[name]:
+            return name
+
+    return CAPABILITY_CLASSES[-1]
+
+
+def route_job(job: dict, advertised: list, queue: str) -> str:
+    """Get the queue a job should go to, for workers able to encode it.
+
+    Jobs go to their own class's lane, where every worker of that class
+    or above takes them. Sources needing a special decoder go to that
+    decoder's version of the lane, taken only by workers that have it.
+    If no live worker with the proxy encoder and any needed decoder
+    can take a class, the job steps up a class. If none can at all,
+    it's left to any worker rather than waiting forever.
+
+    Args:
+        job: job with its source resolution and codec
+        advertised: live workers' capabilities, from `get_advertised`
+        queue: the queue the job is otherwise scheduled to
+
+    Returns:
+        queue: capability or decoder lane, or the scheduled queue
+    """
+
+    required = get_job_class(job)
+    decoder = get_source_decoder(job)
+
+    if required == CAPABILITY_CLASSES[0] and decoder is None:
+        return queue
+
+    codec = job.get("proxy_settings", settings["proxy"])["codec"]
+    able = [
+        CAPABILITY_CLASSES.index(x["capability_class"])
+        for x in advertised
+        if x.get("capability_class") in CAPABILITY_CLASSES
+        and codec in (x.get("encoders") or [codec])
+        and (decoder is None or decoder in (x.get("decoders") or []))
+    ]
+
+    for index in range(CAPABILITY_CLASSES.index(required), len(CAPABILITY_CLASSES)):
+
+        if not any(x >= index for x in able):
+            continue
+
+        class_queue = get_queue(CAPABILITY_CLASSES[index]) if index else queue
+        return get_decoder_queue(class_queue, decoder) if decoder else class_queue
+
+    logger.warning(
+        f"[yellow]No live worker is capable of '{required}' jobs with '{codec}'"
+        + (f" and can decode '{job.get('codec')}'" if decoder else "")
+        + f". Queuing '{job['file_name']}' to any worker.[/]"
+    )
+    return queue
+
+
+def _advertise_self(hostname: str, queues: list):
+
+    global _advertisement, _last_advertised
+
+    _advertisement = (hostname, probe(), queues)
+    _last_advertised = time.monotonic()
+    advertise(*_advertisement)
+
+
+@worker_ready.connect
+def advertise_on_ready(sender=None, **kwargs):
+    """Advertise this worker's capabilities as soon as it's taking jobs"""
+
+    if not is_advertising():
+        return
+
+    try:
+        queues = [x.name for x in sender.task_consumer.queues]
+        _advertise_self(sender.hostname, queues)
+
+    except Exception as e:
+        logger.warning(f"[yellow]Couldn't advertise capabilities[/]\n{e}")
+
+
+@heartbeat_sent.connect
+@task_prerun.connect
+def refresh_advertisement(**kwargs):
+    """Keep the advertisement alive while the worker is"""
+
+    global _last_advertised
+
+    if _advertisement is None:
+        return
+
+    if time.monotonic() - _last_advertised < ADVERTISE_INTERVAL:
+        return
+    _last_advertised = time.monotonic()
+
+    try:
+        advertise(*_advertisement)
+
+    except Exception as e:
+        logger.warning(f"[yellow]Couldn't refresh capabilities[/]\n{e}")
+
+
+@worker_shutdown.connect
+def withdraw_advertisement(**kwargs):
+    """Stop queuers routing to a worker that's gone"""
+
+    if _advertisement is None:
+        return
+
+    try:
+        get_redis().delete(ADVERTISE_KEY.format(_advertisement[0]))
+
+    except Exception as e:
+        logger.warning(f"[yellow]Couldn't withdraw capabilities[/]\n{e}")
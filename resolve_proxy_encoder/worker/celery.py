@@ -6,6 +6,11 @@ import sys
 
 from celery import Celery
 from ..settings.manager import SettingsManager
+from . import capabilities  # Advertises what each worker can encode
+from . import fairshare  # Dispatches staged jobs after each task
+from . import scratch  # Cleans up after crashed encodes on startup
+from .priority import PRIORITIES, PRIORITY_STEPS
+from .serialization import SERIALIZER_NAME, register_serializer
 
 settings = SettingsManager()
 
@@ -17,10 +22,13 @@ if sys.platform == "win32":
     os.environ.setdefault("FORKED_BY_MULTIPROCESSING", "1")
 
 app = Celery("worker")
+register_serializer()
 
 app.autodiscover_tasks(
     [
         "resolve_proxy_encoder.worker.tasks.encode.tasks.encode_proxy",
+        "resolve_proxy_encoder.worker.tasks.segment.tasks.encode_segment",
+        "resolve_proxy_encoder.worker.tasks.batch.tasks.encode_batch",
     ]
 )
 
@@ -32,8 +40,10 @@ except Exception as e:
 # Fragile! Moved from user settings to here.
 app.conf.update(
     task_serializer="json",  # Pickle allows us to post-encode link using remote objects
-    result_serializer="json",  # Keep same as above
-    result_extended=True,  # Allows us to get task args after task completion
+    result_serializer="json",
+    accept_content=["json", SERIALIZER_NAME],
+    result_accept_content=["json", SERIALIZER_NAME],
+    result_extended=False,  # Job manifests keep task args. Don't store them twice.
     acks_late=True,
     worker_pool_restarts=True,
     worker_send_task_events=True,
@@ -41,3 +51,16 @@ app.conf.update(
     worker_hijack_root_logger=False,
     worker_redirect_stdouts=False,
 )
+
+# msgpack and compression, instead of verbose JSON.
+# Queuers and workers from before compact serialization can't read these.
+if settings["celery"]["compact_serialization"]:
+    app.conf.update(task_serializer=SERIALIZER_NAME, result_serializer=SERIALIZER_NAME)
+
+# Priority lanes. Workers take from the most urgent lane first.
+app.conf.update(
+    broker_transport_options=dict(
+        app.conf.broker_transport_options or {}, priority_steps=PRIORITY_STEPS
+    ),
+    task_default_priority=PRIORITIES[settings["scheduling"]["default_priority"]],
+)
@@ -0,0 +1,351 @@
+import getpass
+import json
+import logging
+import random
+import threading
+import time
+from typing import Union
+
+from celery import signature as get_signature
+from celery.signals import task_postrun, worker_ready, worker_shutdown
+from kombu.utils.json import dumps
+
+from ..app.utils import core
+from ..settings.manager import SettingsManager
+from . import priority
+from .utils import get_all_queues, get_redis
+
+core.install_rich_tracebacks()
+
+settings = SettingsManager()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["worker"]["loglevel"])
+
+# Active tenants, their staged jobs and their deficit counters
+TENANTS_KEY = "rprox:fair:tenants"
+STAGED_KEY = "rprox:fair:staged:{}"
+DEFICIT_KEY = "rprox:fair:deficit"
+
+# Whose turn it is, so the next pass carries on the rotation
+TURN_KEY = "rprox:fair:turn"
+
+# Seconds a dispatcher can hold the dispatch lock before it's presumed dead
+DISPATCH_LEASE = 10
+
+# Seconds between dispatch passes from the same process
+DISPATCH_INTERVAL = 1
+
+# Seconds between each worker's background dispatch passes. Jittered.
+DISPATCH_POLL_INTERVAL = 5
+
+_last_dispatch = 0.0
+_stop_dispatching = threading.Event()
+
+
+def is_enabled() -> bool:
+    """Fair share needs a Redis broker to measure queue depth"""
+
+    return settings["scheduling"]["fair_share"] and str(
+        settings["celery"]["broker_url"]
+    ).startswith(("redis://", "rediss://"))
+
+
+def get_tenant(job: dict) -> str:
+    """Get who a job's share is counted against: its user or its project"""
+
+    if settings["scheduling"]["fair_share_key"] == "project":
+        return str(job.get("project", "unknown"))
+
+    return str(job.get("user") or getpass.getuser())
+
+
+def get_weight(tenant: str) -> float:
+    """Get a tenant's relative share. Unlisted tenants get 1"""
+
+    return float(settings["scheduling"]["fair_share_weights"].get(tenant, 1))
+
+
+def stage(tenant: str, signatures: list, costs: list, task_ids: list):
+    """Hold signatures back for fair dispatch instead of sending them now.
+
+    Args:
+        tenant: who the jobs count against
+        signatures: Celery signatures with their task ids already set
+        costs: estimated encode cost of each signature, in the same order
+        task_ids: job task ids each signature stores results under, in the same order
+    """
+
+    r = get_redis()
+
+    with r.pipeline() as pipe:
+
+        for signature, cost, ids in zip(signatures, costs, task_ids):
+            pipe.rpush(
+                STAGED_KEY.format(tenant),
+                json.dumps(
+                    {
+                        "signature": json.loads(dumps(signature)),
+                        "cost": cost,
+                        "task_ids": list(ids),
+                    }
+                ),
+            )
+
+        pipe.sadd(TENANTS_KEY, tenant)
+        pipe.execute()
+
+    logger.debug(f"[magenta]Staged {len(signatures)} jobs for '{tenant}'[/]")
+
+
+def unstage(task_ids: list) -> int:
+    """Drop staged signatures for any of the given task ids, so they're never sent.
+
+    Holds the dispatch lock, so a dispatcher never pops the wrong signature.
+
+    Returns:
+        removed: count of staged signatures dropped
+    """
+
+    if not is_enabled():
+        return 0
+
+    r = get_redis()
+    task_ids = set(task_ids)
+    removed = 0
+
+    with r.lock("rprox:fair:dispatch", timeout=DISPATCH_LEASE):
+
+        for tenant in sorted(x.decode() for x in r.smembers(TENANTS_KEY)):
+
+            key = STAGED_KEY.format(tenant)
+
+            for raw in r.lrange(key, 0, -1):
+                if task_ids.intersection(json.loads(raw).get("task_ids", [])):
+                    removed += r.lrem(key, 1, raw)
+
+    if removed:
+        logger.debug(f"[magenta]Unstaged {removed} cancelled jobs[/]")
+
+    return removed
+
+
+def clear():
+    """Drop every staged job, for everyone"""
+
+    if not is_enabled():
+        return
+
+    r = get_redis()
+
+    with r.lock("rprox:fair:dispatch", timeout=DISPATCH_LEASE):
+
+        tenants = [x.decode() for x in r.smembers(TENANTS_KEY)]
+        r.delete(
+            TENANTS_KEY,
+            DEFICIT_KEY,
+            TURN_KEY,
+            *[STAGED_KEY.format(x) for x in tenants],
+        )
+
+
+def get_waiting_count(r) -> int:
+    """Count tasks waiting in the broker, across lanes and priorities"""
+
+    with r.pipeline() as pipe:
+
+        for queue in get_all_queues():
+            for step in priority.PRIORITY_STEPS:
+                pipe.llen(priority.get_lane_key(queue, step))
+
+        return sum(pipe.execute())
+
+
+def _send(staged: dict):
+    """Send a staged signature, escalating it first if its deadline is near"""
+
+    signature = get_signature(staged["signature"])
+    deadline = (signature.options.get("headers") or {}).get(priority.DEADLINE_HEADER)
+
+    if deadline:
+        signature.set(
+            priority=min(
+                signature.options.get("priority", priority.PRIORITIES["low"]),
+                priority.get_deadline_priority(deadline),
+            )
+        )
+
+    signature.apply_async()
+
+
+def dispatch(depth: Union[int, None] = None, wait: bool = False) -> int:
+    """Top the broker up with staged jobs, interleaving tenants fairly.
+
+    Uses deficit round robin on estimated encode cost. Each round, every tenant
+    with staged jobs earns a quantum of cost, scaled by its weight, and sends
+    jobs from the front of its queue while it can afford them. Tenants with
+    long jobs send fewer of them, so everyone gets a similar share of
+    encode time rather than of task count. Unspent credit carries over.
+
+    Only a few jobs wait in the broker at a time, so a group queued later
+    gets its share as soon as a worker frees up.
+
+    Args:
+        depth: tasks to keep waiting in the broker. Configured depth if None.
+        wait: wait for another dispatcher to finish, instead of skipping the pass
+
+    Returns:
+        sent: count of jobs sent
+    """
+
+    global _last_dispatch
+
+    if not is_enabled():
+        return 0
+
+    if not wait and time.monotonic() - _last_dispatch < DISPATCH_INTERVAL:
+        return 0
+    _last_dispatch = time.monotonic()
+
+    r = get_redis()
+    lock = r.lock("rprox:fair:dispatch", timeout=DISPATCH_LEASE)
+    if not lock.acquire(blocking=wait, blocking_timeout=DISPATCH_LEASE):
+        return 0
+
+    sent = 0
+
+    try:
+
+        depth = (
+            depth if depth is not None else settings["scheduling"]["fair_share_depth"]
+        )
+        slots = depth - get_waiting_count(r)
+        tenants = sorted(x.decode() for x in r.smembers(TENANTS_KEY))
+        turn = json.loads(r.get(TURN_KEY) or "{}")
+
+        # Carry on the rotation where the last pass left off. A tenant whose turn
+        # was cut short by a full broker resumes it without earning credit again.
+        resuming = turn.get("resume") and turn.get("tenant") in tenants
+        if turn.get("tenant") in tenants:
+            i = tenants.index(turn["tenant"]) + (0 if resuming else 1)
+            tenants = tenants[i:] + tenants[:i]
+
+        deficits = {
+            k.decode(): float(v)
+            for k, v in r.hgetall(DEFICIT_KEY).items()
+            if k.decode() in tenants
+        }
+
+        while slots > 0 and tenants:
+
+            heads = dict()
+            for tenant in tenants:
+                head = r.lindex(STAGED_KEY.format(tenant), 0)
+                if head:
+                    heads[tenant] = json.loads(head)
+
+            # Tenants with nothing left lose their share and unspent credit
+            for tenant in [x for x in tenants if x not in heads]:
+                r.srem(TENANTS_KEY, tenant)
+                r.hdel(DEFICIT_KEY, tenant)
+                deficits.pop(tenant, None)
+                tenants.remove(tenant)
+
+            if not heads:
+                break
+
+            # Big enough that every round sends something
+            quantum = max(x["cost"] for x in heads.values()) or 1
+
+            for tenant in list(tenants):
+
+                if not resuming:
+                    deficits[tenant] = deficits.get(tenant, 0) + quantum * get_weight(
+                        tenant
+                    )
+                resuming = False
+
+                while slots > 0 and tenant in heads:
+
+                    if heads[tenant]["cost"] > deficits[tenant]:
+                        break
+
+                    _send(heads[tenant])
+                    r.lpop(STAGED_KEY.format(tenant))
+
+                    deficits[tenant] -= heads[tenant]["cost"]
+                    slots -= 1
+                    sent += 1
+
+                    head = r.lindex(STAGED_KEY.format(tenant), 0)
+                    if head:
+                        heads[tenant] = json.loads(head)
+                    else:
+                        heads.pop(tenant)
+
+                # Out of slots with credit to spend, so pick this turn up next pass
+                affordable = tenant in heads and (
+                    heads[tenant]["cost"] <= deficits[tenant]
+                )
+                turn = {"tenant": tenant, "resume": affordable}
+
+                if slots <= 0:
+                    break
+
+        if deficits:
+            r.hset(DEFICIT_KEY, mapping=deficits)
+
+        if turn:
+            r.set(TURN_KEY, json.dumps(turn))
+
+    finally:
+
+        try:
+            lock.release()
+        except Exception:
+            pass
+
+    if sent:
+        logger.debug(f"[magenta]Dispatched {sent} staged jobs[/]")
+
+    return sent
+
+
+@task_postrun.connect
+def dispatch_after_task(**kwargs):
+    """Top up the broker before the worker takes its next job"""
+
+    try:
+        dispatch()
+
+    except Exception as e:
+        logger.warning(f"[yellow]Couldn't dispatch staged jobs[/]\n{e}")
+
+
+@worker_ready.connect
+def start_dispatching(sender=None, **kwargs):
+    """Dispatch on a timer too, so staged jobs are sent even while every
+    worker is busy with a long encode and no queuer is running"""
+
+    if not is_enabled():
+        return
+
+    def poll():
+
+        while not _stop_dispatching.wait(
+            DISPATCH_POLL_INTERVAL * random.uniform(0.5, 1.5)
+        ):
+            try:
+                dispatch()
+
+            except Exception as e:
+                logger.warning(f"[yellow]Couldn't dispatch staged jobs[/]\n{e}")
+
+    _stop_dispatching.clear()
+    threading.Thread(target=poll, daemon=True).start()
+
+
+@worker_shutdown.connect
+def stop_dispatching(**kwargs):
+
+    _stop_dispatching.set()
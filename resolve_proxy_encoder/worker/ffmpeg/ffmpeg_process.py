@@ -1,6 +1,8 @@
 import logging
 import os
 import subprocess
+import threading
+import time
 
 from rich.console import Console
 from rich.progress import (
@@ -16,6 +18,7 @@ from ffmpeg import probe
 
 from ...app.utils import core
 from ...settings.manager import SettingsManager
+from .. import affinity
 
 settings = SettingsManager()
 
@@ -42,6 +45,11 @@ class FfmpegProcess:
             self._dir_files = [file for file in os.listdir()]
 
         self._can_get_duration = True
+        self._process = None
+        self._terminated = False
+        self._last_progress = time.monotonic()
+        self.returncode = None
+        self.timed_out = None
 
         try:
             self._duration_secs = float(probe(self._filepath)["format"]["duration"])
@@ -54,7 +62,19 @@ class FfmpegProcess:
             # pipe:1 sends the progress to stdout. See https://stackoverflow.com/a/54386052/13231825
             self._ffmpeg_args += ["-progress", "pipe:1", "-nostats"]
 
-    def run(self, logfile):
+    def run(self, logfile, progress_callback=None, stall_timeout=None, time_limit=None):
+        """
+        Run FFmpeg, showing a progress bar in the worker console.
+
+        Accepts an optional progress_callback, called with a dict of the latest
+        'frame', 'fps' and 'out_time' (seconds) stats every time FFmpeg reports progress.
+
+        A watchdog kills FFmpeg if its progress stops advancing for `stall_timeout`
+        seconds, or if it runs longer than `time_limit` seconds. Either way,
+        `timed_out` is set to the reason and `returncode` is non-zero.
+
+        FFmpeg is pinned to the worker's CPUs if `pin_cpus` is set.
+        """
 
         with open(logfile, "w") as f:
             pass
@@ -70,9 +90,25 @@ class FfmpegProcess:
         if self._can_get_duration:
             with open(logfile, "a") as f:
                 process = subprocess.Popen(
-                    self._ffmpeg_args, stdout=subprocess.PIPE, stderr=f
+                    self._ffmpeg_args,
+                    stdout=subprocess.PIPE,
+                    stderr=f,
+                    preexec_fn=affinity.get_preexec_fn(),
                 )
 
+            self._process = process
+            if self._terminated:
+                process.kill()
+
+            self._last_progress = time.monotonic()
+            stop_watching = threading.Event()
+            watchdog = threading.Thread(
+                target=self._watch,
+                args=(process, stop_watching, stall_timeout, time_limit),
+                daemon=True,
+            )
+            watchdog.start()
+
             console = Console(record=True)
 
             progress_bar = Progress(
@@ -92,6 +128,7 @@ class FfmpegProcess:
 
             previous_seconds_processed = 0
             seconds_processed = 0
+            progress_stats = {"frame": 0, "fps": 0.0, "out_time": 0.0}
 
             encoding_task = progress_bar.add_task(
                 description="[yellow]Encode[/]",
@@ -124,13 +161,44 @@ class FfmpegProcess:
                                 advance=seconds_increase,
                             )
 
+                            if seconds_processed > previous_seconds_processed:
+                                self._last_progress = time.monotonic()
+
                             previous_seconds_processed = seconds_processed
+                            progress_stats.update({"out_time": seconds_processed})
+
+                        elif ffmpeg_output.startswith(("frame=", "fps=")):
+
+                            key, value = ffmpeg_output.strip().split("=", 1)
+                            try:
+                                progress_stats.update({key: float(value)})
+                            except ValueError:
+                                pass
+
+                        elif ffmpeg_output.startswith("progress="):
+
+                            # Each block of progress stats ends with 'progress'
+                            if progress_callback:
+                                progress_callback(dict(progress_stats))
 
                         else:
 
                             break
 
             progress_bar.stop()
+            self.returncode = process.wait()
+
+            stop_watching.set()
+            watchdog.join()
+
+            if self.timed_out:
+                logger.error(f"[red]FFmpeg was killed: {self.timed_out}[/]")
+                return
+
+            if self.returncode != 0:
+                logger.error(f"[red]FFmpeg exited with code {self.returncode}[/]")
+                return
+
             logger.info("[green]Finished encoding[/]")
 
         except KeyboardInterrupt:
@@ -144,3 +212,40 @@ class FfmpegProcess:
             process.kill()
             logger.critical(f"[red][Error] {e}\nExiting...[/]")
             core.app_exit(1, -1)
+
+    def terminate(self):
+        """Kill FFmpeg from another thread, e.g. when the job's cancelled.
+
+        `run` then returns with a non-zero `returncode`.
+        """
+
+        self._terminated = True
+
+        if self._process and self._process.poll() is None:
+            self._process.kill()
+
+    def _watch(self, process, stop_watching, stall_timeout=None, time_limit=None):
+        """Kill FFmpeg if it stalls or runs out of time. Runs alongside `run`."""
+
+        started = time.monotonic()
+
+        while not stop_watching.wait(1):
+
+            now = time.monotonic()
+
+            if time_limit and now - started > time_limit:
+                reason = f"ran past its {time_limit:.0f}s time limit"
+
+            elif stall_timeout and now - self._last_progress > stall_timeout:
+                reason = f"made no progress for {stall_timeout:.0f}s"
+
+            else:
+                continue
+
+            # Finished just in time
+            if process.poll() is not None:
+                return
+
+            self.timed_out = reason
+            process.kill()
+            return
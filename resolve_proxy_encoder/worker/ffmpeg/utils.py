@@ -5,6 +5,7 @@ import shlex
 import subprocess
 import sys
 from fractions import Fraction
+from typing import Union
 
 from ...app.utils import core
 from ...settings.manager import SettingsManager
@@ -71,3 +72,135 @@ def get_media_info(file):
         sys.exit(1)
 
     return json_result
+
+
+def get_start_time(file) -> float:
+    """Get the timestamp a file's video starts at. Often not 0 in camera MXF and MOV.
+
+    Only reads the container header. Returns 0 if it couldn't be read.
+    """
+
+    cmd = [
+        "ffprobe",
+        "-v",
+        "quiet",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "stream=start_time",
+        "-print_format",
+        "json",
+        file,
+    ]
+    logger.debug(f"FFprobe command: {' '.join(cmd)}")
+
+    try:
+
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, check=True)
+        streams = json.loads(result.stdout.decode()).get("streams", [])
+        return float(streams[0]["start_time"])
+
+    except (
+        OSError,
+        subprocess.CalledProcessError,
+        ValueError,
+        IndexError,
+        KeyError,
+    ) as e:
+        logger.warning(f"Couldn't probe start time of '{file}': {e}")
+        return 0.0
+
+
+def get_keyframe_before(file, seconds: float, start_time: float = None) -> float:
+    """Get the timestamp of the nearest video keyframe at or before `seconds`.
+
+    Seeks straight to the timestamp and reads only the first few packets,
+    so it's cheap even on long sources over the network.
+    Returns `seconds` unchanged if no keyframe could be read.
+
+    Args:
+        file: source path
+        seconds: from the start of the video, as FFmpeg's `-ss` takes it
+        start_time: the video's first timestamp, probed if None.
+         Packet timestamps count from it, not from 0.
+    """
+
+    start_time = get_start_time(file) if start_time is None else start_time
+
+    cmd = [
+        "ffprobe",
+        "-v",
+        "quiet",
+        "-select_streams",
+        "v:0",
+        "-read_intervals",
+        f"{start_time + seconds}%+#60",
+        "-show_entries",
+        "packet=pts_time,flags",
+        "-print_format",
+        "json",
+        file,
+    ]
+    logger.debug(f"FFprobe command: {' '.join(cmd)}")
+
+    try:
+
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, check=True)
+        packets = json.loads(result.stdout.decode()).get("packets", [])
+
+    except (subprocess.CalledProcessError, ValueError) as e:
+        logger.warning(f"Couldn't probe keyframes in '{file}': {e}")
+        return seconds
+
+    keyframes = [
+        float(x["pts_time"]) - start_time
+        for x in packets
+        if "K" in x.get("flags", "") and x.get("pts_time") not in [None, "N/A"]
+    ]
+
+    # Allow for rounding in the subtraction, or an exact hit looks like it's after
+    keyframes = [x for x in keyframes if x <= seconds + 1e-6]
+
+    return max(keyframes) if keyframes else seconds
+
+
+def get_audio_streams(file) -> Union[list, None]:
+    """Get the codec, sample rate and channel count of each of a file's audio streams.
+
+    Only reads the container header, so it's cheap even on long sources.
+
+    Returns:
+        streams: list of dicts in stream order, or None if the file couldn't be probed
+    """
+
+    cmd = [
+        "ffprobe",
+        "-v",
+        "quiet",
+        "-select_streams",
+        "a",
+        "-show_entries",
+        "stream=codec_name,sample_rate,channels",
+        "-print_format",
+        "json",
+        file,
+    ]
+    logger.debug(f"FFprobe command: {' '.join(cmd)}")
+
+    try:
+
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, check=True)
+        streams = json.loads(result.stdout.decode()).get("streams", [])
+
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
+        logger.warning(f"Couldn't probe audio streams in '{file}': {e}")
+        return None
+
+    return [
+        {
+            "codec": x.get("codec_name"),
+            "sample_rate": str(x.get("sample_rate", "")),
+            "channels": int(x.get("channels") or 0),
+        }
+        for x in streams
+    ]
@@ -0,0 +1,340 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Union
+
+from ..app.utils import core
+from ..settings.manager import SettingsManager
+from . import cancel
+from .locality import is_under, normalize_path
+from .utils import get_redis
+
+core.install_rich_tracebacks()
+
+settings = SettingsManager()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["worker"]["loglevel"])
+
+# Holders of each target's slots, scored by when their lease runs out
+SLOTS_KEY = "rprox:io:{}:{}"
+
+# Wait time stats per target, and every target that's ever had any
+STATS_KEY = "rprox:io:stats:{}:{}"
+TARGETS_KEY = "rprox:io:targets"
+
+# Slot limits the farm shares, as published by 'rprox io --publish', by 'mode|target'
+LIMITS_KEY = "rprox:io:limits"
+
+# Seconds a slot is held without renewal. Renewed while encoding.
+SLOT_LEASE = 60
+
+# Seconds between attempts to take a full target's slot. Jittered.
+SLOT_POLL_INTERVAL = 1.0
+
+# Drop expired holders, then take a slot if there's one free.
+# A holder asking again just renews its lease. Times come from the
+# Redis server's clock, and limits from the published ones if there are
+# any, so every worker agrees on both whatever its own clock and settings.
+_ACQUIRE_SCRIPT = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local slots = tonumber(redis.call('HGET', KEYS[2], ARGV[4] .. '|' .. ARGV[5]) or ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZSCORE', KEYS[1], ARGV[3]) or
+   redis.call('ZCARD', KEYS[1]) < slots then
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[1]), ARGV[3])
+    redis.call('PEXPIRE', KEYS[1], math.ceil(tonumber(ARGV[1]) * 1000))
+    return 1
+end
+return 0
+"""
+
+_RECORD_SCRIPT = """
+redis.call('HINCRBY', KEYS[1], 'acquired', 1)
+redis.call('HINCRBYFLOAT', KEYS[1], 'wait_seconds', ARGV[1])
+if tonumber(ARGV[1]) > tonumber(redis.call('HGET', KEYS[1], 'max_wait_seconds') or 0) then
+    redis.call('HSET', KEYS[1], 'max_wait_seconds', ARGV[1])
+end
+if ARGV[2] == '1' then
+    redis.call('HINCRBY', KEYS[1], 'waited', 1)
+end
+"""
+
+
+def publish_limits() -> int:
+    """Publish this machine's slot limits for the whole farm, replacing any published.
+
+    Workers enforce the published limits over their own settings,
+    so every encode on a target counts against the same number.
+    Nothing's published if this machine has no limits set.
+
+    Returns:
+        published: count of limits published
+    """
+
+    r = get_redis()
+    if r is None:
+        return 0
+
+    limits = {
+        f"{mode}|{target}": int(slots)
+        for mode in ["read", "write"]
+        for target, slots in settings["worker"][f"{mode}_slots"].items()
+    }
+
+    if not limits:
+        return 0
+
+    with r.pipeline() as pipe:
+        pipe.delete(LIMITS_KEY)
+        pipe.hset(LIMITS_KEY, mapping=limits)
+        pipe.execute()
+
+    logger.debug(f"[magenta]Published storage slot limits:[/] {limits}")
+    return len(limits)
+
+
+def unpublish_limits():
+    """Drop the published slot limits, so each worker goes back to its own"""
+
+    r = get_redis()
+    if r is not None:
+        r.delete(LIMITS_KEY)
+
+
+def get_limits(mode: str, r=None) -> dict:
+    """Get the slot limits for 'read' or 'write', published or else from local settings"""
+
+    r = r or get_redis()
+    published = r.hgetall(LIMITS_KEY) if r else None
+
+    if not published:
+        return settings["worker"][f"{mode}_slots"]
+
+    limits = dict()
+    for field, slots in published.items():
+
+        field_mode, _, target = field.decode("utf-8").partition("|")
+        if field_mode == mode and target:
+            limits.update({target: int(slots)})
+
+    return limits
+
+
+def get_target(path: str, limits: dict) -> Union[str, None]:
+    """Get the most specific limited storage target a path is on, if any"""
+
+    targets = [x for x in limits if is_under(path, x)]
+    return max(targets, key=lambda x: len(normalize_path(x))) if targets else None
+
+
+def get_job_targets(job: dict, read: bool = True, write: bool = True, r=None) -> list:
+    """Get the limited storage targets an encode of this job touches.
+
+    Returns:
+        targets: (mode, target, slots) tuples, in a fixed order so
+         workers taking more than one never deadlock each other
+    """
+
+    targets = []
+
+    if read:
+        read_slots = get_limits("read", r)
+        target = get_target(job["file_path"], read_slots)
+        if target:
+            targets.append(("read", target, int(read_slots[target])))
+
+    if write:
+        write_slots = get_limits("write", r)
+        target = get_target(job["proxy_dir"], write_slots)
+        if target:
+            targets.append(("write", target, int(write_slots[target])))
+
+    return sorted(targets, key=lambda x: (normalize_path(x[1]), x[0]))
+
+
+def _slots_key(mode: str, target: str) -> str:
+    return SLOTS_KEY.format(mode, normalize_path(target))
+
+
+def _acquire(r, mode: str, target: str, slots: int, token: str, cancel_ids: list):
+    """Block until a slot on a target is free, then take it, returning seconds waited
+
+    Raises:
+        cancel.Cancelled: if the job's cancelled while waiting
+    """
+
+    acquire = r.register_script(_ACQUIRE_SCRIPT)
+    key = _slots_key(mode, target)
+    started = time.monotonic()
+    warned = False
+
+    while True:
+
+        if acquire(
+            keys=[key, LIMITS_KEY], args=[SLOT_LEASE, slots, token, mode, target]
+        ):
+            break
+
+        if not warned:
+            logger.info(
+                f"[yellow]All {slots} {mode} slots on '{target}' are busy. Waiting...[/]"
+            )
+            warned = True
+
+        time.sleep(SLOT_POLL_INTERVAL * random.uniform(0.5, 1.5))
+        cancel.check(cancel_ids)
+
+    waited = time.monotonic() - started
+
+    r.sadd(TARGETS_KEY, f"{mode}|{target}")
+    r.register_script(_RECORD_SCRIPT)(
+        keys=[STATS_KEY.format(mode, normalize_path(target))],
+        args=[round(waited, 3), int(warned)],
+    )
+
+    if warned:
+        logger.info(f"[cyan]Got a {mode} slot on '{target}' after {waited:.1f}s[/]")
+
+    return waited
+
+
+@contextmanager
+def storage_slots(
+    job: dict,
+    token: str,
+    read: bool = True,
+    write: bool = True,
+    cancel_ids: list = None,
+):
+    """Hold a read slot on a job's source storage and a write slot on its proxy storage.
+
+    Limits how many encodes across the farm touch each storage target
+    at once, per `read_slots` and `write_slots` as published with
+    'rprox io --publish', or in worker settings if none have been.
+    Unlisted targets aren't limited. Leases are renewed in the background
+    while the block runs, so a crashed worker frees its slots within `SLOT_LEASE`.
+
+    Args:
+        job: job with its source `file_path` and `proxy_dir`
+        token: unique holder id, like the task id
+        read: take a slot on the source's storage
+        write: take a slot on the proxy's storage
+        cancel_ids: task ids to stop waiting for slots on if cancelled. Just `token` if None.
+    """
+
+    r = get_redis()
+    targets = get_job_targets(job, read=read, write=write, r=r) if r else []
+
+    if not targets:
+        yield
+        return
+
+    acquire = r.register_script(_ACQUIRE_SCRIPT)
+    held = []
+    stop_renewing = threading.Event()
+    renewer = None
+
+    def renew():
+
+        while not stop_renewing.wait(SLOT_LEASE / 3):
+            for mode, target, slots in held:
+                try:
+                    acquire(
+                        keys=[_slots_key(mode, target), LIMITS_KEY],
+                        args=[SLOT_LEASE, slots, token, mode, target],
+                    )
+                except Exception as e:
+                    logger.warning(
+                        f"[yellow]Couldn't renew {mode} slot on '{target}'[/]\n{e}"
+                    )
+
+    try:
+
+        for mode, target, slots in targets:
+            _acquire(r, mode, target, slots, token, cancel_ids or [token])
+            held.append((mode, target, slots))
+
+        renewer = threading.Thread(target=renew, daemon=True)
+        renewer.start()
+
+        yield
+
+    finally:
+
+        stop_renewing.set()
+        if renewer:
+            renewer.join()
+
+        for mode, target, _ in held:
+            try:
+                r.zrem(_slots_key(mode, target), token)
+            except Exception as e:
+                logger.warning(
+                    f"[yellow]Couldn't free {mode} slot on '{target}'[/]\n{e}"
+                )
+
+
+def get_stats() -> list:
+    """Get slot usage and wait times for every storage target that's been limited
+
+    Returns:
+        stats: dicts of mode, target, configured slots, slots in use,
+         acquisitions, how many had to wait, and mean and max wait in seconds
+    """
+
+    r = get_redis()
+    if r is None:
+        return []
+
+    stats = []
+    seconds, microseconds = r.time()
+    now = seconds + microseconds / 1e6
+    limits = {x: get_limits(x, r) for x in ["read", "write"]}
+
+    for entry in sorted(x.decode("utf-8") for x in r.smembers(TARGETS_KEY)):
+
+        mode, target = entry.split("|", 1)
+        slots = limits[mode].get(target)
+
+        key = _slots_key(mode, target)
+        in_use = r.zcount(key, now, "+inf")
+
+        raw = r.hgetall(STATS_KEY.format(mode, normalize_path(target)))
+        values = {k.decode("utf-8"): float(v) for k, v in raw.items()}
+        acquired = int(values.get("acquired", 0))
+
+        stats.append(
+            {
+                "mode": mode,
+                "target": target,
+                "slots": slots,
+                "in_use": in_use,
+                "acquired": acquired,
+                "waited": int(values.get("waited", 0)),
+                "mean_wait_seconds": values.get("wait_seconds", 0) / acquired
+                if acquired
+                else 0.0,
+                "max_wait_seconds": values.get("max_wait_seconds", 0.0),
+            }
+        )
+
+    return stats
+
+
+def reset_stats():
+    """Clear wait time stats, to measure again after changing limits"""
+
+    r = get_redis()
+    if r is None:
+        return
+
+    entries = [x.decode("utf-8").split("|", 1) for x in r.smembers(TARGETS_KEY)]
+    keys = [STATS_KEY.format(mode, normalize_path(target)) for mode, target in entries]
+    r.delete(TARGETS_KEY, *keys)
@@ -13,7 +13,8 @@ from rich import print
 
 from ..app.utils import core, pkg_info
 from ..settings.manager import SettingsManager
-from ..worker.utils import get_queue
+from ..worker import affinity, capabilities, locality
+from ..worker.utils import SHORT_LANE, get_queue
 
 core.install_rich_tracebacks()
 
@@ -55,7 +56,7 @@ def prompt_worker_amount(cpu_cores: int):
     return answer
 
 
-def new_worker(id=None):
+def new_worker(id=None, queues=None, host_workers=None):
     """Start a new celery worker in a new process
 
     Used to start workers even when the script binaries are buried
@@ -63,6 +64,8 @@ def new_worker(id=None):
 
     Args:
         - id: Used to differentiate multiple workers on the same host
+        - queues: list of queues to consume from. Defaults to the version constrained queue.
+        - host_workers: workers started on this machine, to share its cores between
 
     Returns:
         - none
@@ -78,7 +81,7 @@ def new_worker(id=None):
 
     def get_worker_queue():
 
-        return f" -Q {get_queue()}"
+        return f" -Q {','.join(queues if queues else [get_queue()])}"
 
     def get_celery_binary_path():
 
@@ -164,19 +167,82 @@ def new_worker(id=None):
     logger.info(f"[cyan]NEW WORKER - {id}[/]")
     logger.debug(f"[magenta]{' '.join(launch_cmd)}[/]\n")
 
+    # Tell the worker its share of the machine, for FFmpeg threads and pinning
+    env = dict(os.environ)
+    if id is not None and host_workers:
+        env.update(
+            {
+                affinity.HOST_WORKERS_ENV: str(host_workers),
+                affinity.WORKER_SLOT_ENV: str(id - 1),
+            }
+        )
+
     subprocess.Popen(
         cwd=get_module_path(),
         args=" ".join(launch_cmd),
         shell=True,
+        env=env,
     )
 
 
 def launch_workers(workers_to_launch: int, queue_name: str):
 
+    # Dedicated short-lane workers keep short jobs flowing behind long ones
+    short_queue_name = get_queue(SHORT_LANE)
+    short_workers = min(settings["worker"]["short_queue_workers"], workers_to_launch)
+
+    if short_workers:
+        logger.info(f"[cyan]Dedicating {short_workers} workers to short jobs[/]")
+
+    # Probe once for every worker, so they don't all time an encode at once
+    class_queues = []
+    decoders = []
+    if capabilities.is_advertising():
+        probed = capabilities.probe(use_cache=False)
+
+    if settings["scheduling"]["capability_routing"]:
+
+        class_queues = capabilities.get_class_queues(probed["capability_class"])
+
+        if class_queues:
+            logger.info(f"[cyan]Also taking jobs from: {', '.join(class_queues)}[/]")
+
+        # Sources only some machines can decode are queued for them alone
+        decoders = probed.get("decoders") or []
+        special = [x for x in capabilities.SOURCE_DECODERS.values() if x in decoders]
+
+        if special:
+            logger.info(f"[cyan]Taking jobs needing decoders: {', '.join(special)}[/]")
+
+    # Sources this machine reads locally are queued for it first
+    storage_roots = []
+    if settings["scheduling"]["locality_routing"]:
+
+        storage_roots = [k for k, v in probed["storage"].items() if v is not None]
+
+        if storage_roots:
+            logger.info(f"[cyan]Taking local jobs for: {', '.join(storage_roots)}[/]")
+
+    threads = affinity.get_thread_count(slot=0, workers=workers_to_launch)
+    logger.info(
+        f"[cyan]FFmpeg threads per encode: {threads}"
+        + (", pinned to their own CPUs" if affinity.is_pinning() else "")
+        + "[/]"
+    )
+
     # Start launching
 
     for i in range(0, workers_to_launch):
-        new_worker(id=i + 1)
+
+        if i < short_workers:
+            queues = [short_queue_name]
+        else:
+            queues = [*class_queues, queue_name, short_queue_name]
+
+        queues = [*capabilities.get_decoder_queues(queues, decoders), *queues]
+        queues = [*locality.get_local_queues(queues, storage_roots), *queues]
+
+        new_worker(id=i + 1, queues=queues, host_workers=workers_to_launch)
     return
 
 
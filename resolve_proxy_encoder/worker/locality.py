@@ -0,0 +1,186 @@
+import hashlib
+import logging
+import os
+import time
+from typing import Union
+
+from ..app.utils import core
+from ..settings.manager import SettingsManager
+from .utils import get_queue, get_redis
+
+core.install_rich_tracebacks()
+
+settings = SettingsManager()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["worker"]["loglevel"])
+
+# Bytes read from a root to measure its throughput
+THROUGHPUT_SAMPLE_BYTES = 64 * 1024 * 1024
+THROUGHPUT_CHUNK_BYTES = 4 * 1024 * 1024
+
+# Smallest file worth timing, and how many entries to look through for one
+THROUGHPUT_MIN_FILE_BYTES = 8 * 1024 * 1024
+THROUGHPUT_SEARCH_LIMIT = 500
+
+
+def is_enabled() -> bool:
+    """Advertisements live in Redis, so routing needs it"""
+
+    return settings["scheduling"]["locality_routing"] and get_redis() is not None
+
+
+def normalize_path(path: str) -> str:
+    """Compare paths the same whichever OS the queuer or worker runs on"""
+
+    return str(path).replace("\\", "/").rstrip("/").casefold()
+
+
+def is_under(path: str, root: str) -> bool:
+    """Return True if `path` is inside storage root `root`"""
+
+    path, root = normalize_path(path), normalize_path(root)
+    return path == root or path.startswith(root + "/")
+
+
+def get_root_lane(root: str) -> str:
+    """Get the lane name for jobs whose sources are under a storage root"""
+
+    return "site-" + hashlib.sha1(normalize_path(root).encode()).hexdigest()[:8]
+
+
+def get_root_queue(queue: str, root: str) -> str:
+    """Get the local-access version of a queue, for sources under `root`.
+
+    Keeps the queue's own lane, so short or capability routing still applies
+    to workers that can reach the root.
+    """
+
+    main_queue = get_queue()
+    suffix = queue[len(main_queue) :] if queue.startswith(main_queue) else ""
+    return get_queue(get_root_lane(root)) + suffix
+
+
+def get_local_queues(queues: list, roots: list) -> list:
+    """Get the local-access versions of a worker's queues, for every root it can reach"""
+
+    return [get_root_queue(queue, root) for root in roots for queue in queues]
+
+
+def _find_sample_file(root: str) -> Union[str, None]:
+    """Find a file under `root` big enough to time reads with, without walking all of it"""
+
+    seen = 0
+
+    for dir_path, dir_names, file_names in os.walk(root):
+
+        dir_names[:] = [x for x in dir_names if not x.startswith(("@", "."))]
+
+        for name in file_names:
+
+            seen += 1
+            if seen > THROUGHPUT_SEARCH_LIMIT:
+                return None
+
+            path = os.path.join(dir_path, name)
+
+            try:
+                if os.path.getsize(path) >= THROUGHPUT_MIN_FILE_BYTES:
+                    return path
+            except OSError:
+                continue
+
+    return None
+
+
+def measure_read_throughput(root: str) -> Union[float, None]:
+    """Time reading part of a file under a storage root, in MB per second
+
+    Returns:
+        throughput: MB/s, or None if the root isn't reachable or has nothing to read
+    """
+
+    sample_file = _find_sample_file(root)
+    if not sample_file:
+        return None
+
+    read = 0
+    started = time.monotonic()
+
+    try:
+        with open(sample_file, "rb", buffering=0) as file:
+            while read < THROUGHPUT_SAMPLE_BYTES:
+
+                chunk = file.read(THROUGHPUT_CHUNK_BYTES)
+                if not chunk:
+                    break
+                read += len(chunk)
+
+    except OSError:
+        return None
+
+    elapsed = time.monotonic() - started
+    return round(read / 1024**2 / elapsed, 1) if elapsed else None
+
+
+def probe_storage(roots: list) -> dict:
+    """Measure read throughput from each storage root this worker can reach"""
+
+    storage = {}
+
+    for root in roots:
+
+        throughput = measure_read_throughput(root)
+        storage.update({root: throughput})
+
+        if throughput is None:
+            logger.warning(f"[yellow]Couldn't measure read throughput of '{root}'[/]")
+        else:
+            logger.info(f"[cyan]'{root}' reads at {throughput} MB/s[/]")
+
+    return storage
+
+
+def route_job(job: dict, advertised: list, queue: str) -> str:
+    """Get the queue that keeps a job's source reads local.
+
+    Of the storage roots holding the job's source, those some live worker
+    reads fastest are tried first. The job goes to the first whose
+    local-access queue a live worker takes from. If no live worker
+    reaches the source locally, it stays in its scheduled queue for any worker.
+
+    Args:
+        job: job with its source `file_path`
+        advertised: live workers' advertisements, from `capabilities.get_advertised`
+        queue: the queue the job is otherwise scheduled to
+
+    Returns:
+        queue: local-access queue, or the scheduled queue
+    """
+
+    throughputs = dict()
+
+    for worker in advertised:
+        for root, throughput in (worker.get("storage") or {}).items():
+
+            if not is_under(job["file_path"], root):
+                continue
+
+            best = max(throughputs.get(root, 0), throughput or 0)
+            throughputs.update({root: best})
+
+    # Fastest first. Most specific root breaks ties.
+    roots = sorted(throughputs, key=lambda x: (throughputs[x], len(x)), reverse=True)
+    live_queues = {x for worker in advertised for x in worker.get("queues", [])}
+
+    for root in roots:
+
+        root_queue = get_root_queue(queue, root)
+        if root_queue in live_queues:
+            return root_queue
+
+    logger.debug(
+        f"[magenta]No live worker reads '{job['file_name']}' locally. "
+        "Leaving it to any worker.[/]"
+    )
+    return queue
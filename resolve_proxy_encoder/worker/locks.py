@@ -0,0 +1,328 @@
+import hashlib
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Union
+
+from celery.states import READY_STATES
+from redis.exceptions import LockError, WatchError
+
+from ..app.utils import core
+from ..settings.manager import SettingsManager
+from .registry import get_settings_hash
+from .utils import get_redis
+
+core.install_rich_tracebacks()
+
+settings = SettingsManager()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["worker"]["loglevel"])
+
+# Seconds an output lock is held without renewal. Renewed while encoding.
+LOCK_LEASE = 60
+
+# Seconds a job's idempotency key outlives a queuer or worker that never releases it
+IDEMPOTENCY_TTL = 24 * 60 * 60
+
+# Set for each task a queuer has sent or staged, holding its job's idempotency key.
+# Celery reports unknown and expired task ids as PENDING, so only a PENDING
+# task with one of these is really waiting to run.
+QUEUED_KEY = "rprox:queued:{}"
+
+# Seconds a claim may go unsent before it's presumed abandoned by a crashed queuer
+CLAIM_GRACE = 5 * 60
+
+
+class OutputLocked(Exception):
+    """Another task holds the lease on an output path"""
+
+    def __init__(self, path: str, holder: Union[str, None]):
+        self.path = path
+        self.holder = holder
+        super().__init__(f"'{path}' is locked by task {holder}")
+
+
+def get_source_fingerprint(file_path: str) -> str:
+    """Cheap fingerprint of a source file from its path, size and modified time.
+
+    Falls back to the path alone if the file can't be read from here.
+    """
+
+    try:
+        stat = os.stat(file_path)
+        identity = f"{file_path}|{stat.st_size}|{int(stat.st_mtime)}"
+
+    except OSError:
+        identity = file_path
+
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+
+def get_idempotency_key(job: dict) -> str:
+    """Key identifying the encode a job asks for, regardless of who queued it"""
+
+    # Slim jobs carry their published settings profile hash instead of settings
+    settings_hash = job.get("settings_hash") or get_settings_hash(job["proxy_settings"])
+
+    return "rprox:job:{}:{}".format(
+        get_source_fingerprint(job["file_path"]), settings_hash
+    )
+
+
+def is_in_flight(task_id: str, get_state) -> bool:
+    """Check if a task holding a job's key is still queued or running.
+
+    Finished tasks aren't, successful or not. A key left pointing at one
+    would otherwise attach new queues to an old result, even if its proxy's gone.
+    """
+
+    state = get_state(task_id)
+
+    if state in READY_STATES:
+        return False
+
+    if state != "PENDING":
+        return True
+
+    return bool(get_redis().exists(QUEUED_KEY.format(task_id)))
+
+
+def claim_job(job: dict, task_id: str, get_state) -> Union[str, None]:
+    """Claim a job for a new task, or find the task already encoding it.
+
+    Args:
+        job: job with queuer data
+        task_id: id the new task will be sent with
+        get_state: callable returning a task's state from its id
+
+    Returns:
+        task_id: id of an in-flight task to attach to instead, or None if ours to send
+    """
+
+    r = get_redis()
+    if r is None:
+        return None
+
+    key = get_idempotency_key(job)
+
+    if r.set(key, task_id, nx=True, ex=IDEMPOTENCY_TTL):
+        r.set(QUEUED_KEY.format(task_id), key, ex=CLAIM_GRACE)
+        return None
+
+    with r.pipeline() as pipe:
+
+        try:
+
+            pipe.watch(key)
+            existing = pipe.get(key)
+            existing = existing.decode() if existing else None
+
+            if existing and is_in_flight(existing, get_state):
+                pipe.unwatch()
+                return existing
+
+            # Previous attempt failed, expired or was never sent, take it over
+            pipe.multi()
+            pipe.set(key, task_id, ex=IDEMPOTENCY_TTL)
+            pipe.set(QUEUED_KEY.format(task_id), key, ex=CLAIM_GRACE)
+            pipe.execute()
+            return None
+
+        except WatchError:
+
+            # Someone else took it over first
+            existing = r.get(key)
+            return existing.decode() if existing else None
+
+
+def claim_jobs(jobs: list, task_ids: list, get_state) -> list:
+    """Claim a batch of jobs in one pipelined round trip.
+
+    Only jobs whose key is already taken fall back to `claim_job` one at a time.
+
+    Args:
+        jobs: jobs with queuer data
+        task_ids: ids the new tasks will be sent with, one per job
+        get_state: callable returning a task's state from its id
+
+    Returns:
+        existing: per job, the in-flight task id to attach to, or None if ours to send
+    """
+
+    r = get_redis()
+    if r is None:
+        return [None] * len(jobs)
+
+    keys = [get_idempotency_key(x) for x in jobs]
+
+    with r.pipeline(transaction=False) as pipe:
+
+        for key, task_id in zip(keys, task_ids):
+            pipe.set(key, task_id, nx=True, ex=IDEMPOTENCY_TTL)
+
+        claimed = pipe.execute()
+
+    with r.pipeline(transaction=False) as pipe:
+
+        for key, task_id, ok in zip(keys, task_ids, claimed):
+            if ok:
+                pipe.set(QUEUED_KEY.format(task_id), key, ex=CLAIM_GRACE)
+
+        pipe.execute()
+
+    return [
+        None if ok else claim_job(job, task_id, get_state)
+        for job, task_id, ok in zip(jobs, task_ids, claimed)
+    ]
+
+
+def mark_queued(task_ids: list):
+    """Record claimed tasks as sent, so they're attached to until they finish"""
+
+    r = get_redis()
+    if r is None or not task_ids:
+        return
+
+    with r.pipeline(transaction=False) as pipe:
+
+        for x in task_ids:
+            pipe.expire(QUEUED_KEY.format(x), IDEMPOTENCY_TTL)
+
+        pipe.execute()
+
+
+def _release_key(r, key: str, task_id: str):
+
+    with r.pipeline() as pipe:
+
+        try:
+
+            pipe.watch(key)
+            holder = pipe.get(key)
+
+            if holder and holder.decode() == task_id:
+                pipe.multi()
+                pipe.delete(key)
+                pipe.execute()
+
+        except WatchError:
+            pass
+
+
+def release_job(job: dict, task_id: str):
+    """Release a job's idempotency key if it's still held by this task"""
+
+    r = get_redis()
+    if r is None:
+        return
+
+    _release_key(r, get_idempotency_key(job), task_id)
+    r.delete(QUEUED_KEY.format(task_id))
+
+
+def release_tasks(task_ids: list) -> int:
+    """Release the idempotency keys of tasks that will never run, by task id alone.
+
+    For tasks revoked, purged or resubmitted before a worker picked them up.
+
+    Returns:
+        released: count of tasks that still held a queued record
+    """
+
+    r = get_redis()
+    if r is None or not task_ids:
+        return 0
+
+    keys = r.mget([QUEUED_KEY.format(x) for x in task_ids])
+
+    for task_id, key in zip(task_ids, keys):
+        if key:
+            _release_key(r, key.decode(), task_id)
+
+    r.delete(*[QUEUED_KEY.format(x) for x in task_ids])
+    return len([x for x in keys if x])
+
+
+def release_unstarted(get_state) -> int:
+    """Release the keys of every queued task that hasn't started, after a purge
+
+    Args:
+        get_state: callable returning a task's state from its id
+
+    Returns:
+        released: count of tasks released
+    """
+
+    r = get_redis()
+    if r is None:
+        return 0
+
+    unstarted = [
+        task_id
+        for task_id in (
+            x.decode()[len(QUEUED_KEY.format("")) :]
+            for x in r.scan_iter(QUEUED_KEY.format("*"))
+        )
+        if get_state(task_id) == "PENDING"
+    ]
+
+    return release_tasks(unstarted)
+
+
+@contextmanager
+def output_lock(path: str, task_id: str, lease: int = LOCK_LEASE):
+    """Hold a lease on an output path while writing it.
+
+    The lease is renewed in the background while the block runs, so a
+    crashed worker releases its paths within `lease` seconds.
+
+    Args:
+        path: output path to lock
+        task_id: task taking the lock, recorded as the holder
+        lease: seconds the lock lasts without renewal
+
+    Raises:
+        OutputLocked: if another task already holds the path
+    """
+
+    r = get_redis()
+    if r is None:
+        yield
+        return
+
+    name = "rprox:lock:" + os.path.normcase(os.path.normpath(path))
+    lock = r.lock(name, timeout=lease, thread_local=False)
+
+    if not lock.acquire(blocking=False, token=task_id):
+        holder = r.get(name)
+        raise OutputLocked(path, holder.decode() if holder else None)
+
+    logger.debug(f"[magenta]Locked output:[/] '{path}'")
+    stop_renewing = threading.Event()
+
+    def renew():
+
+        while not stop_renewing.wait(lease / 3):
+            try:
+                lock.reacquire()
+            except LockError:
+                logger.warning(f"[yellow]Lost lock on '{path}'[/]")
+                return
+
+    renewer = threading.Thread(target=renew, daemon=True)
+    renewer.start()
+
+    try:
+        yield
+
+    finally:
+
+        stop_renewing.set()
+        renewer.join()
+
+        try:
+            lock.release()
+        except LockError:
+            pass
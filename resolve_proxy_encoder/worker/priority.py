@@ -0,0 +1,277 @@
+import json
+import logging
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Union
+
+from celery.signals import after_task_publish, task_postrun
+
+from ..app.utils import core
+from ..settings.manager import SettingsManager
+from .utils import get_redis
+
+core.install_rich_tracebacks()
+
+settings = SettingsManager()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["worker"]["loglevel"])
+
+# Redis transport priorities run 0 (most urgent) to 9.
+# Each step is its own list in Redis that workers empty first.
+PRIORITIES = {"urgent": 0, "high": 3, "normal": 6, "low": 9}
+PRIORITY_STEPS = sorted(PRIORITIES.values())
+
+# Kombu's separator between a queue name and its priority step
+LANE_SEP = "\x06\x16"
+
+# Message header carrying a job's deadline as a UNIX timestamp
+DEADLINE_HEADER = "rprox_deadline"
+
+# Seconds between deadline escalation sweeps, across all queuers and workers
+ESCALATE_INTERVAL = 30
+
+# Sent jobs with deadlines, scored by when they next need escalating
+DEADLINES_KEY = "rprox:deadlines"
+
+_last_escalation = 0.0
+
+# Move a message between priority lists only if it's still waiting.
+# Workers take from the right, so it joins the back of its new lane.
+_MOVE_SCRIPT = """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) == 1 then
+    redis.call('LPUSH', KEYS[2], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+def parse_deadline(deadline: str, now: Union[datetime, None] = None) -> float:
+    """Parse a deadline to a UNIX timestamp.
+
+    Accepts a duration from now ('45m', '2h', '1h30m'), a time of day ('17:30',
+    tomorrow if already past) or a date and time ('2022-03-01 09:00').
+
+    Raises:
+        ValueError: if the deadline can't be parsed
+    """
+
+    now = now if now else datetime.now()
+    deadline = deadline.strip()
+
+    duration = re.fullmatch(r"(?:(\d+)h)?\s*(?:(\d+)m)?", deadline)
+    if duration and any(duration.groups()):
+        hours, minutes = [int(x) if x else 0 for x in duration.groups()]
+        return (now + timedelta(hours=hours, minutes=minutes)).timestamp()
+
+    try:
+
+        time_of_day = datetime.strptime(deadline, "%H:%M")
+        parsed = now.replace(
+            hour=time_of_day.hour, minute=time_of_day.minute, second=0, microsecond=0
+        )
+        if parsed < now:
+            parsed += timedelta(days=1)
+        return parsed.timestamp()
+
+    except ValueError:
+        pass
+
+    for format_ in ["%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M"]:
+        try:
+            return datetime.strptime(deadline, format_).timestamp()
+        except ValueError:
+            continue
+
+    raise ValueError(
+        f"Couldn't parse deadline '{deadline}'. "
+        "Use a duration like '2h', a time like '17:30' or a date like '2022-03-01 09:00'"
+    )
+
+
+def get_deadline_priority(deadline: float, now: Union[float, None] = None) -> int:
+    """Get the priority a deadline calls for, escalating as it approaches"""
+
+    now = now if now else time.time()
+    minutes_left = (deadline - now) / 60
+
+    if minutes_left <= settings["scheduling"]["deadline_urgent_within"]:
+        return PRIORITIES["urgent"]
+
+    if minutes_left <= settings["scheduling"]["deadline_high_within"]:
+        return PRIORITIES["high"]
+
+    return PRIORITIES["low"]
+
+
+def get_priority(name: Union[str, None] = None, deadline: Union[float, None] = None):
+    """Get a job's Redis priority from its named priority and deadline
+
+    Whichever is more urgent wins. Defaults to the configured default priority.
+    """
+
+    priority = PRIORITIES[name if name else settings["scheduling"]["default_priority"]]
+
+    if deadline:
+        priority = min(priority, get_deadline_priority(deadline))
+
+    return priority
+
+
+def get_task_options(job: dict) -> dict:
+    """Get the `apply_async` options that put a job in its priority lane"""
+
+    options = {"priority": get_priority(job.get("priority"), job.get("deadline"))}
+
+    if job.get("deadline"):
+        options.update({"headers": {DEADLINE_HEADER: job["deadline"]}})
+
+    return options
+
+
+def get_lane_key(queue: str, priority: int) -> str:
+    """Get the Redis list a queue's messages of a given priority wait in"""
+
+    return f"{queue}{LANE_SEP}{priority}" if priority else queue
+
+
+def get_escalation_time(deadline: float, priority: int) -> Union[float, None]:
+    """Get when a job at `priority` next needs escalating, or None if it never will"""
+
+    if priority > PRIORITIES["high"]:
+        return deadline - settings["scheduling"]["deadline_high_within"] * 60
+
+    if priority > PRIORITIES["urgent"]:
+        return deadline - settings["scheduling"]["deadline_urgent_within"] * 60
+
+    return None
+
+
+def track_deadline(task_id: str, queue: str, deadline: float, priority: int):
+    """Remember a sent job's deadline, so sweeps only look for it once it's due"""
+
+    due = get_escalation_time(deadline, priority)
+    if due is None:
+        return
+
+    member = json.dumps({"task_id": task_id, "queue": queue, "deadline": deadline})
+    get_redis().zadd(DEADLINES_KEY, {member: due})
+
+
+def _find_waiting(r, queue: str, task_id: str, above: int) -> tuple:
+    """Find a task's waiting message in a queue's lanes less urgent than `above`
+
+    Returns:
+        found: (lane key, lane priority, raw message), or Nones if it isn't waiting there
+    """
+
+    for priority in [x for x in PRIORITY_STEPS if x > above]:
+
+        key = get_lane_key(queue, priority)
+
+        for raw in r.lrange(key, 0, -1):
+            if json.loads(raw).get("headers", {}).get("id") == task_id:
+                return key, priority, raw
+
+    return None, None, None
+
+
+def escalate_deadlines() -> int:
+    """Move waiting jobs up a priority lane as their deadlines approach.
+
+    Messages can't be reprioritised in place, so they're moved between
+    priority lists atomically. Only jobs tracked as due for escalation
+    are looked for, in their own queue's lanes. Whichever queuer or worker
+    calls this first each `ESCALATE_INTERVAL` does the sweep, the rest
+    return straight away.
+
+    Returns:
+        moved: count of messages escalated
+    """
+
+    global _last_escalation
+
+    if time.monotonic() - _last_escalation < ESCALATE_INTERVAL:
+        return 0
+    _last_escalation = time.monotonic()
+
+    # Only the broker holds waiting messages
+    if not str(settings["celery"]["broker_url"]).startswith(("redis://", "rediss://")):
+        return 0
+
+    r = get_redis()
+    if not r.set("rprox:escalate", 1, nx=True, ex=ESCALATE_INTERVAL):
+        return 0
+
+    move = r.register_script(_MOVE_SCRIPT)
+    moved = 0
+
+    for member in r.zrangebyscore(DEADLINES_KEY, "-inf", time.time()):
+
+        r.zrem(DEADLINES_KEY, member)
+        tracked = json.loads(member)
+
+        wanted = get_deadline_priority(tracked["deadline"])
+        key, priority, raw = _find_waiting(
+            r, tracked["queue"], tracked["task_id"], wanted
+        )
+
+        # Not found if it's been taken by a worker, or is already as urgent
+        if raw is not None:
+
+            message = json.loads(raw)
+            message["properties"]["priority"] = wanted
+
+            moved += move(
+                keys=[key, get_lane_key(tracked["queue"], wanted)],
+                args=[raw, json.dumps(message)],
+            )
+
+        # Look again when it's due the next step up, if there is one
+        track_deadline(
+            tracked["task_id"], tracked["queue"], tracked["deadline"], wanted
+        )
+
+    if moved:
+        logger.info(f"[cyan]Escalated {moved} jobs nearing their deadline[/]")
+
+    return moved
+
+
+@after_task_publish.connect
+def track_published_deadline(sender=None, headers=None, routing_key=None, **kwargs):
+    """Track jobs sent with a deadline, wherever they're sent from.
+
+    Tracked as if in the least urgent lane, so they're first looked for
+    as early as any job with their deadline could need escalating.
+    """
+
+    deadline = (headers or {}).get(DEADLINE_HEADER)
+    if not deadline or get_redis() is None:
+        return
+
+    try:
+        track_deadline(
+            headers["id"],
+            routing_key,
+            deadline,
+            PRIORITY_STEPS[-1],
+        )
+
+    except Exception as e:
+        logger.warning(
+            f"[yellow]Couldn't track deadline of task {headers['id']}[/]\n{e}"
+        )
+
+
+@task_postrun.connect
+def escalate_after_task(**kwargs):
+    """Sweep before the worker takes its next job, so escalations count"""
+
+    try:
+        escalate_deadlines()
+
+    except Exception as e:
+        logger.warning(f"[yellow]Couldn't escalate deadlines[/]\n{e}")
@@ -0,0 +1,279 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from functools import lru_cache
+from typing import Union
+
+from redis.exceptions import RedisError
+
+from ..app.utils import core
+from ..settings.manager import SettingsManager
+from . import scratch
+from .registry import get_settings_hash
+from .utils import get_redis
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Not on Windows, so no reflinks
+
+core.install_rich_tracebacks()
+
+settings = SettingsManager()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["worker"]["loglevel"])
+
+# Finished proxies by source content and the settings that encoded them
+CACHE_KEY = "rprox:proxycache:{}:{}"
+
+# Seconds an entry's kept without being hit
+CACHE_TTL = 90 * 24 * 60 * 60
+
+# Chunks read from across a source to fingerprint it, and their size
+FINGERPRINT_SAMPLES = 4
+FINGERPRINT_SAMPLE_BYTES = 64 * 1024
+
+# Linux's ioctl to share a file's extents on copy-on-write filesystems
+FICLONE = 0x40049409
+
+# Proxy settings that don't change what's encoded
+IGNORED_SETTINGS = ["ffmpeg_loglevel"]
+
+
+def is_enabled(paths_settings: dict) -> bool:
+    """The cache index lives in Redis, so reuse needs it"""
+
+    return bool(paths_settings.get("proxy_cache")) and get_redis() is not None
+
+
+@lru_cache(maxsize=4096)
+def _fingerprint(file_path: str, size: int, mtime: float) -> str:
+
+    hasher = hashlib.blake2b(str(size).encode(), digest_size=16)
+    span = max(0, size - FINGERPRINT_SAMPLE_BYTES)
+
+    with open(file_path, "rb") as file:
+
+        # Evenly spaced, first at the start and last at the end
+        for i in range(FINGERPRINT_SAMPLES):
+            file.seek(span * i // (FINGERPRINT_SAMPLES - 1))
+            hasher.update(file.read(FINGERPRINT_SAMPLE_BYTES))
+
+    return hasher.hexdigest()
+
+
+def get_fingerprint(file_path: str) -> Union[str, None]:
+    """Fingerprint a source's content from its size and a few chunks from across it.
+
+    Reads a fixed, small amount however big the source, and doesn't depend on
+    its path or modified time, so copies on other cards, drives or paths match.
+
+    Returns:
+        fingerprint: hex digest, or None if the source can't be read from here
+    """
+
+    try:
+        stat = os.stat(file_path)
+        return _fingerprint(file_path, stat.st_size, stat.st_mtime)
+
+    except OSError:
+        return None
+
+
+def get_cache_key(job: dict, fingerprint: str) -> str:
+    """Key a job's proxy on its source content and everything that changes the encode"""
+
+    encode_settings = {
+        k: v for k, v in job["proxy_settings"].items() if k not in IGNORED_SETTINGS
+    }
+    encode_settings.update({"h_flip": job["h_flip"], "v_flip": job["v_flip"]})
+
+    return CACHE_KEY.format(fingerprint, get_settings_hash(encode_settings))
+
+
+def lookup(job: dict) -> Union[dict, None]:
+    """Find a finished proxy of the same source content with the same settings.
+
+    Entries whose proxy has gone or changed size are dropped.
+
+    Returns:
+        entry: dict of `proxy` path, its `size` and any `renditions`, or None if no hit
+    """
+
+    fingerprint = get_fingerprint(job["file_path"])
+    if fingerprint is None:
+        return None
+
+    r = get_redis()
+    key = get_cache_key(job, fingerprint)
+
+    try:
+
+        entry = r.get(key)
+        if not entry:
+            return None
+
+        entry = json.loads(entry)
+
+        try:
+            valid = os.path.getsize(entry["proxy"]) == entry["size"]
+        except OSError:
+            valid = False
+
+        if not valid:
+            r.delete(key)
+            return None
+
+        r.expire(key, CACHE_TTL)
+        return entry
+
+    except RedisError as e:
+        logger.warning(f"[yellow]Couldn't check proxy cache[/]\n{e}")
+        return None
+
+
+def store(job: dict, output_file: str, renditions: Union[dict, None] = None):
+    """Record a finished proxy so identical sources can reuse it"""
+
+    fingerprint = get_fingerprint(job["file_path"])
+    if fingerprint is None:
+        return
+
+    try:
+
+        entry = {
+            "proxy": output_file,
+            "size": os.path.getsize(output_file),
+            "renditions": {k: v for k, v in (renditions or {}).items() if v},
+        }
+        get_redis().set(
+            get_cache_key(job, fingerprint), json.dumps(entry), ex=CACHE_TTL
+        )
+
+    except (OSError, RedisError) as e:
+        logger.warning(f"[yellow]Couldn't add proxy to cache[/]\n{e}")
+
+
+def _reflink(source: str, destination: str):
+
+    if fcntl is None:
+        raise OSError("Reflinks aren't supported here")
+
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def materialize(source: str, destination: str) -> str:
+    """Put a copy of a cached file at a new path, as cheaply as the storage allows.
+
+    Tries a hard link, then a copy-on-write reflink, then a full copy.
+    Written beside the destination then renamed into place,
+    so nothing ever sees a partial file.
+
+    Returns:
+        method: 'hardlink', 'reflink' or 'copy'
+
+    Raises:
+        OSError: if the file couldn't be put in place at all
+    """
+
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    temp_file = scratch.get_temp_file(destination)
+
+    try:
+
+        try:
+            os.link(source, temp_file)
+            method = "hardlink"
+
+        except OSError:
+
+            try:
+                _reflink(source, temp_file)
+                method = "reflink"
+
+            except OSError:
+                shutil.copyfile(source, temp_file)
+                method = "copy"
+
+        os.replace(temp_file, destination)
+
+    except OSError:
+
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+
+        raise
+
+    return method
+
+
+def reuse(job: dict, output_file: str) -> Union[dict, None]:
+    """Satisfy a job from the cache, if an identical source's proxy exists.
+
+    Args:
+        job: job with its settings resolved
+        output_file: where the job's proxy is expected
+
+    Returns:
+        entry: the cache hit, with `renditions` put in place beside the proxy,
+         or None if there's no usable hit
+    """
+
+    entry = lookup(job)
+    if entry is None or os.path.normpath(entry["proxy"]) == os.path.normpath(
+        output_file
+    ):
+        return None
+
+    try:
+
+        method = materialize(entry["proxy"], output_file)
+        logger.info(
+            f"[green]Reused cached proxy '{entry['proxy']}' for "
+            f"'{job['file_name']}' ({method})[/]"
+        )
+
+    except OSError as e:
+        logger.warning(f"[yellow]Couldn't reuse cached proxy[/]\n{e}")
+        return None
+
+    renditions = dict()
+
+    for name, path in entry.get("renditions", {}).items():
+
+        destination = os.path.join(
+            os.path.dirname(output_file),
+            name,
+            os.path.splitext(os.path.basename(output_file))[0]
+            + os.path.splitext(path)[1],
+        )
+
+        try:
+            materialize(path, destination)
+            renditions.update({name: destination})
+
+        except OSError:
+            renditions.update({name: None})
+
+    return dict(entry, proxy=output_file, renditions=renditions)
+
+
+def break_hardlink(path: str):
+    """Unlink a proxy shared with others before it's overwritten.
+
+    FFmpeg truncates and rewrites outputs in place, which would
+    rewrite every hard link to a reused proxy at once.
+    """
+
+    try:
+        if os.stat(path).st_nlink > 1:
+            os.remove(path)
+
+    except OSError:
+        pass
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Union
+
+from ..app.utils import core
+from ..settings.manager import USER_SETTINGS_FILE, SettingsManager
+from .utils import get_redis
+
+core.install_rich_tracebacks()
+
+settings = SettingsManager()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["worker"]["loglevel"])
+
+# Profiles are content-addressed, so a cached copy never goes stale
+PROFILE_CACHE_DIR = os.path.join(os.path.dirname(USER_SETTINGS_FILE), "profiles")
+
+# Seconds a published profile stays in Redis. Refreshed every time it's published.
+PROFILE_TTL = 30 * 24 * 60 * 60
+
+# Worker processes can be short lived (max_tasks_per_child), so also cache to disk
+_profiles = dict()
+
+
+class ProfileNotFound(Exception):
+    """A job's settings profile isn't cached locally or published in Redis"""
+
+
+def get_settings_hash(settings_: dict) -> str:
+    """Hash settings so identical profiles give identical keys"""
+
+    return hashlib.sha256(
+        json.dumps(settings_, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def get_profile(proxy_settings: dict, paths_settings: dict) -> dict:
+    """Get the settings profile the queuer sends to workers"""
+
+    return {
+        "proxy_settings": dict(proxy_settings),
+        "paths_settings": dict(paths_settings),
+    }
+
+
+def publish_profile(profile: dict) -> Union[str, None]:
+    """Publish a settings profile once, under its content hash.
+
+    Args:
+        profile: settings profile from `get_profile`
+
+    Returns:
+        settings_hash: the profile's hash, or None if there's no Redis to publish to
+    """
+
+    r = get_redis()
+    if r is None:
+        return None
+
+    settings_hash = get_settings_hash(profile)
+    r.set(
+        f"rprox:profile:{settings_hash}",
+        json.dumps(profile, default=str),
+        ex=PROFILE_TTL,
+    )
+
+    logger.debug(f"[magenta]Published settings profile:[/] {settings_hash}")
+    return settings_hash
+
+
+def get_published_profile(settings_hash: str) -> dict:
+    """Get a settings profile by hash from memory, disk cache or Redis, in that order
+
+    Raises:
+        ProfileNotFound: if the profile can't be found anywhere
+    """
+
+    if settings_hash in _profiles:
+        return _profiles[settings_hash]
+
+    cache_file = os.path.join(PROFILE_CACHE_DIR, f"{settings_hash}.json")
+
+    if os.path.exists(cache_file):
+
+        with open(cache_file) as file:
+            profile = json.load(file)
+
+    else:
+
+        r = get_redis()
+        published = r.get(f"rprox:profile:{settings_hash}") if r else None
+
+        if not published:
+            raise ProfileNotFound(
+                f"Settings profile '{settings_hash}' isn't published. "
+                "Has it expired? Requeue the job."
+            )
+
+        profile = json.loads(published)
+
+        try:
+
+            os.makedirs(PROFILE_CACHE_DIR, exist_ok=True)
+            with open(cache_file, "w") as file:
+                json.dump(profile, file)
+
+        except OSError as e:
+            logger.warning(f"[yellow]Couldn't cache settings profile[/]\n{e}")
+
+    _profiles[settings_hash] = profile
+    return profile
+
+
+def resolve_job(job: dict) -> dict:
+    """Fill in a slim job's settings from its published profile, in place
+
+    Jobs that already carry their settings are returned unchanged.
+    """
+
+    if "proxy_settings" in job or not job.get("settings_hash"):
+        return job
+
+    job.update(get_published_profile(job["settings_hash"]))
+    return job
@@ -0,0 +1,179 @@
+import logging
+import os
+import platform
+import re
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+
+from celery.signals import worker_ready
+
+from ..app.utils import core
+from ..settings.manager import SettingsManager
+
+core.install_rich_tracebacks()
+
+settings = SettingsManager()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["worker"]["loglevel"])
+
+# Suffix of files being written to the share, before they're renamed into place
+TEMP_SUFFIX = ".rprox_tmp"
+
+# Records the share temp file an encode is publishing, for cleanup after a crash
+JOURNAL_NAME = ".publishing"
+
+# Bytes copied to the share between checks against the publish rate limit
+PUBLISH_CHUNK_BYTES = 4 * 1024 * 1024
+
+
+def is_enabled() -> bool:
+    return bool(settings["worker"]["scratch_dir"])
+
+
+def get_temp_file(path: str) -> str:
+    """Get the name a file's written to on the share before it's renamed into place"""
+
+    return path + TEMP_SUFFIX
+
+
+def get_worker_dir(worker: str) -> str:
+    """Get a worker's own folder in the scratch dir, so workers sharing a machine never clean up each other's encodes"""
+
+    return os.path.join(
+        settings["worker"]["scratch_dir"],
+        re.sub(r"[^\w.-]", "_", worker or platform.node()),
+    )
+
+
+@contextmanager
+def scratch_file(output_file: str, worker: str):
+    """Give an encode somewhere local to write, instead of straight to the share.
+
+    Each encode gets its own folder in the worker's scratch dir,
+    removed with everything in it once the block finishes.
+
+    Yields:
+        encode_file: path to encode to. Just `output_file` if scratch is disabled.
+    """
+
+    if not is_enabled():
+        yield output_file
+        return
+
+    encode_dir = os.path.join(get_worker_dir(worker), uuid.uuid4().hex)
+    os.makedirs(encode_dir, exist_ok=True)
+
+    try:
+        yield os.path.join(encode_dir, os.path.basename(output_file))
+
+    finally:
+        shutil.rmtree(encode_dir, ignore_errors=True)
+
+
+def publish(source: str, destination: str):
+    """Move a finished file from scratch onto the share, atomically.
+
+    Copied to a temporary name beside the destination, synced, then renamed
+    into place, so Resolve and the queuer never see a half-written proxy.
+    Copying is held to `publish_rate_limit` MB/s, if set, to leave the
+    share's bandwidth for other encodes' reads.
+
+    Raises:
+        OSError: if the file couldn't be published. Nothing's left on the share.
+    """
+
+    temp_file = get_temp_file(destination)
+    journal = os.path.join(os.path.dirname(source), JOURNAL_NAME)
+    rate_limit = settings["worker"]["publish_rate_limit"] * 1024 * 1024
+
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+
+    with open(journal, "a") as file:
+        file.write(temp_file + "\n")
+
+    started = time.monotonic()
+    copied = 0
+
+    try:
+
+        with open(source, "rb") as src, open(temp_file, "wb") as dst:
+
+            while True:
+
+                chunk = src.read(PUBLISH_CHUNK_BYTES)
+                if not chunk:
+                    break
+
+                dst.write(chunk)
+                copied += len(chunk)
+
+                if rate_limit:
+                    ahead = copied / rate_limit - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+            dst.flush()
+            os.fsync(dst.fileno())
+
+        shutil.copystat(source, temp_file)
+        os.replace(temp_file, destination)
+
+    except OSError:
+
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+
+        raise
+
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"[green]Published '{os.path.basename(destination)}', "
+        f"{copied / 1024**2:.0f} MB in {elapsed:.1f}s[/]"
+    )
+
+
+def clean_orphans(worker: str):
+    """Remove a worker's scratch files and half-published temp files left by a crash"""
+
+    worker_dir = get_worker_dir(worker)
+    if not os.path.isdir(worker_dir):
+        return
+
+    for name in os.listdir(worker_dir):
+
+        encode_dir = os.path.join(worker_dir, name)
+        journal = os.path.join(encode_dir, JOURNAL_NAME)
+
+        if os.path.exists(journal):
+
+            with open(journal) as file:
+                temp_files = [x.strip() for x in file if x.strip()]
+
+            for x in temp_files:
+                try:
+                    os.remove(x)
+                    logger.info(f"[yellow]Removed orphaned temp file '{x}'[/]")
+                except OSError:
+                    pass
+
+        shutil.rmtree(encode_dir, ignore_errors=True)
+        logger.info(f"[yellow]Removed orphaned scratch files '{encode_dir}'[/]")
+
+
+@worker_ready.connect
+def clean_orphans_on_ready(sender=None, **kwargs):
+    """Clean up after a crash before taking new jobs"""
+
+    if not is_enabled():
+        return
+
+    try:
+        clean_orphans(sender.hostname)
+
+    except Exception as e:
+        logger.warning(f"[yellow]Couldn't clean up scratch dir[/]\n{e}")
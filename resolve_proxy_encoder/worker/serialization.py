@@ -0,0 +1,119 @@
+import logging
+import zlib
+
+from kombu.serialization import register
+from kombu.utils.json import dumps as json_dumps
+from kombu.utils.json import loads as json_loads
+
+from ..app.utils import core
+from ..settings.manager import SettingsManager
+
+core.install_rich_tracebacks()
+
+settings = SettingsManager()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["worker"]["loglevel"])
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+SERIALIZER_NAME = "rprox"
+CONTENT_TYPE = "application/x-rprox"
+
+# Compact payloads start with this, then a format byte and a compression byte.
+# Anything else is plain JSON, so compact and plain senders can share a farm.
+MAGIC = b"RPX1"
+FORMAT_MSGPACK = b"m"
+FORMAT_JSON = b"j"
+COMPRESSED = b"z"
+UNCOMPRESSED = b"-"
+
+
+def _default(obj):
+    """Fall back to strings for types msgpack can't pack, as JSON would"""
+
+    return str(obj)
+
+
+def encode(obj, compact: bool = True, compression_threshold: int = 1024) -> bytes:
+    """Serialize to plain JSON, or compactly.
+
+    Compact payloads are msgpack if installed, otherwise JSON,
+    zlib compressed if at least `compression_threshold` bytes.
+    """
+
+    if not compact:
+        return json_dumps(obj).encode("utf-8")
+
+    if msgpack:
+        data = msgpack.packb(obj, use_bin_type=True, default=_default)
+        format_ = FORMAT_MSGPACK
+
+    else:
+        data = json_dumps(obj).encode("utf-8")
+        format_ = FORMAT_JSON
+
+    if len(data) >= compression_threshold:
+        return MAGIC + format_ + COMPRESSED + zlib.compress(data)
+
+    return MAGIC + format_ + UNCOMPRESSED + data
+
+
+def dumps(obj) -> bytes:
+    """Serialize for the broker or result backend, as configured"""
+
+    return encode(
+        obj,
+        compact=settings["celery"]["compact_serialization"],
+        compression_threshold=settings["celery"]["compression_threshold"],
+    )
+
+
+def loads(data):
+    """Deserialize anything `dumps` wrote, compact or plain"""
+
+    if isinstance(data, str):
+        data = data.encode("latin-1")
+
+    if not data.startswith(MAGIC):
+        return json_loads(data)
+
+    format_ = data[len(MAGIC) : len(MAGIC) + 1]
+    compression = data[len(MAGIC) + 1 : len(MAGIC) + 2]
+    data = data[len(MAGIC) + 2 :]
+
+    if compression == COMPRESSED:
+        data = zlib.decompress(data)
+
+    if format_ == FORMAT_MSGPACK:
+
+        if msgpack is None:
+            raise RuntimeError(
+                "Received a msgpack payload, but msgpack isn't installed here. "
+                "Install it with 'pip install msgpack'"
+            )
+
+        return msgpack.unpackb(data, raw=False)
+
+    return json_loads(data)
+
+
+def register_serializer():
+    """Register the serializer with Kombu, for tasks and results"""
+
+    register(
+        SERIALIZER_NAME,
+        dumps,
+        loads,
+        content_type=CONTENT_TYPE,
+        content_encoding="binary",
+    )
+
+    if settings["celery"]["compact_serialization"] and msgpack is None:
+        logger.warning(
+            "[yellow]msgpack isn't installed. Compact serialization will "
+            "compress JSON instead. Install it with 'pip install msgpack'[/]"
+        )
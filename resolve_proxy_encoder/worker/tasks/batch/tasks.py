@@ -0,0 +1,170 @@
+#!/usr/bin/env python3.6
+
+import logging
+
+from celery import states, uuid
+from rich import print
+from rich.console import Console
+
+from ....app.utils import core
+from ....settings.manager import SettingsManager
+from ....worker import cancel, iolimits, locks, registry
+from ....worker.celery import app
+from ....worker.tasks.encode.tasks import (
+    encode_job,
+    get_output_file,
+    get_progress_publisher,
+)
+from ....worker.utils import get_queue
+
+settings = SettingsManager()
+console = Console()
+
+core.install_rich_tracebacks()
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["worker"]["loglevel"])
+
+
+def get_batch_signature(jobs: list, task_ids: list, batch_id: str = None):
+    """Get a signature that encodes many short jobs, one after another, on one worker.
+
+    Each job keeps its own task id. The batch stores every job's result
+    under it as it finishes, so jobs are tracked and linked exactly as if
+    they'd been sent individually.
+
+    Args:
+        jobs: job payloads to encode, in order
+        task_ids: task id to store each job's result under
+        batch_id: optional task id for the batch itself. Generated if None.
+
+    Returns:
+        signature: `encode_batch` signature
+    """
+
+    return encode_batch.s(jobs, task_ids).set(task_id=batch_id if batch_id else uuid())
+
+
+def encode_clip(task, job: dict, task_id: str) -> dict:
+    """Encode one job of a batch, publishing progress under its own task id
+
+    Raises:
+        RuntimeError: if FFmpeg fails
+        locks.OutputLocked: if another task is writing the same proxy
+        cancel.Cancelled: if the job was cancelled
+    """
+
+    try:
+
+        registry.resolve_job(job)
+        logger.info(f"[magenta bold]Job: [/]{task_id}")
+
+        with locks.output_lock(get_output_file(job), task_id), iolimits.storage_slots(
+            job, task_id
+        ):
+
+            return encode_job(
+                job,
+                progress_callback=get_progress_publisher(
+                    task, job["frames"], task_id=task_id
+                ),
+                worker=task.request.hostname,
+                cancel_ids=[task_id],
+            )
+
+    finally:
+
+        # Let later duplicates, a retry or another queuer claim it,
+        # however the clip ended
+        locks.release_job(job, task_id)
+
+
+class BatchTask(app.Task):
+    """Fail any jobs a batch never got to, so nothing waits on them forever"""
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+
+        _, task_ids = args
+
+        for x in task_ids:
+            if self.backend.get_state(x) not in states.READY_STATES:
+                self.backend.store_result(x, exc, states.FAILURE)
+
+
+@app.task(
+    bind=True,
+    base=BatchTask,
+    acks_late=True,
+    track_started=True,
+    prefetch_limit=1,
+    queue=get_queue(),
+)
+def encode_batch(self, jobs, task_ids):
+    """
+    Celery task to encode a batch of short clips one after another.
+
+    Saves a broker round trip and task setup per clip. A clip that fails
+    is recorded as failed under its own task id and the rest carry on.
+    Clips already finished by an earlier delivery of the batch are skipped,
+    as are cancelled clips.
+    """
+
+    print("\n")
+    console.rule(
+        f"[green]Received batch of {len(jobs)} proxy encode jobs :package:[/]",
+        align="left",
+    )
+    print("\n")
+
+    encoded = []
+    failed = []
+    cancelled = []
+
+    for i, (job, task_id) in enumerate(zip(jobs, task_ids), start=1):
+
+        if self.backend.get_state(task_id) == states.SUCCESS:
+            logger.info(f"[green]Already encoded '{job['file_name']}'. Skipping.[/]")
+            encoded.append(job["file_name"])
+            continue
+
+        if cancel.is_cancelled([task_id]):
+            locks.release_job(job, task_id)
+            self.backend.mark_as_revoked(task_id, reason="cancelled")
+            cancelled.append(job["file_name"])
+            continue
+
+        logger.info(f"[cyan]Clip {i}/{len(jobs)}[/]")
+        self.backend.store_result(task_id, None, states.STARTED)
+
+        try:
+            result = encode_clip(self, job, task_id)
+
+        except cancel.Cancelled:
+
+            logger.warning(f"[yellow]'{job['file_name']}' was cancelled[/]")
+            self.backend.mark_as_revoked(task_id, reason="cancelled")
+            cancelled.append(job["file_name"])
+            continue
+
+        except Exception as e:
+
+            logger.error(f"[red]Couldn't encode '{job['file_name']}'[/]\n{e}")
+            self.backend.store_result(task_id, e, states.FAILURE)
+            failed.append(job["file_name"])
+            continue
+
+        self.backend.store_result(task_id, result, states.SUCCESS)
+        encoded.append(job["file_name"])
+
+    if cancelled:
+        logger.warning(
+            f"[yellow]{len(cancelled)}/{len(jobs)} clips in batch were cancelled[/]"
+        )
+
+    if failed:
+        logger.warning(
+            f"[yellow]{len(failed)}/{len(jobs)} clips in batch failed to encode[/]"
+        )
+    elif not cancelled:
+        logger.info(f"[green]Encoded all {len(jobs)} clips in batch[/]")
+
+    return {"encoded": encoded, "failed": failed, "cancelled": cancelled}
@@ -2,14 +2,27 @@
 
 import logging
 import os
+import time
 from webbrowser import get
 
 from ....app.utils import core
 from ....settings.manager import SettingsManager
+from ....worker import (
+    affinity,
+    cancel,
+    iolimits,
+    locks,
+    proxycache,
+    registry,
+    scratch,
+    timelimits,
+)
 from ....worker.celery import app
 from ....worker.ffmpeg.ffmpeg_process import FfmpegProcess
+from ....worker.ffmpeg.utils import get_audio_streams
 from ....worker.utils import check_wsl, get_wsl_path, get_queue
 
+from celery.exceptions import Ignore
 from rich import print
 from rich.console import Console
 
@@ -22,63 +35,226 @@ core.install_rich_tracebacks()
 logger = logging.getLogger(__name__)
 logger.setLevel(settings["worker"]["loglevel"])
 
+# Minimum seconds between progress updates sent to the result backend
+PROGRESS_UPDATE_INTERVAL = 2
+
+
+def get_output_file(job: dict) -> str:
+    """Get the proxy output path for a job. Linking expects exactly this path."""
+
+    return os.path.join(
+        job["proxy_dir"],
+        os.path.splitext(job["file_name"])[0] + job["proxy_settings"]["ext"],
+    )
 
-@app.task(
-    bind=True,
-    acks_late=True,
-    track_started=True,
-    prefetch_limit=1,
-    soft_time_limit=60,
-    queue=get_queue(),
-)
-def encode_proxy(self, job):
 
+def get_rendition_files(job: dict, output_file: str) -> list:
+    """Get where each extra rendition of a job is written.
+
+    Each goes in a subfolder of the proxy dir named after it,
+    so it's never mistaken for the proxy itself.
+
+    Returns:
+        renditions: list of (rendition settings, output path)
     """
-    Celery task to encode proxy media using parameters in job argument
-    and user-defined settings
+
+    base = os.path.splitext(os.path.basename(output_file))[0]
+
+    return [
+        (
+            x,
+            os.path.join(
+                os.path.dirname(output_file),
+                x["name"],
+                base
+                + x.get("ext", ".jpg" if x.get("type") == "thumbnails" else ".mp4"),
+            ),
+        )
+        for x in job["proxy_settings"].get("renditions") or []
+    ]
+
+
+def get_rendition_args(
+    job: dict, rendition: dict, label: str, frames: int = None
+) -> tuple:
+    """Get the filter chain and output args for one extra rendition.
+
+    Video renditions are scaled and re-encoded with their own codec.
+    Thumbnails are a single JPEG strip of `count` frames spread evenly across the clip.
+    A segment's strip gets its share of them, by length.
+
+    Args:
+        job: job with queuer data
+        rendition: rendition settings
+        label: filter graph label its split of the decoded video arrives on
+        frames: frames encoded, if only a segment of the job
+
+    Returns:
+        (filter chain, output args without the output path)
     """
 
-    # Use app configuration passed in task
-    proxy_settings = job["proxy_settings"]
-    path_settings = job["paths_settings"]
+    v_res = int(rendition.get("vertical_res", 360))
 
-    print("\n")
-    console.rule(f"[green]Received proxy encode job :clapper:[/]", align="left")
-    print("\n")
+    if rendition.get("type") == "thumbnails":
+
+        count = int(rendition.get("count", 10))
+
+        if frames is not None:
+            count = max(1, round(count * int(frames) / max(int(job["frames"]), 1)))
+        else:
+            frames = int(job["frames"])
+
+        duration = max(int(frames) / float(job["fps"]), 1)
+
+        chain = (
+            f"[{label}]fps={count}/{duration:.3f},scale=-2:{v_res},"
+            f"tile={count}x1[{label}out]"
+        )
+        return chain, ["-map", f"[{label}out]", "-frames:v", "1", "-q:v", "3"]
 
-    logger.info(
-        f"[magenta bold]Job: [/]{self.request.id}\n" f"Input File: '{job['file_path']}'"
+    chain = (
+        f"[{label}]scale=-2:{v_res},"
+        f"format={rendition.get('pix_fmt', 'yuv420p')}[{label}out]"
     )
+    args = ["-map", f"[{label}out]", "-c:v", rendition.get("codec", "libx264")]
 
-    # TODO: Integrate cross-platform path mapping. Move `check_wsl` func.
-    # Convert paths for WSL
-    if check_wsl():
-        job["proxy_dir"].update(get_wsl_path(job["proxy_dir"]))
+    if rendition.get("profile"):
+        args += ["-profile:v", rendition["profile"]]
 
-    # Create proxy dir
+    if rendition.get("audio_codec"):
+        args += ["-map", "0:a:0?", "-c:a", rendition["audio_codec"]]
 
-    logger.debug(f"Output Dir: '{job['proxy_dir']}'")
-    try:
+    return chain, args
 
-        os.makedirs(
-            job["proxy_dir"],
-            exist_ok=True,
-        )
 
-    except OSError as e:
-        logger.error(f"Error creating proxy directory: {e}")
-        raise e
+def get_audio_plan(job: dict) -> dict:
+    """Decide what happens to each of the source's audio streams.
 
-    output_file = os.path.join(
-        job["proxy_dir"],
-        os.path.splitext(job["file_name"])[0] + proxy_settings["ext"],
-    )
-    logger.info(f"Output File: '{output_file}'\n")
+    Which streams are kept is set by `audio_tracks`: the "first", "all",
+    the first "downmix"ed to stereo, or "none". With `audio_copy`, streams
+    already in the proxy's audio codec and sample rate are copied untouched.
+
+    Returns:
+        plan: dict of the `policy` and each kept stream's source `index` and
+         `action`: "copy", "encode" or "downmix". `streams` is None if the
+         source couldn't be probed, and the first stream is encoded as before.
+    """
+
+    proxy_settings = job["proxy_settings"]
+    policy = proxy_settings["audio_tracks"]
 
-    # Get Resolutions
-    source_res = [int(x) for x in job["resolution"]]
+    if policy == "none":
+        return {"policy": policy, "streams": []}
+
+    streams = get_audio_streams(job["file_path"])
+    if streams is None:
+        return {"policy": policy, "streams": None}
+
+    if policy != "all":
+        streams = streams[:1]
+
+    plan = []
+
+    for i, x in enumerate(streams):
+
+        if policy == "downmix" and x["channels"] > 2:
+            action = "downmix"
+
+        elif (
+            proxy_settings["audio_copy"]
+            and x["codec"] == proxy_settings["audio_codec"]
+            and x["sample_rate"] == proxy_settings["audio_samplerate"]
+        ):
+            action = "copy"
+
+        else:
+            action = "encode"
+
+        plan.append({"index": i, "action": action})
+
+    return {"policy": policy, "streams": plan}
+
+
+def format_audio_plan(audio: dict) -> str:
+    """Describe an audio plan in a few words, for logging"""
+
+    if audio["streams"] is None:
+        return "couldn't probe, encoding first stream"
+
+    if not audio["streams"]:
+        return "none"
+
+    return ", ".join(f"stream {x['index']} {x['action']}" for x in audio["streams"])
+
+
+def get_audio_args(job: dict, audio: dict) -> list:
+    """Get the FFmpeg args to map and encode, or copy, audio per an audio plan"""
+
+    proxy_settings = job["proxy_settings"]
+
+    if audio["streams"] is None:
+        return [
+            "-map",
+            "0:a:0?",
+            "-c:a",
+            proxy_settings["audio_codec"],
+            "-ar",
+            proxy_settings["audio_samplerate"],
+        ]
+
+    args = []
+
+    for n, x in enumerate(audio["streams"]):
+
+        args += ["-map", f"0:a:{x['index']}"]
+
+        if x["action"] == "copy":
+            args += [f"-c:a:{n}", "copy"]
+            continue
+
+        args += [
+            f"-c:a:{n}",
+            proxy_settings["audio_codec"],
+            f"-ar:a:{n}",
+            proxy_settings["audio_samplerate"],
+        ]
+
+        if x["action"] == "downmix":
+            args += [f"-ac:a:{n}", "2"]
+
+    return args
+
+
+def get_ffmpeg_command(
+    job: dict,
+    output_file: str,
+    seek: str = None,
+    duration: str = None,
+    audio: dict = None,
+    frames: int = None,
+) -> list:
+    """Build the FFmpeg command to encode a job's proxy.
+
+    With extra renditions configured, the source is decoded once and split
+    between the proxy and every rendition. Renditions come before the proxy,
+    so the proxy is still the last arg. Segments encode their part of each,
+    to be joined with the proxy.
+    Decode, filter and encode threads are held to the worker's share of cores.
+
+    Args:
+        job: job with queuer data
+        output_file: path to write to
+        seek: optional input seek in seconds, for encoding part of the source
+        duration: optional output duration in seconds
+        audio: audio plan from `get_audio_plan`. Probed from the source if None.
+        frames: frames in the segment, if only part of the source
+
+    Returns:
+        ffmpeg_command: list of FFmpeg args, output file last
+    """
+
+    proxy_settings = job["proxy_settings"]
     v_res = int(proxy_settings["vertical_res"])
-    logger.info(f"Source Resolution: {source_res}")
 
     def get_flip():
 
@@ -95,16 +271,71 @@ def encode_proxy(self, job):
 
         return flip
 
-    # Log Timecode
-    logger.info(f"Starting Timecode: {job['start_tc']}")
-
-    # Get FFmpeg Command
-    ffmpeg_command = [
+    if audio is None:
+        audio = get_audio_plan(job)
+
+    # Leave cores for the machine's other encodes
+    threads = affinity.get_thread_count()
+
+    # Segments take timecode when they're joined
+    timecode_args = ["-timecode", job["start_tc"]] if seek is None else []
+
+    renditions = get_rendition_files(job, output_file)
+
+    if renditions:
+
+        labels = [f"r{i}" for i in range(len(renditions))]
+        graph = [
+            f"[0:v]{get_flip()}split={len(renditions) + 1}[main]"
+            + "".join(f"[{x}]" for x in labels),
+            f"[main]scale=-2:{v_res},format={proxy_settings['pix_fmt']}[mainout]",
+        ]
+        rendition_args = []
+
+        for (rendition, path), label in zip(renditions, labels):
+            chain, args = get_rendition_args(job, rendition, label, frames=frames)
+            graph.append(chain)
+            rendition_args += [*args, *affinity.get_output_thread_args(threads), path]
+
+        return [
+            "ffmpeg",
+            "-y",  # Never prompt!
+            *proxy_settings["misc_args"],  # User global settings
+            *affinity.get_input_thread_args(threads),
+            *(["-ss", seek] if seek is not None else []),
+            # Limits every output, where -t after the input would only limit the first
+            *(["-t", duration] if duration is not None else []),
+            "-i",
+            job["file_path"],
+            "-filter_complex",
+            ";".join(graph),
+            *rendition_args,
+            "-map",
+            "[mainout]",
+            *get_audio_args(job, audio),
+            "-c:v",
+            proxy_settings["codec"],
+            "-profile:v",
+            proxy_settings["profile"],
+            "-vsync",
+            "-1",  # Necessary to match VFR
+            *timecode_args,
+            *affinity.get_output_thread_args(threads),
+            output_file,
+        ]
+
+    return [
         "ffmpeg",
         "-y",  # Never prompt!
         *proxy_settings["misc_args"],  # User global settings
+        *affinity.get_input_thread_args(threads),
+        *(["-ss", seek] if seek is not None else []),
         "-i",
         job["file_path"],
+        *(["-t", duration] if duration is not None else []),
+        "-map",
+        "0:v:0",
+        *get_audio_args(job, audio),
         "-c:v",
         proxy_settings["codec"],
         "-profile:v",
@@ -113,41 +344,420 @@ def encode_proxy(self, job):
         "-1",  # Necessary to match VFR
         "-vf",
         f"scale=-2:{v_res},{get_flip()} format={proxy_settings['pix_fmt']}",
-        "-c:a",
-        proxy_settings["audio_codec"],
-        "-ar",
-        proxy_settings["audio_samplerate"],
-        "-timecode",
-        job["start_tc"],
+        *timecode_args,
+        *affinity.get_output_thread_args(threads),
         output_file,
     ]
 
+
+def run_ffmpeg(
+    job: dict,
+    ffmpeg_command: list,
+    progress_callback=None,
+    log_name: str = None,
+    cancel_ids: list = None,
+    time_limit: float = None,
+    outputs: list = None,
+):
+    """Run an FFmpeg command for a job, logging to the configured logfile
+
+    FFmpeg is killed if its progress stalls for the worker's `stall_timeout`,
+    or if it runs past `time_limit`.
+
+    Args:
+        job: job with queuer data
+        ffmpeg_command: list of FFmpeg args, output file last
+        progress_callback: optional callable passed FFmpeg progress stats
+        log_name: logfile name without extension. Defaults to the output file name.
+        cancel_ids: task ids to watch. FFmpeg is killed if any are cancelled.
+        time_limit: optional seconds the encode may take, from `timelimits.get_time_limit`
+        outputs: every path the command writes, to clean up. Just the last arg if None.
+
+    Returns:
+        process: the finished `FfmpegProcess`
+
+    Raises:
+        cancel.Cancelled: if the job was cancelled. Its partial output is removed.
+        timelimits.EncodeTimedOut: if FFmpeg stalled or ran out of time. Likewise.
+    """
+
     print()  # Newline
     logger.debug(f"[magenta]Running! FFmpeg command:[/]\n{' '.join(ffmpeg_command)}\n")
 
     process = FfmpegProcess(
-        command=[*ffmpeg_command], ffmpeg_loglevel=proxy_settings["ffmpeg_loglevel"]
+        command=[*ffmpeg_command],
+        ffmpeg_loglevel=job["proxy_settings"]["ffmpeg_loglevel"],
     )
 
     # Make logs subfolder
-    encode_log_dir = path_settings["ffmpeg_logfile_path"]
+    encode_log_dir = job["paths_settings"]["ffmpeg_logfile_path"]
     os.makedirs(encode_log_dir, exist_ok=True)
 
-    encode_log_file = os.path.normpath(
-        os.path.join(
-            encode_log_dir, os.path.splitext(os.path.basename(output_file))[0] + ".txt"
-        )
-    )
+    if not log_name:
+        log_name = os.path.splitext(os.path.basename(ffmpeg_command[-1]))[0]
+
+    encode_log_file = os.path.normpath(os.path.join(encode_log_dir, log_name + ".txt"))
 
     logger.debug(f"[magenta]Encoder logfile path: {encode_log_file}[/]")
 
     # Run encode job
+    if time_limit:
+        logger.debug(f"[magenta]Time limit: {time_limit:.0f}s[/]")
+
     logger.info("[yellow]Encoding...[/]")
+    with cancel.watch(cancel_ids, process.terminate) as cancelled:
+        process.run(
+            logfile=encode_log_file,
+            progress_callback=progress_callback,
+            stall_timeout=settings["worker"]["stall_timeout"],
+            time_limit=time_limit,
+        )
+
+    if cancelled.is_set() or process.timed_out:
+        for x in outputs or [ffmpeg_command[-1]]:
+            cancel.remove_partial(x)
+
+    if cancelled.is_set():
+        raise cancel.Cancelled(f"Encode of '{job['file_name']}' was cancelled")
+
+    if process.timed_out:
+        raise timelimits.EncodeTimedOut(
+            f"Encode of '{job['file_name']}' {process.timed_out}"
+        )
+
+    return process
+
+
+def get_progress_callback(publish, frames_total: int, worker: str, segment=None):
+    """Get a progress callback that passes throttled encode progress to `publish`
+
+    Args:
+        publish: callable passed each progress meta dict
+        frames_total: frames this encode will output
+        worker: name of whoever is encoding, shown in progress views
+        segment: segment index, if encoding part of a job
+    """
+
+    last_progress_update = [0.0]
+
+    def publish_progress(stats):
+
+        now = time.monotonic()
+        if now - last_progress_update[0] < PROGRESS_UPDATE_INTERVAL:
+            return
+
+        last_progress_update[0] = now
+
+        meta = {
+            "frames_done": int(stats["frame"]),
+            "frames_total": frames_total,
+            "fps": stats["fps"],
+            "worker": worker,
+        }
+
+        if segment is not None:
+            meta.update({"segment": segment})
+
+        publish(meta)
+
+    return publish_progress
+
+
+def get_progress_publisher(task, frames_total: int, task_id=None, segment=None):
+    """Get a progress callback that publishes throttled encode progress as task state meta
+
+    Args:
+        task: the bound Celery task
+        frames_total: frames this task will encode
+        task_id: task id to publish progress under, if not the task's own
+        segment: segment index, if encoding part of a job
+    """
+
+    def publish(meta):
+        task.update_state(task_id=task_id, state="ENCODING", meta=meta)
 
+    return get_progress_callback(
+        publish, frames_total, task.request.hostname, segment=segment
+    )
+
+
+def encode_job(
+    job: dict, progress_callback=None, worker: str = None, cancel_ids: list = None
+) -> dict:
+    """Encode a job's proxy, start to finish. Shared by every way of running jobs.
+
+    Args:
+        job: job with its settings resolved
+        progress_callback: optional callable passed FFmpeg progress stats
+        worker: name of whoever is encoding, recorded in the result
+        cancel_ids: task ids to watch. The encode stops if any are cancelled.
+
+    If an identical source's proxy was already encoded with the same settings,
+    it's reused instead. An encode that stalls or runs past its time limit is
+    tried again, up to `timelimits.STALL_RETRIES` times. Audio already in the
+    proxy's codec and sample rate is copied, not encoded. Extra renditions are
+    encoded from the same decode. One that fails doesn't fail the proxy.
+    With a `scratch_dir`, everything's encoded locally then published to the
+    share atomically, so a half-written proxy never appears there.
+
+    Returns:
+        result: trimmed encode result, from `get_encode_result`, with the audio
+         plan and each rendition's output path, or None if it failed
+
+    Raises:
+        RuntimeError: if FFmpeg fails, or stalls on every try
+        cancel.Cancelled: if the job was cancelled
+    """
+
+    ensure_proxy_dir(job)
+    output_file = get_output_file(job)
+
+    logger.info(f"Input File: '{job['file_path']}'\n" f"Output File: '{output_file}'")
+
+    use_cache = proxycache.is_enabled(job["paths_settings"])
+
+    if use_cache:
+
+        hit = proxycache.reuse(job, output_file)
+        if hit:
+            result = get_encode_result(output_file, job["frames"], 0, worker=worker)
+            result.update({"cached": True})
+
+            if hit["renditions"]:
+                result.update({"renditions": hit["renditions"]})
+
+            return result
+
+    renditions = get_rendition_files(job, output_file)
+
+    with scratch.scratch_file(output_file, worker) as encode_file:
+
+        # Never rewrite a reused proxy shared with other projects.
+        # Publishing from scratch replaces it instead.
+        if encode_file == output_file:
+            proxycache.break_hardlink(output_file)
+            for _, path in renditions:
+                proxycache.break_hardlink(path)
+
+        encode_renditions = get_rendition_files(job, encode_file)
+        for _, path in [*renditions, *encode_renditions]:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        time_limit = timelimits.get_time_limit(job, worker)
+
+        audio = get_audio_plan(job)
+        logger.info(f"Audio: {format_audio_plan(audio)}")
+
+        for attempt in range(timelimits.STALL_RETRIES + 1):
+
+            started = time.monotonic()
+
+            try:
+                process = run_ffmpeg(
+                    job,
+                    get_ffmpeg_command(job, encode_file, audio=audio),
+                    progress_callback=progress_callback,
+                    cancel_ids=cancel_ids,
+                    time_limit=time_limit,
+                    outputs=[encode_file, *[path for _, path in encode_renditions]],
+                )
+                break
+
+            except timelimits.EncodeTimedOut as e:
+
+                if attempt == timelimits.STALL_RETRIES:
+                    raise
+
+                logger.warning(f"[yellow]{e}. Trying again...[/]")
+
+        if process.returncode != 0 or not os.path.exists(encode_file):
+            raise RuntimeError(f"Couldn't encode '{job['file_name']}'")
+
+        encode_seconds = time.monotonic() - started
+        timelimits.record_rate(worker, job, encode_seconds)
+
+        if encode_file != output_file:
+
+            try:
+                scratch.publish(encode_file, output_file)
+                for (_, source), (_, destination) in zip(encode_renditions, renditions):
+                    if os.path.exists(source):
+                        scratch.publish(source, destination)
+
+            except OSError as e:
+                raise RuntimeError(
+                    f"Couldn't publish '{job['file_name']}' from scratch: {e}"
+                )
+
+    result = get_encode_result(
+        output_file, job["frames"], encode_seconds, worker=worker
+    )
+    result.update({"audio": audio})
+
+    if renditions:
+
+        result.update(
+            {
+                "renditions": {
+                    x["name"]: path if os.path.exists(path) else None
+                    for x, path in renditions
+                }
+            }
+        )
+
+        for name, path in result["renditions"].items():
+            if path is None:
+                logger.warning(f"[yellow]Couldn't encode '{name}' rendition[/]")
+
+    if use_cache:
+        proxycache.store(job, output_file, result.get("renditions"))
+
+    return result
+
+
+def handle_output_locked(task, error):
+    """Handle a task finding its output path locked by another task.
+
+    With `acks_late`, a task can be redelivered after a worker crashes or loses
+    its connection, before the old delivery's lease has lapsed. Or while it's
+    still encoding. Either way, the copy is retried until the lease is free,
+    so the task still finishes if the old delivery never will.
+    A different task writing the same path is retried the same way.
+    """
+
+    if error.holder == task.request.id:
+        logger.warning(
+            "[yellow]This task's output is still leased by an earlier delivery. "
+            "Retrying when it's free.[/]"
+        )
+
+    else:
+        logger.warning(f"[yellow]{error}. Retrying when it's free.[/]")
+
+    raise task.retry(countdown=locks.LOCK_LEASE, max_retries=None)
+
+
+def handle_cancelled(task, job: dict, task_id: str = None):
+    """Stop a cancelled job, freeing the worker for other jobs straight away.
+
+    The job is marked revoked under its task id and the message is acked
+    without a result of its own, so a chord waiting on it never joins.
+
+    Args:
+        task: the bound Celery task
+        job: the cancelled job
+        task_id: the job's task id, if not the task's own
+    """
+
+    task_id = task_id if task_id else task.request.id
+    logger.warning(f"[yellow]Job {task_id} was cancelled[/]")
+
+    locks.release_job(job, task_id)
+    task.backend.mark_as_revoked(task_id, reason="cancelled")
+    raise Ignore()
+
+
+def get_encode_result(
+    output_file: str, frames: int, encode_seconds: float, worker: str = None
+) -> dict:
+    """Get the trimmed result stored for an encode: output path and metrics only"""
+
+    return {
+        "output_file": output_file,
+        "frames": int(frames),
+        "encode_seconds": round(encode_seconds, 2),
+        "fps": round(int(frames) / encode_seconds, 2) if encode_seconds else None,
+        "worker": worker,
+    }
+
+
+def ensure_proxy_dir(job: dict):
+    """Create the job's proxy dir if it doesn't exist"""
+
+    # TODO: Integrate cross-platform path mapping. Move `check_wsl` func.
+    # Convert paths for WSL
+    if check_wsl():
+        job["proxy_dir"].update(get_wsl_path(job["proxy_dir"]))
+
+    logger.debug(f"Output Dir: '{job['proxy_dir']}'")
     try:
-        process.run(logfile=encode_log_file)
 
-    except Exception as e:
-        logger.exception(f"[red] :warning: Couldn't encode proxy.[/]\n{e}")
+        os.makedirs(
+            job["proxy_dir"],
+            exist_ok=True,
+        )
+
+    except OSError as e:
+        logger.error(f"Error creating proxy directory: {e}")
+        raise e
+
+
+@app.task(
+    bind=True,
+    acks_late=True,
+    track_started=True,
+    prefetch_limit=1,
+    queue=get_queue(),
+)
+def encode_proxy(self, job):
+
+    """
+    Celery task to encode proxy media using parameters in job argument
+    and user-defined settings
+    """
+
+    print("\n")
+    console.rule(f"[green]Received proxy encode job :clapper:[/]", align="left")
+    print("\n")
+
+    # Kept if the task's retried, so duplicates still attach to it
+    release = True
+
+    try:
+
+        # Settings are published once by the queuer, not sent with every task
+        registry.resolve_job(job)
+
+        logger.info(f"[magenta bold]Job: [/]{self.request.id}")
+
+        output_file = get_output_file(job)
+
+        # Get Resolutions
+        source_res = [int(x) for x in job["resolution"]]
+        logger.info(f"Source Resolution: {source_res}")
+
+        # Log Timecode
+        logger.info(f"Starting Timecode: {job['start_tc']}")
+
+        cancel.check([self.request.id])
+
+        with locks.output_lock(output_file, self.request.id), iolimits.storage_slots(
+            job, self.request.id
+        ):
+
+            result = encode_job(
+                job,
+                progress_callback=get_progress_publisher(self, job["frames"]),
+                worker=self.request.hostname,
+                cancel_ids=[self.request.id],
+            )
+
+    except locks.OutputLocked as e:
+        release = False
+        handle_output_locked(self, e)
+
+    except cancel.Cancelled:
+        handle_cancelled(self, job)
+
+    except RuntimeError as e:
+        logger.error(f"[red] :warning: Couldn't encode proxy.[/]\n{e}")
+        raise
+
+    finally:
+
+        # Let later duplicates, a retry or another queuer claim it,
+        # however the task ended
+        if release:
+            locks.release_job(job, self.request.id)
 
-    return f"{job['file_name']} encoded successfully"
+    return result
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3.6
+
+import logging
+import math
+import os
+import shutil
+import subprocess
+import time
+
+from celery import chord, uuid
+from celery.exceptions import Ignore, Retry
+from rich import print
+from rich.console import Console
+
+from ....app.utils import core
+from ....settings.manager import SettingsManager
+from ....worker.celery import app
+from ....worker.ffmpeg.utils import get_keyframe_before, get_start_time
+from ....worker import (
+    cancel,
+    iolimits,
+    locks,
+    proxycache,
+    registry,
+    scratch,
+    timelimits,
+)
+from ....worker.tasks.encode.tasks import (
+    ensure_proxy_dir,
+    get_encode_result,
+    get_ffmpeg_command,
+    get_output_file,
+    get_progress_publisher,
+    get_rendition_files,
+    handle_cancelled,
+    handle_output_locked,
+    run_ffmpeg,
+)
+from ....worker.utils import get_queue
+
+settings = SettingsManager()
+console = Console()
+
+core.install_rich_tracebacks()
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["worker"]["loglevel"])
+
+# Hidden folder in the proxy dir to collect segments before joining
+SEGMENT_DIR_NAME = ".rprox_segments"
+
+
+def get_segment_dir(job: dict) -> str:
+    """Get the shared folder a job's segments are written to"""
+
+    return os.path.join(
+        job["proxy_dir"], SEGMENT_DIR_NAME, os.path.splitext(job["file_name"])[0]
+    )
+
+
+def get_segmented_signature(job: dict, task_id: str = None, queue: str = None):
+    """Get a chord that encodes a long job in parallel segments, then joins them.
+
+    Segment boundaries are nominal here, every `segment_duration` seconds.
+    Each segment task snaps its own start and end back to the nearest keyframe,
+    so neighbouring segments always agree without the queuer needing FFprobe.
+
+    Args:
+        job: job with queuer data and `segment_duration` set
+        task_id: optional task id for the joined result. Generated if None.
+        queue: optional queue for the segments and the join. The task default if None.
+
+    Returns:
+        signature: chord whose result is stored under `task_id`
+    """
+
+    task_id = task_id if task_id else uuid()
+    duration = int(job["frames"]) / float(job["fps"])
+    segment_duration = float(job["segment_duration"])
+    segment_count = max(1, math.ceil(duration / segment_duration))
+
+    header = []
+    for i in range(segment_count):
+
+        start = i * segment_duration
+        end = (i + 1) * segment_duration if i < segment_count - 1 else None
+
+        segment = encode_segment.s(job, i, start, end, task_id)
+        header.append(segment.set(queue=queue) if queue else segment)
+
+    logger.debug(
+        f"[magenta]Splitting '{job['file_name']}' into {segment_count} segments[/]"
+    )
+
+    body = concat_segments.s(job).set(task_id=task_id)
+    return chord(header, body.set(queue=queue) if queue else body)
+
+
+@app.task(
+    bind=True,
+    acks_late=True,
+    track_started=True,
+    prefetch_limit=1,
+    autoretry_for=(RuntimeError,),
+    max_retries=3,
+    retry_backoff=True,
+    queue=get_queue(),
+)
+def encode_segment(self, job, index, start, end, parent_id):
+    """
+    Celery task to encode one time range of a long source.
+
+    Start and end are snapped back to the nearest keyframe so
+    input seeking is exact and segments join without gaps or overlap.
+    Progress is published under the joined job's task id.
+    A segment that stalls or runs out of time is retried.
+    """
+
+    print("\n")
+    console.rule(
+        f"[green]Received segment {index} of proxy encode job :scissors:[/]",
+        align="left",
+    )
+    print("\n")
+
+    registry.resolve_job(job)
+
+    # Cancelling a job cancels its task id, which is the join's, not each segment's
+    cancel_ids = [self.request.id, parent_id]
+
+    if cancel.is_cancelled(cancel_ids):
+        logger.warning(f"[yellow]Job {parent_id} was cancelled. Skipping segment.[/]")
+        raise Ignore()
+
+    # Probed once for both boundaries, which count from the video's first timestamp
+    start_time = get_start_time(job["file_path"]) if index or end is not None else 0.0
+
+    seek = get_keyframe_before(job["file_path"], start, start_time) if index else 0.0
+    stop = (
+        get_keyframe_before(job["file_path"], end, start_time)
+        if end is not None
+        else None
+    )
+
+    logger.info(
+        f"[magenta bold]Job: [/]{parent_id}\n"
+        f"Input File: '{job['file_path']}'\n"
+        f"Segment: {index}, {seek:.3f}s to {'end' if stop is None else f'{stop:.3f}s'}"
+    )
+
+    # Keyframes further apart than segments can leave nothing to encode
+    if stop is not None and stop <= seek:
+        logger.warning(f"[yellow]Segment {index} is empty after keyframe alignment[/]")
+        return None
+
+    ensure_proxy_dir(job)
+    segment_dir = get_segment_dir(job)
+    os.makedirs(segment_dir, exist_ok=True)
+
+    segment_file = os.path.join(
+        segment_dir, f"seg_{index:04d}{job['proxy_settings']['ext']}"
+    )
+
+    # Truncate to microseconds so the last frame is never duplicated
+    duration = None
+    if stop is not None:
+        duration = f"{math.floor((stop - seek) * 1_000_000) / 1_000_000:.6f}"
+        frames = round((stop - seek) * float(job["fps"]))
+    else:
+        frames = max(0, int(job["frames"]) - round(seek * float(job["fps"])))
+
+    # Each rendition's segments go in a subfolder of the segment dir
+    renditions = get_rendition_files(job, segment_file)
+
+    started = time.monotonic()
+
+    try:
+
+        with locks.output_lock(segment_file, self.request.id), iolimits.storage_slots(
+            job, self.request.id, cancel_ids=cancel_ids
+        ):
+
+            with scratch.scratch_file(
+                segment_file, self.request.hostname
+            ) as encode_file:
+
+                encode_renditions = get_rendition_files(job, encode_file)
+                for _, path in [*renditions, *encode_renditions]:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+                process = run_ffmpeg(
+                    job,
+                    get_ffmpeg_command(
+                        job,
+                        encode_file,
+                        seek=f"{seek:.6f}",
+                        duration=duration,
+                        frames=frames,
+                    ),
+                    progress_callback=get_progress_publisher(
+                        self, frames, task_id=parent_id, segment=index
+                    ),
+                    log_name=f"{os.path.splitext(job['file_name'])[0]}_seg_{index:04d}",
+                    cancel_ids=cancel_ids,
+                    time_limit=timelimits.get_time_limit(
+                        job, self.request.hostname, frames=frames
+                    ),
+                    outputs=[encode_file, *[path for _, path in encode_renditions]],
+                )
+
+                if encode_file != segment_file and os.path.exists(encode_file):
+
+                    scratch.publish(encode_file, segment_file)
+                    for (_, source), (_, destination) in zip(
+                        encode_renditions, renditions
+                    ):
+                        if os.path.exists(source):
+                            scratch.publish(source, destination)
+
+    except locks.OutputLocked as e:
+        handle_output_locked(self, e)
+
+    except cancel.Cancelled:
+
+        # Finished segments are no use without the rest
+        shutil.rmtree(segment_dir, ignore_errors=True)
+        handle_cancelled(self, job, task_id=parent_id)
+
+    except OSError as e:
+        raise RuntimeError(f"Couldn't publish segment {index} from scratch: {e}")
+
+    if process.returncode != 0 or not os.path.exists(segment_file):
+        raise RuntimeError(f"Couldn't encode segment {index} of '{job['file_name']}'")
+
+    encode_seconds = time.monotonic() - started
+    timelimits.record_rate(self.request.hostname, job, encode_seconds, frames=frames)
+
+    return {
+        "segment_file": segment_file,
+        "encode_seconds": encode_seconds,
+        "renditions": {
+            x["name"]: path if os.path.exists(path) else None for x, path in renditions
+        },
+    }
+
+
+@app.task(
+    bind=True,
+    acks_late=True,
+    track_started=True,
+    prefetch_limit=1,
+    queue=get_queue(),
+)
+def concat_segments(self, segments, job):
+    """
+    Celery task to losslessly join encoded segments into the job's proxy.
+
+    Writes the same output path `encode_proxy` would have, with the source start timecode.
+    """
+
+    # Kept if the task's retried, so duplicates still attach to it
+    release = True
+
+    try:
+        return join_segments(self, segments, job)
+
+    except Retry:
+        release = False
+        raise
+
+    finally:
+
+        # Let later duplicates, a retry or another queuer claim it,
+        # however the task ended
+        if release:
+            locks.release_job(job, self.request.id)
+
+
+def join_segments(task, segments: list, job: dict) -> dict:
+    """Join a job's encoded segments, for `concat_segments`"""
+
+    registry.resolve_job(job)
+
+    output_file = get_output_file(job)
+    segment_dir = get_segment_dir(job)
+    segments = [x for x in segments if x]
+
+    if cancel.is_cancelled([task.request.id]):
+        shutil.rmtree(segment_dir, ignore_errors=True)
+        handle_cancelled(task, job)
+
+    segment_files = [x["segment_file"] for x in segments]
+
+    logger.info(
+        f"[magenta bold]Job: [/]{task.request.id}\n"
+        f"Joining {len(segment_files)} segments into '{output_file}'"
+    )
+
+    concat_list = write_concat_list(segment_files, segment_dir)
+
+    def get_concat_command(concat_file):
+        return [
+            "ffmpeg",
+            "-y",
+            "-hide_banner",
+            "-loglevel",
+            job["proxy_settings"]["ffmpeg_loglevel"],
+            "-f",
+            "concat",
+            "-safe",
+            "0",
+            "-i",
+            concat_list,
+            "-c",
+            "copy",
+            "-timecode",
+            job["start_tc"],
+            concat_file,
+        ]
+
+    try:
+
+        # Joining only touches proxy storage
+        with locks.output_lock(output_file, task.request.id), iolimits.storage_slots(
+            job, task.request.id, read=False
+        ), scratch.scratch_file(output_file, task.request.hostname) as concat_file:
+
+            ffmpeg_command = get_concat_command(concat_file)
+            logger.debug(
+                f"[magenta]Running! FFmpeg command:[/]\n{' '.join(ffmpeg_command)}\n"
+            )
+
+            if concat_file == output_file:
+                proxycache.break_hardlink(output_file)
+
+            result = subprocess.run(ffmpeg_command, stderr=subprocess.PIPE)
+
+            renditions = dict()
+            if result.returncode == 0:
+                renditions = join_renditions(job, segments, concat_file)
+
+            if result.returncode == 0 and concat_file != output_file:
+
+                scratch.publish(concat_file, output_file)
+
+                for x, path in get_rendition_files(job, output_file):
+                    if renditions.get(x["name"]):
+                        scratch.publish(renditions[x["name"]], path)
+                        renditions.update({x["name"]: path})
+
+    except locks.OutputLocked as e:
+        handle_output_locked(task, e)
+
+    except OSError as e:
+        raise RuntimeError(f"Couldn't publish '{job['file_name']}' from scratch: {e}")
+
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"Couldn't join segments of '{job['file_name']}'\n"
+            + result.stderr.decode(errors="replace")
+        )
+
+    shutil.rmtree(segment_dir, ignore_errors=True)
+    logger.info("[green]Finished joining segments[/]")
+
+    # Worker time across all segments
+    result = get_encode_result(
+        output_file,
+        job["frames"],
+        sum(x["encode_seconds"] for x in segments),
+        worker=task.request.hostname,
+    )
+
+    if renditions:
+        result.update({"renditions": renditions})
+
+    if proxycache.is_enabled(job["paths_settings"]):
+        proxycache.store(job, output_file, renditions)
+
+    return result
+
+
+def write_concat_list(files: list, directory: str) -> str:
+    """Write an FFmpeg concat demuxer list of files, returning its path"""
+
+    concat_list = os.path.join(directory, "concat.txt")
+
+    with open(concat_list, "w") as file:
+        for x in files:
+            escaped = x.replace("'", "'\\''")
+            file.write(f"file '{escaped}'\n")
+
+    return concat_list
+
+
+def join_renditions(job: dict, segments: list, output_file: str) -> dict:
+    """Join each extra rendition's segments beside the joined proxy.
+
+    Video renditions are concatenated like the proxy.
+    Thumbnail strips are stacked side by side into one.
+    A rendition missing from any segment is left out, with a warning.
+
+    Args:
+        job: job with its settings resolved
+        segments: results of the job's non-empty segments, in order
+        output_file: path of the joined proxy
+
+    Returns:
+        renditions: each rendition's joined path, or None if it couldn't be joined
+    """
+
+    joined = dict()
+
+    for rendition, path in get_rendition_files(job, output_file):
+
+        name = rendition["name"]
+        parts = [(x.get("renditions") or {}).get(name) for x in segments]
+
+        if not parts or not all(x and os.path.exists(x) for x in parts):
+            logger.warning(
+                f"[yellow]'{name}' rendition is missing from some segments. "
+                "Leaving it out.[/]"
+            )
+            joined.update({name: None})
+            continue
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        command = [
+            "ffmpeg",
+            "-y",
+            "-hide_banner",
+            "-loglevel",
+            job["proxy_settings"]["ffmpeg_loglevel"],
+        ]
+
+        if rendition.get("type") == "thumbnails":
+
+            for x in parts:
+                command += ["-i", x]
+
+            if len(parts) > 1:
+                command += ["-filter_complex", f"hstack=inputs={len(parts)}"]
+
+            command += ["-frames:v", "1", "-q:v", "3", path]
+
+        else:
+
+            concat_list = write_concat_list(parts, os.path.dirname(parts[0]))
+            command += [
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                concat_list,
+                "-c",
+                "copy",
+                path,
+            ]
+
+        result = subprocess.run(command, stderr=subprocess.PIPE)
+
+        if result.returncode != 0 or not os.path.exists(path):
+            logger.warning(
+                f"[yellow]Couldn't join '{name}' rendition[/]\n"
+                + result.stderr.decode(errors="replace")
+            )
+            joined.update({name: None})
+            continue
+
+        joined.update({name: path})
+
+    return joined
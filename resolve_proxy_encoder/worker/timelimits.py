@@ -0,0 +1,123 @@
+import logging
+from typing import Union
+
+from redis.exceptions import RedisError
+
+from ..app.utils import core
+from ..settings.manager import SettingsManager
+from . import capabilities
+from .utils import get_redis, get_resolution
+
+core.install_rich_tracebacks()
+
+settings = SettingsManager()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(settings["worker"]["loglevel"])
+
+# Each worker's measured encode rate, in source megapixel-frames per second
+RATE_KEY = "rprox:rate:{}"
+RATE_TTL = 30 * 24 * 60 * 60
+
+# Weight of the latest encode in a worker's measured rate
+RATE_SMOOTHING = 0.2
+
+# Encodes shorter than this say more about startup than encode speed
+MIN_RATE_SECONDS = 5
+
+# Rate assumed before a worker has measured one: 1080p at 10 fps.
+# Deliberately slow, so first limits are generous.
+DEFAULT_RATE = 10 * 1920 * 1080 / 1e6
+
+# Seconds allowed on top of the expected encode time, for startup and seeking
+TIME_LIMIT_MARGIN = 120
+
+# Times an encode that stalls or runs out of time is tried again
+STALL_RETRIES = 2
+
+
+class EncodeTimedOut(RuntimeError):
+    """FFmpeg stopped making progress, or ran past its time limit, and was killed"""
+
+
+def get_work(job: dict, frames: Union[int, None] = None) -> float:
+    """Get the work in an encode: frames x source megapixels
+
+    Args:
+        job: job with its source `resolution` and `frames`
+        frames: frames actually encoded, if only part of the job
+    """
+
+    width, height = get_resolution(job)
+    frames = int(job["frames"]) if frames is None else int(frames)
+    return frames * width * height / 1e6
+
+
+def get_rate(worker: str) -> float:
+    """Get a worker's encode rate in source megapixel-frames per second.
+
+    Measured from its recent encodes, or from its capability probe's
+    1080p speed test if it hasn't finished any yet.
+    """
+
+    r = get_redis()
+    if r is not None:
+
+        try:
+            rate = r.get(RATE_KEY.format(worker))
+            if rate:
+                return float(rate)
+
+        except RedisError as e:
+            logger.debug(f"[magenta]Couldn't get measured encode rate[/]\n{e}")
+
+    probed = capabilities.get_cached_probe() or {}
+    if probed.get("encode_fps"):
+        return probed["encode_fps"] * 1920 * 1080 / 1e6
+
+    return DEFAULT_RATE
+
+
+def record_rate(
+    worker: str, job: dict, encode_seconds: float, frames: Union[int, None] = None
+):
+    """Fold a finished encode into the worker's measured rate"""
+
+    r = get_redis()
+    if r is None or not worker or encode_seconds < MIN_RATE_SECONDS:
+        return
+
+    rate = get_work(job, frames) / encode_seconds
+
+    try:
+
+        previous = r.get(RATE_KEY.format(worker))
+        if previous:
+            rate = RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * float(previous)
+
+        r.set(RATE_KEY.format(worker), round(rate, 3), ex=RATE_TTL)
+
+    except RedisError as e:
+        logger.debug(f"[magenta]Couldn't record measured encode rate[/]\n{e}")
+
+
+def get_time_limit(
+    job: dict, worker: str, frames: Union[int, None] = None
+) -> Union[float, None]:
+    """Get the seconds an encode may run before it's killed and tried again.
+
+    That's `time_limit_factor` times the time the worker's measured rate says
+    it should take, plus a margin. None if time limits are disabled.
+
+    Args:
+        job: job with its source `resolution` and `frames`
+        worker: name of the worker encoding it
+        frames: frames actually encoded, if only part of the job
+    """
+
+    factor = settings["worker"]["time_limit_factor"]
+    if not factor:
+        return None
+
+    expected = get_work(job, frames) / get_rate(worker)
+    return round(expected * factor + TIME_LIMIT_MARGIN)
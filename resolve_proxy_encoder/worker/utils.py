@@ -1,8 +1,11 @@
 import logging
 import platform
 import subprocess
+from functools import lru_cache
 from pathlib import Path
 
+import redis
+
 from ..app.utils import core, pkg_info
 from ..settings.manager import SettingsManager
 
@@ -13,6 +16,19 @@ settings = SettingsManager()
 logger = logging.getLogger(__name__)
 logger.setLevel(settings["worker"]["loglevel"])
 
+# Queue lane for jobs under the short job threshold
+SHORT_LANE = "short"
+
+# Queue lanes for jobs only capable workers should take, least demanding first.
+# Anything less demanding stays in the main queue, which every worker takes from.
+CAPABILITY_LANES = ["uhd", "8k"]
+
+# Queues workers have registered beyond the fixed lanes, like local-access lanes
+LANES_KEY = "rprox:lanes"
+
+# Source resolution assumed when a job's can't be read
+DEFAULT_RESOLUTION = (1920, 1080)
+
 
 def check_wsl() -> bool:
     """Return True if Python is running in WSL"""
@@ -40,12 +56,15 @@ def get_wsl_path(windows_path: str):
     return wsl_path
 
 
-def get_queue():
+def get_queue(lane: str = None):
 
     """Get Celery queue name (routing key) from package git commit short SHA
 
     Allows constraining tasks and workers to exact same version and prevent breaking changes.
 
+    Args:
+        lane: optional lane suffix, e.g. 'short'. Lanes share the version constraint.
+
     """
 
     if settings["app"]["disable_version_constrain"]:
@@ -55,8 +74,71 @@ def get_queue():
             "You [bold]must[/] ensure routing and version compatibility yourself!"
         )
 
-        return "celery"
+        queue = "celery"
+
+    else:
+
+        vc_key_file = Path(__file__).parent.parent.parent.joinpath(
+            "version_constraint_key"
+        )
+        with open(vc_key_file) as file:
+            queue = file.read()
+
+    return f"{queue}.{lane}" if lane else queue
+
+
+def get_all_queues() -> list:
+    """Get every queue this version's jobs can wait in.
+
+    That's the main, short and capability lanes,
+    plus any other lanes workers have registered.
+    """
+
+    queues = [get_queue(), get_queue(SHORT_LANE)]
+    queues += [get_queue(x) for x in CAPABILITY_LANES]
+
+    r = get_redis()
+    if r is None:
+        return queues
+
+    prefix = get_queue() + "."
+    registered = sorted(x.decode("utf-8") for x in r.smembers(LANES_KEY))
+    return queues + [x for x in registered if x.startswith(prefix) and x not in queues]
+
+
+def get_resolution(job: dict) -> tuple:
+    """Get a job's source width and height, or `DEFAULT_RESOLUTION` if it's missing or unreadable"""
+
+    try:
+        width, height = [int(x) for x in job["resolution"]]
+    except (KeyError, TypeError, ValueError):
+        return DEFAULT_RESOLUTION
+
+    return width, height
+
+
+def get_version_constraint_key(queue_name: str) -> str:
+    """Strip any lane suffix from a queue name, leaving the version constraint key"""
+
+    return queue_name.split(".")[0]
+
+
+@lru_cache(maxsize=None)
+def get_redis():
+    """Get a Redis client for the broker or result backend, whichever is Redis.
+
+    Used for shared state between queuers and workers, like locks.
+
+    Returns:
+        client: `redis.Redis` client, or None if neither is Redis
+    """
+
+    for url in [settings["celery"]["broker_url"], settings["celery"]["result_backend"]]:
+        if str(url).startswith(("redis://", "rediss://")):
+            return redis.Redis.from_url(url)
 
-    vc_key_file = Path(__file__).parent.parent.parent.joinpath("version_constraint_key")
-    with open(vc_key_file) as file:
-        return file.read()
+    logger.warning(
+        "[yellow]Neither broker nor result backend is Redis.\n"
+        "Job deduplication and output locking are disabled![/]"
+    )
+    return None
@@ -0,0 +1,70 @@
+import json
+import subprocess
+
+import pytest
+
+from resolve_proxy_encoder.worker.ffmpeg import utils
+
+
+@pytest.fixture
+def ffprobe(monkeypatch):
+    """Fake ffprobe for a video starting at `start_time`, keyframes every 2s of video"""
+
+    calls = []
+
+    def run(cmd, **kwargs):
+
+        calls.append(cmd)
+
+        if "stream=start_time" in cmd:
+            output = {"streams": [{"start_time": str(run.start_time)}]}
+
+        else:
+            interval = cmd[cmd.index("-read_intervals") + 1]
+            seek = float(interval.split("%")[0])
+
+            # Demuxers land on the keyframe before the seek point, then read on.
+            # Seeking before the first timestamp reads from the start.
+            first = run.start_time + max(0.0, seek - run.start_time) // 2 * 2
+            output = {
+                "packets": [
+                    {
+                        "pts_time": f"{first + i * 0.5:.6f}",
+                        "flags": "K_" if i % 4 == 0 else "__",
+                    }
+                    for i in range(8)
+                ]
+            }
+
+        return subprocess.CompletedProcess(cmd, 0, stdout=json.dumps(output).encode())
+
+    run.start_time = 0.0
+    run.calls = calls
+    monkeypatch.setattr(utils.subprocess, "run", run)
+    return run
+
+
+def test_keyframe_before_zero_start(ffprobe):
+
+    assert utils.get_keyframe_before("clip.mov", 5.0) == pytest.approx(4.0)
+    assert utils.get_keyframe_before("clip.mov", 6.0) == pytest.approx(6.0)
+
+
+def test_keyframe_before_nonzero_start(ffprobe):
+    """Boundaries count from the start of the video, not from timestamp 0"""
+
+    ffprobe.start_time = 3600.0
+
+    assert utils.get_keyframe_before("clip.mxf", 5.0) == pytest.approx(4.0)
+    assert utils.get_keyframe_before("clip.mxf", 6.0) == pytest.approx(6.0)
+
+    read_interval = ffprobe.calls[-1][ffprobe.calls[-1].index("-read_intervals") + 1]
+    assert read_interval.startswith("3606.0%")
+
+
+def test_given_start_time_skips_probe(ffprobe):
+
+    ffprobe.start_time = 10.0
+
+    assert utils.get_keyframe_before("clip.mov", 5.0, 10.0) == pytest.approx(4.0)
+    assert not any("stream=start_time" in x for x in ffprobe.calls)
@@ -0,0 +1,58 @@
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from resolve_proxy_encoder.worker import locks
+
+
+@pytest.fixture
+def redis(monkeypatch):
+
+    r = fakeredis.FakeStrictRedis()
+    monkeypatch.setattr(locks, "get_redis", lambda: r)
+    return r
+
+
+@pytest.fixture
+def job(tmp_path):
+
+    source = tmp_path / "A001.mov"
+    source.write_bytes(b"source")
+
+    return {"file_path": str(source), "settings_hash": "abc123"}
+
+
+def test_stale_success_key_is_taken_over(redis, job):
+    """A key left behind by a finished task doesn't attach new queues to it"""
+
+    key = locks.get_idempotency_key(job)
+    redis.set(key, "old-task")
+    redis.set(locks.QUEUED_KEY.format("old-task"), key)
+
+    existing = locks.claim_job(job, "new-task", lambda x: "SUCCESS")
+
+    assert existing is None
+    assert redis.get(key) == b"new-task"
+
+
+@pytest.mark.parametrize("state", ["SUCCESS", "FAILURE", "REVOKED"])
+def test_finished_tasks_are_not_in_flight(redis, state):
+
+    redis.set(locks.QUEUED_KEY.format("task"), "key")
+    assert not locks.is_in_flight("task", lambda x: state)
+
+
+def test_running_task_is_attached_to(redis, job):
+
+    key = locks.get_idempotency_key(job)
+    redis.set(key, "running-task")
+
+    assert locks.claim_job(job, "new-task", lambda x: "STARTED") == "running-task"
+
+
+def test_pending_task_needs_queued_marker(redis, job):
+
+    key = locks.get_idempotency_key(job)
+    redis.set(key, "lost-task")
+
+    assert locks.claim_job(job, "new-task", lambda x: "PENDING") is None